@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Benchmark the storage backends against each other
+
+Runs the same sequence of store operations on a fresh data directory for
+each backend and prints the time taken by each step:
+
+    python benchmark.py --tasks 100000 --ops 200
+
+With --memory it instead compares the memory held by tasks kept as dicts
+and as slotted Task objects, and the time to scan them:
+
+    python benchmark.py --memory --tasks 1000000
+"""
+
+import random
+import argparse
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List
+from tabulate import tabulate
+from data import Task
+from task_tracker import BACKENDS, open_store
+
+def make_tasks(count: int) -> List[Dict[str, str]]:
+    """Generate open tasks with sequential IDs."""
+    return [
+        {'id': f"{i:08x}", 'title': f"Task {i}", 'state': 'O', 'note': f"[2024-01-01 09:00] note {i}"}
+        for i in range(count)
+    ]
+
+def timed(func: Callable[[], object]) -> float:
+    """Run a function and return the elapsed wall time in milliseconds."""
+    start = time.perf_counter()
+    func()
+    return (time.perf_counter() - start) * 1000
+
+def run_backend(backend: str, task_count: int, op_count: int, data_dir: Path) -> Dict[str, float]:
+    """Run every benchmark step against one backend and return the timings."""
+    store = open_store(backend, data_dir)
+    tasks = make_tasks(task_count)
+    sample = [task['id'] for task in random.sample(tasks, min(op_count, task_count))]
+
+    timings = {}
+    try:
+        timings['put_many'] = timed(lambda: store.put_many(tasks))
+        timings['get'] = timed(lambda: [store.get(task_id) for task_id in sample])
+        timings['update'] = timed(lambda: [store.update(task_id, {'title': 'Renamed'}) for task_id in sample])
+        timings['append_note'] = timed(lambda: [store.append_note(task_id, "2024-01-02 10:00", "more") for task_id in sample])
+        timings['move_state'] = timed(lambda: [store.move_state(task_id, 'X') for task_id in sample])
+        timings['iterate'] = timed(lambda: [sum(1 for _ in store.iterate(state)) for state in ['O', 'X']])
+        timings['delete_many'] = timed(lambda: store.delete_many(sample))
+        timings['compact'] = timed(store.compact)
+    finally:
+        store.close()
+    return timings
+
+def task_memory(task_count: int) -> List[List[str]]:
+    """Compare the memory and scan time of tasks held as dicts and as Task objects."""
+    tracemalloc.start()
+    tasks = make_tasks(task_count)
+    dict_bytes = tracemalloc.get_traced_memory()[0]
+    # Bound as a default, so that tasks stays a plain local that can be deleted below
+    dict_scan = timed(lambda tasks=tasks: sum(1 for task in tasks if task['title'].endswith('7')))
+
+    # The field values are shared, so dropping the dicts leaves values and Task objects
+    compact = [Task.from_dict(task) for task in tasks]
+    del tasks
+    slot_bytes = tracemalloc.get_traced_memory()[0]
+    slot_scan = timed(lambda: sum(1 for task in compact if task.title.endswith('7')))
+    tracemalloc.stop()
+
+    return [
+        ['dict', f"{dict_bytes / task_count:.0f}", f"{dict_bytes / 2**20:.1f}", f"{dict_scan:.1f}"],
+        ['Task', f"{slot_bytes / task_count:.0f}", f"{slot_bytes / 2**20:.1f}", f"{slot_scan:.1f}"],
+    ]
+
+def main() -> None:
+    """Benchmark entry point."""
+    parser = argparse.ArgumentParser(description="Benchmark task storage backends")
+    parser.add_argument("--tasks", type=int, default=10000, help="Number of tasks to load")
+    parser.add_argument("--ops", type=int, default=100, help="Number of point operations per step")
+    parser.add_argument("--backend", action="append", choices=sorted(BACKENDS),
+                        help="Backend to benchmark (repeatable, default: all)")
+    parser.add_argument("--memory", action="store_true",
+                        help="Compare the memory used by tasks as dicts and as Task objects instead")
+    args = parser.parse_args()
+
+    if args.memory:
+        print(f"{args.tasks} tasks in memory, including their field values")
+        print(tabulate(task_memory(args.tasks), headers=['form', 'bytes/task', 'MB', 'scan (ms)'],
+                       tablefmt='grid'))
+        return
+
+    backends = args.backend or sorted(BACKENDS)
+    results = {}
+    for backend in backends:
+        with tempfile.TemporaryDirectory() as data_dir:
+            results[backend] = run_backend(backend, args.tasks, args.ops, Path(data_dir))
+
+    steps = list(results[backends[0]])
+    table_data = [[step] + [f"{results[b][step]:.1f}" for b in backends] for step in steps]
+    print(f"{args.tasks} tasks, {args.ops} operations per step (ms)")
+    print(tabulate(table_data, headers=['step'] + backends, tablefmt='grid'))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Bloom filter of the completed task IDs
+
+`completed.bloom` holds a Bloom filter of the IDs of every task in the
+completed segments (see segments.py). A lookup that misses the filter is
+certain not to be in any segment, so commands given the ID of an active task
+or a typo skip the completed files instead of opening the index of every
+segment.
+
+    header: magic, digest of the segment files, number of bits, number of hashes, IDs added, capacity
+    bits:   the filter, bit i in byte i // 8
+
+Like the ID index, the filter records the segment files it was built from
+(their names, sizes and mtimes) and is ignored once any of them changed;
+lookups then read the segments as before. Compactions add the IDs of the
+segments they rewrite, and rebuild the filter from the ID indexes when it was
+out of date or has grown past its capacity. IDs of tasks removed from the
+segments stay in the filter until it is rebuilt, which only costs a lookup.
+"""
+
+import mmap
+import struct
+import hashlib
+from pathlib import Path
+from typing import Iterable, List, Optional, Union
+from fileio import atomic_write
+
+BLOOM_FILE_NAME = 'completed.bloom'
+
+BLOOM_MAGIC = b'TTBLM1\n\0'
+# magic, digest of the segment files, number of bits, number of hashes, IDs added, capacity
+BLOOM_HEADER = struct.Struct('>8s16sQIQQ')
+
+# 10 bits and 7 hashes per ID give about 1% false positives at capacity
+BITS_PER_ID = 10
+HASH_COUNT = 7
+
+# A filter is built for this many times the IDs it starts with, so that
+# compactions can add to it for a while before it is rebuilt
+GROWTH_FACTOR = 2
+MIN_CAPACITY = 1024
+
+def segments_digest(file_paths: Iterable[Path]) -> Optional[bytes]:
+    """Return a digest of the names, sizes and mtimes of the segment files, or None if one is missing."""
+    digest = hashlib.blake2b(digest_size=16)
+    for file_path in file_paths:
+        try:
+            stat = file_path.stat()
+        except FileNotFoundError:
+            return None
+        digest.update(f"{file_path.name}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode('utf-8'))
+    return digest.digest()
+
+def bit_positions(task_id: str, bit_count: int) -> List[int]:
+    """Return the bits of a task ID, by double hashing one 128-bit digest."""
+    first, second = struct.unpack('>QQ', hashlib.blake2b(task_id.encode('utf-8'), digest_size=16).digest())
+    # An odd step visits HASH_COUNT distinct bits unless the bit count is tiny
+    second |= 1
+    return [(first + number * second) % bit_count for number in range(HASH_COUNT)]
+
+class BloomFilter:
+    """A Bloom filter over task IDs, in memory or memory-mapped from its file."""
+
+    def __init__(self, capacity: int, bits: Optional[Union[bytearray, mmap.mmap]] = None,
+                 bit_count: Optional[int] = None, count: int = 0):
+        self.capacity = max(capacity, MIN_CAPACITY)
+        self.bit_count = bit_count or self.capacity * BITS_PER_ID
+        self.bits = bits if bits is not None else bytearray((self.bit_count + 7) // 8)
+        self.count = count
+        self._map = None
+
+    @classmethod
+    def for_ids(cls, count: int) -> 'BloomFilter':
+        """Return an empty filter with room for `count` IDs and for more to be added later."""
+        return cls(count * GROWTH_FACTOR)
+
+    def __enter__(self) -> 'BloomFilter':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        if self._map is not None:
+            # The bits are a view into the map, which must be released first
+            self.bits.release()
+            self._map.close()
+
+    def __contains__(self, task_id: str) -> bool:
+        bits = self.bits
+        return all(bits[bit >> 3] & (1 << (bit & 7)) for bit in bit_positions(task_id, self.bit_count))
+
+    def add(self, task_id: str) -> None:
+        for bit in bit_positions(task_id, self.bit_count):
+            self.bits[bit >> 3] |= 1 << (bit & 7)
+        self.count += 1
+
+    def copy(self) -> 'BloomFilter':
+        """Return an in-memory copy of the filter that IDs can be added to."""
+        return BloomFilter(self.capacity, bytearray(self.bits), self.bit_count, self.count)
+
+    def write(self, file_path: Path, digest: bytes) -> None:
+        """Write the filter for the segment files with a digest."""
+        # The filter can always be rebuilt from the ID indexes, so it is not fsynced
+        with atomic_write(file_path, durable=False) as file:
+            file.write(BLOOM_HEADER.pack(BLOOM_MAGIC, digest, self.bit_count, HASH_COUNT,
+                                         self.count, self.capacity))
+            file.write(self.bits)
+
+def open_filter(file_path: Path, digest: Optional[bytes]) -> Optional[BloomFilter]:
+    """Memory-map the filter of the segment files with a digest, or return
+    None if it is missing or was built from other files."""
+    if digest is None:
+        return None
+    try:
+        with open(file_path, 'rb') as file:
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+
+    try:
+        magic, file_digest, bit_count, hash_count, count, capacity = BLOOM_HEADER.unpack_from(data)
+    except struct.error:
+        magic = None
+    if (magic != BLOOM_MAGIC or file_digest != digest or hash_count != HASH_COUNT
+            or len(data) != BLOOM_HEADER.size + (bit_count + 7) // 8):
+        data.close()
+        return None
+
+    bloom = BloomFilter(capacity, memoryview(data)[BLOOM_HEADER.size:], bit_count, count)
+    bloom._map = data
+    return bloom
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+block checksums of the task CSV files
+
+Every CSV file the tracker writes, compressed or not, gets a `.sum` file next
+to it with a CRC32 of each CHECKSUM_BLOCK bytes of the file:
+
+    header: magic, size of the file, number of blocks
+    blocks: CRC32 of each block, in file order
+
+Unlike the ID index, checksums cannot be rebuilt from the file, so they are
+staged and renamed into place with it. Any change the tracker did not make
+fails the check, whether the file was truncated, changed in place or
+replaced by an editor, until `task-tracker fsck --accept` records the file
+as it is. Files are checked before a stale index or snapshot is rebuilt
+from them and before compaction rewrites them, so a damaged file is never
+read as tasks nor persisted in place of them. Files written before
+checksums existed have none and are not checked.
+
+Blocks are checksummed in parallel threads; zlib releases the GIL while it
+computes a CRC32, so a large file is checked at disk speed.
+"""
+
+import os
+import mmap
+import zlib
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Optional, Tuple
+from compression import CorruptFileError
+from fileio import atomic_write
+
+CHECKSUM_MAGIC = b'TTSUM2\n\0'
+# magic, size of the checked file, number of blocks
+CHECKSUM_HEADER = struct.Struct('>8sQI')
+BLOCK_CRC = struct.Struct('>I')
+
+# Bytes of the file per checksum
+CHECKSUM_BLOCK = 64 * 1024
+
+# Blocks checksummed by each task of a parallel check
+BLOCKS_PER_TASK = 64
+
+def checksum_path(file_path: Path) -> Path:
+    """Return the path of the checksum file for a CSV file."""
+    return file_path.with_suffix('.sum')
+
+def block_crcs(data: memoryview, first: int, last: int) -> List[int]:
+    """Return the CRC32 of the blocks first to last - 1 of a file's contents."""
+    return [zlib.crc32(data[number * CHECKSUM_BLOCK:(number + 1) * CHECKSUM_BLOCK])
+            for number in range(first, last)]
+
+def compute_crcs(file_path: Path) -> List[int]:
+    """Return the CRC32 of every block of a file, computed in parallel for large files."""
+    with open(file_path, 'rb') as file:
+        size = os.fstat(file.fileno()).st_size
+        if size == 0:
+            return []
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            view = memoryview(data)
+            try:
+                count = (size + CHECKSUM_BLOCK - 1) // CHECKSUM_BLOCK
+                if count <= BLOCKS_PER_TASK:
+                    return block_crcs(view, 0, count)
+                starts = range(0, count, BLOCKS_PER_TASK)
+                with ThreadPoolExecutor() as executor:
+                    parts = executor.map(lambda first: block_crcs(view, first, min(first + BLOCKS_PER_TASK, count)),
+                                         starts)
+                    return [crc for part in parts for crc in part]
+            finally:
+                view.release()
+
+def write_checksums(file_path: Path, output_path: Optional[Path] = None) -> None:
+    """Write the checksums of a file to its checksum file, or to `output_path`,
+    e.g. a staged checksum file renamed into place with the file."""
+    crcs = compute_crcs(file_path)
+    size = file_path.stat().st_size
+    with atomic_write(output_path or checksum_path(file_path)) as file:
+        file.write(CHECKSUM_HEADER.pack(CHECKSUM_MAGIC, size, len(crcs)))
+        file.write(b''.join(BLOCK_CRC.pack(crc) for crc in crcs))
+
+def read_checksums(file_path: Path) -> Optional[Tuple[int, List[int]]]:
+    """Return the (size, block CRCs) recorded for a file, or None if there are none."""
+    try:
+        with open(checksum_path(file_path), 'rb') as file:
+            data = file.read()
+    except OSError:
+        return None
+    try:
+        magic, size, count = CHECKSUM_HEADER.unpack_from(data)
+    except struct.error:
+        return None
+    if magic != CHECKSUM_MAGIC or len(data) != CHECKSUM_HEADER.size + count * BLOCK_CRC.size:
+        return None
+    crcs = [crc for crc, in BLOCK_CRC.iter_unpack(data[CHECKSUM_HEADER.size:])]
+    return size, crcs
+
+def verify_file(file_path: Path) -> Optional[List[str]]:
+    """Check a file against its checksums and return the problems found, or
+    None if it has no checksums."""
+    recorded = read_checksums(file_path)
+    if recorded is None:
+        return None
+
+    size, expected = recorded
+    actual_size = file_path.stat().st_size
+    problems = []
+    if actual_size != size:
+        problems.append(f"size is {actual_size} bytes, expected {size}")
+    actual = compute_crcs(file_path)
+    bad = [number for number, (crc, expected_crc) in enumerate(zip(actual, expected)) if crc != expected_crc]
+    if bad:
+        shown = ', '.join(str(number) for number in bad[:10])
+        more = f" and {len(bad) - 10} more" if len(bad) > 10 else ""
+        problems.append(f"{len(bad)} of {len(expected)} blocks of {CHECKSUM_BLOCK} bytes damaged: {shown}{more}")
+    return problems
+
+def check_file(file_path: Path) -> None:
+    """Raise CorruptFileError if a file fails its checksums."""
+    problems = verify_file(file_path)
+    if problems:
+        raise CorruptFileError(f"{file_path.name} is corrupt: {'; '.join(problems)} "
+                               f"(run 'task-tracker fsck --accept' if it was edited on purpose)")
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+block-compressed CSV files for sealed completed segments
+
+`task-tracker archive` rewrites the sealed segments of the completed tasks
+(see segments.py) as `.csvz` files: the same CSV text cut into blocks of
+about BLOCK_SIZE bytes at row boundaries, each compressed on its own with
+gzip, lzma or bz2. The codec is chosen per segment by compressing a sample
+of it with each one. A table at the end of the file maps the position of
+each block in the CSV text to its compressed bytes:
+
+    header: magic, codec, CSV text size, table position, number of blocks
+    blocks: compressed CSV text, the header row alone in the first one
+    table:  per block, its position in the CSV text, in the file and its length
+
+open_csv() opens either kind of file as the CSV text. A compressed file
+decompresses a block only when a read reaches it, so the ID index and its
+byte offsets work unchanged, and looking up a single task decompresses the
+one block holding its row.
+"""
+
+import io
+import bz2
+import gzip
+import lzma
+import mmap
+import zlib
+import struct
+from bisect import bisect_right
+from pathlib import Path
+from typing import BinaryIO, Callable, Dict, Optional, Tuple
+
+COMPRESSED_SUFFIX = '.csvz'
+
+COMPRESSED_MAGIC = b'TTCSVZ1\0'
+# magic, codec, size of the CSV text, position of the block table, number of blocks
+COMPRESSED_HEADER = struct.Struct('>8s8sQQI')
+# position in the CSV text, position in the file, compressed length
+BLOCK_ENTRY = struct.Struct('>QQI')
+
+# CSV text per block, before compression
+BLOCK_SIZE = 64 * 1024
+
+# Codecs as (compress, decompress), fastest to decompress first
+CODECS: Dict[str, Tuple[Callable[[bytes], bytes], Callable[[bytes], bytes]]] = {
+    'gzip': (lambda data: gzip.compress(data, mtime=0), gzip.decompress),
+    'lzma': (lzma.compress, lzma.decompress),
+    'bz2': (bz2.compress, bz2.decompress),
+}
+
+# A slower codec is only chosen if it makes the sample this much smaller
+CODEC_GAIN = 0.05
+
+# Blocks of CSV text compressed to choose a codec
+SAMPLE_BLOCKS = 4
+
+class CorruptFileError(Exception):
+    """Raised when a CSV file, compressed or not, is damaged."""
+
+def is_compressed(file_path: Path) -> bool:
+    """Check whether a CSV file is block-compressed."""
+    return file_path.suffix == COMPRESSED_SUFFIX
+
+def choose_codec(file_path: Path) -> str:
+    """Pick the codec for a plain CSV file from a sample of it: the smallest
+    output, unless a faster codec comes within CODEC_GAIN of it."""
+    with open(file_path, 'rb') as file:
+        blocks = [file.read(BLOCK_SIZE) for _ in range(SAMPLE_BLOCKS)]
+    best, best_size = None, None
+    for codec, (compress, _) in CODECS.items():
+        size = sum(len(compress(block)) for block in blocks if block)
+        if best is None or size < best_size * (1 - CODEC_GAIN):
+            best, best_size = codec, size
+    return best
+
+class BlockWriter:
+    """Writes a compressed CSV file from whole CSV records, like a binary file.
+
+    Blocks are cut between writes, so each write must end at a record
+    boundary, as write_csv() does. tell() is the position in the CSV text.
+    """
+
+    def __init__(self, file: BinaryIO, codec: str):
+        self.file = file
+        self.codec = codec
+        self.compress = CODECS[codec][0]
+        self.pending = []
+        self.pending_size = 0
+        self.position = 0
+        self.blocks = []
+        # The header is filled in by finish()
+        self.file.write(bytes(COMPRESSED_HEADER.size))
+
+    def write(self, data: bytes) -> int:
+        self.pending.append(data)
+        self.pending_size += len(data)
+        self.position += len(data)
+        # The CSV header row gets a block of its own, so reading it decompresses no rows
+        if not self.blocks or self.pending_size >= BLOCK_SIZE:
+            self.write_block()
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def write_block(self) -> None:
+        """Compress the pending CSV text as one block."""
+        if not self.pending:
+            return
+        text = b''.join(self.pending)
+        data = self.compress(text)
+        self.blocks.append((self.position - len(text), self.file.tell(), len(data)))
+        self.file.write(data)
+        self.pending = []
+        self.pending_size = 0
+
+    def finish(self) -> None:
+        """Write the last block, the block table and the header."""
+        self.write_block()
+        table_position = self.file.tell()
+        for block in self.blocks:
+            self.file.write(BLOCK_ENTRY.pack(*block))
+        self.file.seek(0)
+        self.file.write(COMPRESSED_HEADER.pack(COMPRESSED_MAGIC, self.codec.encode('ascii'), self.position,
+                                               table_position, len(self.blocks)))
+        self.file.seek(0, io.SEEK_END)
+
+def read_header(file: BinaryIO) -> Tuple[str, int, int, int]:
+    """Read the (codec, CSV text size, table position, number of blocks) of a compressed CSV file."""
+    file.seek(0)
+    try:
+        magic, codec, size, table_position, count = COMPRESSED_HEADER.unpack(file.read(COMPRESSED_HEADER.size))
+    except struct.error:
+        raise CorruptFileError("Truncated header")
+    codec = codec.rstrip(b'\0').decode('ascii', 'replace')
+    if magic != COMPRESSED_MAGIC or codec not in CODECS:
+        raise CorruptFileError("Not a compressed CSV file")
+    return codec, size, table_position, count
+
+def file_codec(file_path: Path) -> str:
+    """Return the codec of a compressed CSV file."""
+    with open(file_path, 'rb') as file:
+        return read_header(file)[0]
+
+def text_size(file_path: Path) -> int:
+    """Return the size of the CSV text of a CSV file, compressed or not."""
+    if not is_compressed(file_path):
+        return file_path.stat().st_size
+    with open(file_path, 'rb') as file:
+        return read_header(file)[1]
+
+class BlockReader(io.RawIOBase):
+    """Reads the CSV text of a compressed CSV file, decompressing one block at a time."""
+
+    def __init__(self, file_path: Path):
+        super().__init__()
+        self._file = open(file_path, 'rb')
+        try:
+            codec, self._size, table_position, count = read_header(self._file)
+            self._file.seek(table_position)
+            table = self._file.read(count * BLOCK_ENTRY.size)
+            if len(table) != count * BLOCK_ENTRY.size:
+                raise CorruptFileError("Truncated block table")
+        except BaseException:
+            self._file.close()
+            raise
+        self._decompress = CODECS[codec][1]
+        self._blocks = [BLOCK_ENTRY.unpack_from(table, number * BLOCK_ENTRY.size) for number in range(count)]
+        self._starts = [block[0] for block in self._blocks]
+        self._position = 0
+        # The last block read, as (number, CSV text)
+        self._cached = (None, b'')
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self._size
+        self._position = max(offset, 0)
+        return self._position
+
+    def tell(self) -> int:
+        return self._position
+
+    def block(self, number: int) -> bytes:
+        """Return the CSV text of a block."""
+        if self._cached[0] != number:
+            _, position, length = self._blocks[number]
+            self._file.seek(position)
+            try:
+                text = self._decompress(self._file.read(length))
+            except (OSError, EOFError, ValueError, zlib.error, lzma.LZMAError) as e:
+                raise CorruptFileError(f"Block {number}: {e}")
+            self._cached = (number, text)
+        return self._cached[1]
+
+    def readinto(self, buffer) -> int:
+        if self._position >= self._size:
+            return 0
+        number = bisect_right(self._starts, self._position) - 1
+        start = self._position - self._starts[number]
+        data = self.block(number)[start:start + len(buffer)]
+        buffer[:len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+    def close(self) -> None:
+        self._file.close()
+        super().close()
+
+def open_csv(file_path: Path) -> BinaryIO:
+    """Open the CSV text of a CSV file for binary reading, decompressing it as it is read if needed."""
+    if is_compressed(file_path):
+        return io.BufferedReader(BlockReader(file_path))
+    return open(file_path, 'rb')
+
+def map_csv(file_path: Path) -> Optional[mmap.mmap]:
+    """Return the whole CSV text of a compressed CSV file in anonymous memory, or None if it is empty."""
+    with open_csv(file_path) as file:
+        text = file.read()
+    if not text:
+        return None
+    data = mmap.mmap(-1, len(text))
+    data.write(text)
+    # find() searches from the current position
+    data.seek(0)
+    return data
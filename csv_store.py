@@ -0,0 +1,903 @@
+#!/usr/bin/env python3
+"""
+CSV storage backend
+
+Tasks live in CSV files, active tasks in one and completed tasks in monthly
+segments (see segments.py), with an ID index and a columnar snapshot (see
+snapshot.py) and block checksums (see checksums.py) next to each and a Bloom
+filter of the completed IDs (see bloom.py), and mutations are appended to a
+journal that is folded in on read.
+Note histories live in a log per task (see notes.py).
+"""
+
+import io
+import os
+import csv
+import json
+from bisect import bisect_left
+from contextlib import ExitStack, contextmanager
+from itertools import chain, islice
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Any, Tuple
+from data import TASK_FIELDS
+from store import TaskStore
+from query import TaskQuery
+from journal import (JOURNAL_COMPACT_BYTES, append_records, read_records, fold_appended, fold_in_place,
+                     fold_records, fold_stream, group_records, record_task_id, replay_records, torn_records)
+from index import IdIndex, check_changed, find_row, index_path, open_index, parse_row, read_record, write_index
+from notes import NoteLogs
+from snapshot import SnapshotWriter, open_rows, snapshot_path
+from bloom import BLOOM_FILE_NAME, BloomFilter, open_filter, segments_digest
+from checksums import check_file, checksum_path, verify_file, write_checksums
+from compression import COMPRESSED_SUFFIX, BlockWriter, choose_codec, file_codec, is_compressed, open_csv, text_size
+from segments import Segment, SegmentManifest, completion_month, current_month, segment_path, write_manifest
+from fileio import atomic_write, file_mode, fsync_dir, fsync_file
+from locking import LOCK_STATS_FILE_NAME, FileLock
+
+# File names inside the data directory
+ACTIVE_FILE_NAME = 'active.csv'
+COMPLETED_FILE_NAME = 'completed.csv'
+JOURNAL_FILE_NAME = 'journal.log'
+INTENT_FILE_NAME = 'compact.intent'
+WRITE_LOCK_FILE_NAME = 'write.lock'
+COMPACT_LOCK_FILE_NAME = 'compact.lock'
+
+# During a bulk load the journal may grow to this fraction of the CSV files
+# before it is compacted
+BULK_JOURNAL_FRACTION = 8
+
+# Suffix of the new CSV files written by a compaction before they replace the old ones
+STAGED_SUFFIX = '.staged'
+
+def drain_buffer(buffer: io.StringIO) -> bytes:
+    """Return the encoded contents of a text buffer and empty it."""
+    data = buffer.getvalue().encode('utf-8')
+    buffer.seek(0)
+    buffer.truncate()
+    return data
+
+def write_csv(file: BinaryIO, tasks: Iterable[Dict[str, str]]) -> List[Tuple[str, int, int]]:
+    """Write tasks as CSV to a binary file and return their (id, offset, row) index entries."""
+    # Rows are encoded one at a time to record the byte offset of each
+    buffer = io.StringIO(newline='')
+    writer = csv.DictWriter(buffer, fieldnames=TASK_FIELDS)
+    index_entries = []
+
+    writer.writeheader()
+    file.write(drain_buffer(buffer))
+    for row, task in enumerate(tasks):
+        writer.writerow(task)
+        index_entries.append((task['id'], file.tell(), row))
+        file.write(drain_buffer(buffer))
+    return index_entries
+
+def put_record(task: Dict[str, str], month: str) -> Dict[str, Any]:
+    """Return the journal record that puts a task; completed tasks carry the current month."""
+    record = {'op': 'put', 'task': dict(task)}
+    if task['state'] == 'X':
+        record['at'] = month
+    return record
+
+def replace_rows(tasks: Iterable[Dict[str, str]],
+                 placed: Dict[int, Optional[Dict[str, str]]]) -> Iterator[Dict[str, str]]:
+    """Pass the tasks of a CSV file through, replacing the rows placed by
+    place_records() with their new version, or dropping them if placed as None."""
+    for row, task in enumerate(tasks):
+        if row not in placed:
+            yield task
+        elif placed[row] is not None:
+            yield placed[row]
+
+def write_tasks(file_path: Path, tasks: List[Dict[str, str]]) -> None:
+    """Atomically replace a CSV file with tasks and rebuild its ID index and checksums."""
+    try:
+        with atomic_write(file_path) as file:
+            index_entries = write_csv(file, tasks)
+        write_index(file_path, index_entries)
+        write_checksums(file_path)
+    except Exception as e:
+        print(f"Error writing tasks to {file_path}: {e}")
+
+class CsvTaskStore(TaskStore):
+    """Task storage in an active CSV file and completed segment files plus a mutation journal.
+
+    Writers serialize on an exclusive write lock. Readers never wait for
+    writers: the CSV files only change when a compaction renames new files
+    into place, so readers hold a shared lock on the compaction lock and only
+    the rename step of a compaction needs it exclusively.
+    """
+
+    def __init__(self, data_dir: Path):
+        self.data_dir = data_dir
+        self.journal_file = data_dir / JOURNAL_FILE_NAME
+        self.intent_file = data_dir / INTENT_FILE_NAME
+        self.compact_lock_file = data_dir / COMPACT_LOCK_FILE_NAME
+        self.stats_file = data_dir / LOCK_STATS_FILE_NAME
+        self.note_logs = NoteLogs(data_dir)
+        self.active_file = data_dir / ACTIVE_FILE_NAME
+        # The first segment of the completed tasks
+        self.completed_file = data_dir / COMPLETED_FILE_NAME
+        self.manifest = SegmentManifest(data_dir, self.completed_file)
+        self.bloom_file = data_dir / BLOOM_FILE_NAME
+
+        self.write_lock = FileLock(data_dir / WRITE_LOCK_FILE_NAME, stats_path=self.stats_file)
+        self.transaction_depth = 0
+        self.bulk_loading = False
+
+        self.recover()
+        if not self.active_file.exists():
+            write_tasks(self.active_file, [])
+        # completed.csv may have been archived since the manifest was written
+        if not self.manifest.path.exists() and not self.completed_file.exists():
+            write_tasks(self.completed_file, [])
+
+    def version(self) -> object:
+        # Writes append to the journal and compactions replace the manifest
+        signature = []
+        for file_path in (self.journal_file, self.manifest.path, self.active_file, self.completed_file):
+            try:
+                stat = file_path.stat()
+                signature.append((stat.st_ino, stat.st_size, stat.st_mtime_ns))
+            except FileNotFoundError:
+                signature.append(None)
+        return tuple(signature)
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        if self.transaction_depth == 0:
+            self.write_lock.acquire()
+        self.transaction_depth += 1
+        try:
+            yield
+        finally:
+            self.transaction_depth -= 1
+            if self.transaction_depth == 0:
+                self.write_lock.release()
+
+    @contextmanager
+    def bulk_load(self) -> Iterator[None]:
+        with self.transaction():
+            self.bulk_loading = True
+            try:
+                yield
+            finally:
+                self.bulk_loading = False
+            # Leave a journal small enough for the readers that come next
+            if self.journal_file.exists() and self.journal_file.stat().st_size > JOURNAL_COMPACT_BYTES:
+                self.compact()
+
+    def compact_threshold(self) -> int:
+        """Return the journal size past which the journal is compacted."""
+        if not self.bulk_loading:
+            return JOURNAL_COMPACT_BYTES
+        # Each compaction rewrites the CSV files; letting the journal grow with
+        # them keeps a bulk load from rewriting them once per megabyte
+        size = sum(file_path.stat().st_size for file_path in self.all_files())
+        return max(JOURNAL_COMPACT_BYTES, size // BULK_JOURNAL_FRACTION)
+
+    def records_completion_months(self) -> bool:
+        return True
+
+    def read_lock(self) -> FileLock:
+        """Return a shared lock that keeps compactions from swapping files during a read."""
+        return FileLock(self.compact_lock_file, exclusive=False, stats_path=self.stats_file)
+
+    def swap_lock(self) -> FileLock:
+        """Return the exclusive lock a compaction holds while it renames files into place."""
+        return FileLock(self.compact_lock_file, exclusive=True, stats_path=self.stats_file)
+
+    def state_files(self, state: str) -> List[Segment]:
+        """Return the (month, path) of the CSV files holding the tasks in a state, in order.
+
+        Active tasks are in a single file, with no month. Compactions replace
+        the manifest of the completed segments, so call this with the read
+        lock or the write lock held.
+        """
+        if state == 'O':
+            return [(None, self.active_file)]
+        return self.manifest.segments()
+
+    def all_files(self) -> List[Path]:
+        """Return the paths of every CSV file, active tasks first."""
+        return [file_path for state in ('O', 'X') for _, file_path in self.state_files(state)]
+
+    def store_files(self) -> List[Path]:
+        """Return the paths of every file of the stored tasks that exists: CSV
+        files with their indexes, snapshots and checksums, the manifest, the Bloom filter and the journal."""
+        paths = [self.journal_file, self.manifest.path, self.bloom_file]
+        for file_path in self.all_files():
+            paths += [file_path, index_path(file_path), snapshot_path(file_path), checksum_path(file_path)]
+        return [file_path for file_path in paths if file_path.exists()]
+
+    def disk_usage(self) -> int:
+        with self.read_lock():
+            return sum(file_path.stat().st_size for file_path in self.store_files())
+
+    def garbage_ratio(self) -> float:
+        """Estimate the share of the store compaction frees: the journal, plus
+        the rows of the tasks it removes, less the rows of the tasks it adds."""
+        with ExitStack() as stack:
+            with self.read_lock():
+                usage = sum(file_path.stat().st_size for file_path in self.store_files())
+                journal_size = self.journal_file.stat().st_size if self.journal_file.exists() else 0
+                records = read_records(self.journal_file)
+                entries_by_id = group_records(records)
+                indexes = [stack.enter_context(open_index(file_path)) for file_path in self.all_files()]
+            if not usage:
+                return 0.0
+            rows = sum(len(index) for index in indexes)
+            stored = {entry[0] for index in indexes for entry in index.find_many(sorted(entries_by_id))}
+
+        # Updated and moved tasks are rewritten at the same size; each row
+        # comes with index entries, snapshot values and checksums
+        row_bytes = (usage - journal_size) / rows if rows else journal_size / max(len(records), 1)
+        added = removed = 0
+        for task_id, entries in entries_by_id.items():
+            exists = task_id in stored
+            for _, record in entries:
+                if record['op'] in ('put', 'remove'):
+                    exists = record['op'] == 'put'
+            if exists and task_id not in stored:
+                added += 1
+            elif not exists and task_id in stored:
+                removed += 1
+        garbage = journal_size + (removed - added) * row_bytes
+        return min(max(garbage / usage, 0.0), 1.0)
+
+    def verify(self) -> Dict[str, Optional[List[str]]]:
+        with self.read_lock():
+            results = {file_path.name: verify_file(file_path) for file_path in self.all_files()}
+            torn = torn_records(self.journal_file)
+        results[self.journal_file.name] = [f"{torn} torn records, skipped on read"] if torn else []
+        return results
+
+    def accept_files(self) -> List[Path]:
+        """Record checksums for the CSV files as they are now, e.g. after editing
+        them by hand, and return the files whose checksums changed."""
+        accepted = []
+        with self.transaction(), self.read_lock():
+            for file_path in self.all_files():
+                if verify_file(file_path) != []:
+                    write_checksums(file_path)
+                    accepted.append(file_path)
+        return accepted
+
+    def staged_paths(self) -> List[Path]:
+        """Return the new files left staged by a compaction."""
+        return list(self.data_dir.glob('*' + STAGED_SUFFIX))
+
+    def recover(self) -> None:
+        """Finish or discard a compaction that was interrupted by a crash."""
+        if not self.intent_file.exists() and not self.staged_paths():
+            return
+
+        with self.transaction(), self.swap_lock():
+            self.apply_intent()
+            for staged_path in self.staged_paths():
+                staged_path.unlink()
+
+    def apply_intent(self) -> None:
+        """Carry out the renames of a compaction intent record and drop the journal.
+
+        A rename to None deletes the file.
+        """
+        if not self.intent_file.exists():
+            return
+
+        with open(self.intent_file, 'r', encoding='utf-8') as file:
+            renames = json.load(file)
+        for staged_name, target_name in renames:
+            staged_path = self.data_dir / staged_name
+            if not staged_path.exists():
+                continue
+            if target_name is None:
+                staged_path.unlink()
+            else:
+                os.replace(str(staged_path), str(self.data_dir / target_name))
+        if self.journal_file.exists():
+            self.journal_file.unlink()
+        fsync_dir(self.data_dir)
+        self.intent_file.unlink()
+
+    def iterate(self, state: str) -> Iterator[Dict[str, str]]:
+        # An open file keeps its contents when a compaction replaces it, so
+        # the lock is only held until the files are open and the journal read
+        with ExitStack() as stack:
+            with self.read_lock():
+                records = read_records(self.journal_file)
+                sources = [stack.enter_context(open_rows(file_path)) for _, file_path in self.state_files(state)]
+            # A task is in one file only, so the files fold like a single one
+            yield from fold_stream(chain.from_iterable(sources), records, state)
+
+    def select(self, state: str, query: TaskQuery) -> Iterator[Dict[str, str]]:
+        id_range = query.id_range()
+        with ExitStack() as stack:
+            with self.read_lock():
+                records = read_records(self.journal_file)
+                entries_by_id = group_records(records)
+                task_ids = sorted(entries_by_id)
+                chosen = []
+                skipped = []
+                for month, file_path in self.state_files(state):
+                    if query.matches_completed(month):
+                        if not id_range:
+                            check_changed(file_path)
+                        chosen.append((stack.enter_context(open_index(file_path)) if id_range else None,
+                                       stack.enter_context(open_csv(file_path))))
+                        continue
+                    # Segments out of the month range are only read for the
+                    # tasks the journal touches, which may leave them
+                    index = stack.enter_context(open_index(file_path))
+                    if index.find_many(task_ids):
+                        skipped.append((index, stack.enter_context(open_csv(file_path))))
+
+            # Only tasks with a note log have note history to check
+            noted = self.note_logs.task_ids() if query.since or query.until or query.note else set()
+
+            def matches(task: Dict[str, str]) -> bool:
+                if task['id'] not in noted:
+                    return query.matches(task)
+                return query.matches(task, self.note_times(task['id'], query.since), self.note_texts(task['id']))
+
+            appended = []
+            if id_range:
+                placed = self.place_records(skipped + chosen, entries_by_id, state, appended)
+                tasks = chain.from_iterable(self.read_range(index, file, rows, *id_range)
+                                            for (index, file), rows in zip(chosen, placed[len(skipped):]))
+            else:
+                self.place_records(skipped, entries_by_id, state, appended)
+                tasks = chain.from_iterable(fold_in_place(self.filter_rows(file, records, query, noted),
+                                                          entries_by_id, state, appended)
+                                            for _, file in chosen)
+            yield from filter(matches, tasks)
+
+            # The tasks the journal adds are read after the files, like fold_stream does
+            tasks = (task for position, task in fold_appended(entries_by_id, state, appended)
+                     if query.matches_completed(completion_month(records[position]) if state == 'X' else None))
+            if id_range:
+                tasks = (task for task in tasks if id_range[0] <= task['id'] < id_range[1])
+            yield from filter(matches, tasks)
+
+    def read_range(self, index: IdIndex, file: BinaryIO, placed: Dict[int, Optional[Dict[str, str]]],
+                   low: str, high: str) -> Iterator[Dict[str, str]]:
+        """Read the tasks of a CSV file whose IDs are in the range [low, high),
+        parsing only their rows, given the rows placed by place_records()."""
+        high_key = high.encode('utf-8')
+
+        rows = []
+        position = index.bisect(low.encode('utf-8'))
+        while position < len(index):
+            entry_key, offset, row = index.entry(position)
+            # Keys are padded with NUL bytes, which sort before any ID character
+            if entry_key >= high_key:
+                break
+            rows.append((row, offset))
+            position += 1
+        rows.sort()
+
+        file.seek(0)
+        header = read_record(file)
+        for row, offset in rows:
+            if row in placed:
+                if placed[row] is not None:
+                    yield placed[row]
+            else:
+                file.seek(offset)
+                yield parse_row(header, read_record(file))
+
+    def filter_rows(self, file: BinaryIO, records: List[Dict[str, Any]], query: TaskQuery,
+                    noted: Iterable[str] = ()) -> Iterator[Dict[str, str]]:
+        """Parse the rows of a CSV file, skipping those whose raw bytes cannot match a query.
+
+        Rows of tasks the journal touches are always parsed, since the journal
+        may change them. Rows of the `noted` tasks, which have a note history,
+        only need to contain the title text.
+        """
+        file.seek(0)
+        # Quotes are doubled inside quoted CSV fields
+        needles = [text.replace('"', '""').encode('utf-8') for text in query.substrings()]
+        if not needles:
+            yield from csv.DictReader(io.TextIOWrapper(file, encoding='utf-8', newline=''))
+            return
+        history_needles = [text.replace('"', '""').encode('utf-8') for text in query.substrings(True)]
+
+        touched = {record_task_id(record).encode('utf-8') for record in records}
+        noted = {task_id.encode('utf-8') for task_id in noted}
+        header = read_record(file)
+        while True:
+            record = read_record(file)
+            if not record:
+                break
+            if not record.strip():
+                continue
+            # The ID is the first field; quoted IDs are not worth decoding here
+            raw_id = None if record.startswith(b'"') else record.split(b',', 1)[0]
+            if raw_id is not None and raw_id not in touched:
+                required = history_needles if raw_id in noted else needles
+                if not all(n in record for n in required):
+                    continue
+            yield parse_row(header, record)
+
+    def page(self, state: str, offset: int = 0, limit: Optional[int] = None,
+             after: Optional[str] = None, query: Optional[TaskQuery] = None) -> Iterator[Dict[str, str]]:
+        if query:
+            # Matching tasks cannot be counted without reading them
+            yield from super().page(state, offset, limit, after, query)
+            return
+        if not offset and after is None:
+            yield from islice(self.iterate(state), limit)
+            return
+
+        with ExitStack() as stack:
+            with self.read_lock():
+                records = read_records(self.journal_file)
+                sources = [(stack.enter_context(open_index(file_path)), stack.enter_context(open_csv(file_path)))
+                           for _, file_path in self.state_files(state)]
+
+            entries_by_id = group_records(records)
+            appended = []
+            placed = self.place_records(sources, entries_by_id, state, appended)
+            appended = [task for _, task in fold_appended(entries_by_id, state, appended)]
+            # CSV rows that the journal removed or moved to the end, per file
+            removed = [sorted(row for row, task in rows.items() if task is None) for rows in placed]
+            kept = [len(index) - len(removed_rows) for (index, _), removed_rows in zip(sources, removed)]
+
+            start = offset
+            if after is not None:
+                position = self.find_position(sources, placed, removed, kept, appended, after)
+                if position is None:
+                    return
+                start += position + 1
+
+            yield from islice(self.read_position(sources, placed, removed, kept, appended, start), limit)
+
+    def place_records(self, sources: List[Tuple[IdIndex, BinaryIO]],
+                      entries_by_id: Dict[str, List[Tuple[int, Dict[str, Any]]]], state: str,
+                      appended: List[Tuple[int, Dict[str, str]]]) -> List[Dict[int, Optional[Dict[str, str]]]]:
+        """Work out where the journal puts the tasks it touches in CSV files, like fold_in_place.
+
+        Return, per file, its touched rows mapped to their new version or to
+        None if they left their place. The entries of the tasks found are
+        popped from entries_by_id, and the tasks re-added go to `appended` as
+        (journal position, task) pairs.
+        """
+        task_ids = sorted(entries_by_id)
+        placed = []
+        for index, file in sources:
+            file.seek(0)
+            header = read_record(file)
+            rows = {}
+            for task_id, offset, row in index.find_many(task_ids):
+                entries = entries_by_id.pop(task_id, None)
+                if entries is None:
+                    # Already found in an earlier file
+                    continue
+                file.seek(offset)
+                task, inserted = replay_records(parse_row(header, read_record(file)), entries, state)
+                rows[row] = task if inserted is None else None
+                if task is not None and inserted is not None:
+                    appended.append((inserted, task))
+            placed.append(rows)
+        return placed
+
+    def find_position(self, sources: List[Tuple[IdIndex, BinaryIO]], placed: List[Dict[int, Optional[Dict[str, str]]]],
+                      removed: List[List[int]], kept: List[int], appended: List[Dict[str, str]],
+                      task_id: str) -> Optional[int]:
+        """Return the position of a task in the folded order, or None if it is not there."""
+        for position, task in enumerate(appended):
+            if task['id'] == task_id:
+                return sum(kept) + position
+
+        for number, (index, _) in enumerate(sources):
+            found = index.find(task_id)
+            if found is None:
+                continue
+            if found[1] in placed[number] and placed[number][found[1]] is None:
+                return None
+            return sum(kept[:number]) + found[1] - bisect_left(removed[number], found[1])
+        return None
+
+    def skip_rows(self, position: int, removed: List[int]) -> int:
+        """Return the CSV row of a position in the folded order of a file, before the appended tasks."""
+        row = position
+        for removed_row in removed:
+            if removed_row > row:
+                break
+            row += 1
+        return row
+
+    def read_position(self, sources: List[Tuple[IdIndex, BinaryIO]], placed: List[Dict[int, Optional[Dict[str, str]]]],
+                      removed: List[List[int]], kept: List[int], appended: List[Dict[str, str]],
+                      position: int) -> Iterator[Dict[str, str]]:
+        """Stream the folded tasks from a position in the folded order on, skipping
+        the files before it and seeking straight to its row."""
+        for (index, file), rows, removed_rows, count in zip(sources, placed, removed, kept):
+            if position >= count:
+                position -= count
+                continue
+            yield from self.read_from(index, file, self.skip_rows(position, removed_rows), rows)
+            position = 0
+        yield from appended[position:]
+
+    def read_from(self, index: IdIndex, file: BinaryIO, row: int,
+                  placed: Dict[int, Optional[Dict[str, str]]]) -> Iterator[Dict[str, str]]:
+        """Stream the tasks of a CSV file from a row on, seeking straight to the row."""
+        file.seek(0)
+        fields = next(csv.reader(io.StringIO(read_record(file).decode('utf-8'), newline='')))
+        file.seek(index.row_offset(row))
+
+        for values in csv.reader(io.TextIOWrapper(file, encoding='utf-8', newline='')):
+            if not values:
+                continue
+            if row in placed:
+                if placed[row] is not None:
+                    yield placed[row]
+            else:
+                yield dict(zip(fields, values))
+            row += 1
+
+    def find_task(self, task_id: str, records: List[Dict[str, Any]]) -> Optional[Dict[str, str]]:
+        """Find a task by ID in active tasks, then in completed tasks, given the journal records."""
+        records = [r for r in records if record_task_id(r) == task_id]
+
+        for state in ('O', 'X'):
+            row = None
+            if state == 'X' and not self.may_be_completed(task_id):
+                files = []
+            else:
+                files = self.state_files(state)
+            # Recently completed tasks are the likeliest to be looked up
+            for _, file_path in reversed(files):
+                row = find_row(file_path, task_id)
+                if row:
+                    break
+            tasks = fold_records([row] if row else [], records, state)
+            if tasks:
+                return tasks[0]
+        return None
+
+    def completed_filter(self) -> Optional[BloomFilter]:
+        """Open the Bloom filter of the completed IDs, or return None if it is out of date."""
+        return open_filter(self.bloom_file, segments_digest(file_path for _, file_path in self.state_files('X')))
+
+    def may_be_completed(self, task_id: str) -> bool:
+        """Check whether a task ID may be in a completed segment; False is certain."""
+        bloom = self.completed_filter()
+        if bloom is None:
+            return True
+        with bloom:
+            return task_id in bloom
+
+    def match_ids(self, prefix: str, limit: int) -> List[str]:
+        with self.read_lock():
+            records = read_records(self.journal_file)
+            candidates = {record_task_id(r) for r in records if record_task_id(r).startswith(prefix)}
+            # Journal records can remove up to this many of the indexed IDs
+            removable = len(candidates)
+            for file_path in self.all_files():
+                with open_index(file_path) as index:
+                    candidates.update(index.ids_with_prefix(prefix, limit + removable))
+            return sorted(task_id for task_id in candidates if self.find_task(task_id, records))[:limit]
+
+    def get(self, task_id: str) -> Optional[Dict[str, str]]:
+        with self.read_lock():
+            return self.find_task(task_id, read_records(self.journal_file))
+
+    def put_many(self, tasks: List[Dict[str, str]]) -> None:
+        with self.transaction():
+            month = current_month()
+            self.log([put_record(task, month) for task in tasks])
+
+    def update(self, task_id: str, fields: Dict[str, str]) -> bool:
+        with self.transaction():
+            if self.get(task_id) is None:
+                return False
+            self.log([{'op': 'update', 'id': task_id, 'fields': fields}])
+            return True
+
+    def append_notes(self, entries: List[Tuple[str, str, str]]) -> None:
+        entries_by_id = {}
+        for task_id, time, text in entries:
+            entries_by_id.setdefault(task_id, []).append((time, text))
+        with self.transaction():
+            for task_id, task_entries in entries_by_id.items():
+                self.note_logs.append(task_id, task_entries)
+
+    def replace_notes(self, entries: List[Tuple[str, str, str]]) -> None:
+        with self.transaction():
+            self.note_logs.delete({entry[0] for entry in entries})
+            self.append_notes(entries)
+
+    def notes(self, task_id: str, since: Optional[str] = None) -> Iterator[Tuple[str, str]]:
+        return self.note_logs.read(task_id, since)
+
+    def delete_many(self, task_ids: Iterable[str]) -> int:
+        with self.transaction():
+            with self.read_lock():
+                records = read_records(self.journal_file)
+                existing = [task_id for task_id in task_ids if self.find_task(task_id, records)]
+            self.log([{'op': 'remove', 'id': task_id} for task_id in existing])
+            self.note_logs.delete(existing)
+            return len(existing)
+
+    def write_changes(self, changes: Dict[str, Optional[Dict[str, str]]]) -> None:
+        # Puts and removes go to the journal in a single append
+        month = current_month()
+        records = [
+            put_record(task, month) if task is not None else {'op': 'remove', 'id': task_id}
+            for task_id, task in changes.items()
+        ]
+        with self.transaction():
+            self.log(records)
+            self.note_logs.delete(task_id for task_id, task in changes.items() if task is None)
+
+    def log(self, records: List[Dict[str, Any]]) -> None:
+        """Append mutation records to the journal, compacting it when it gets large.
+
+        Raises OSError if the records could not be written.
+        """
+        if not records:
+            return
+
+        journal_size = append_records(self.journal_file, records)
+
+        if journal_size > self.compact_threshold():
+            # Readers are never kept waiting for an automatic compaction; it is retried on a later write
+            self.compact(blocking=False)
+
+    def compact(self, blocking: bool = True) -> bool:
+        """Fold the journal into the CSV files and start a new journal.
+
+        Only the files holding tasks the journal touches, and the ones it
+        appends tasks to, are rewritten; completed tasks go to the segment of
+        the month they were completed in. The new CSV files and manifest are
+        staged and fsynced first, then an intent record lists the renames
+        that replace the old files and drop the journal. A crash before the
+        intent record leaves the old files and journal in place; a crash
+        after it is completed by recover() on the next start. Only the
+        renames wait for readers to finish.
+
+        Returns False, leaving the journal in place, if it failed or if
+        blocking is False and readers hold the swap lock.
+        """
+        with self.transaction():
+            records = read_records(self.journal_file)
+            if not records:
+                return True
+            entries_by_id = group_records(records)
+
+            staged = []
+            completed_ids = []
+            try:
+                self.compact_state('O', records, dict(entries_by_id), staged, [])
+                segments = self.compact_state('X', records, dict(entries_by_id), staged, completed_ids)
+            except Exception as e:
+                print(f"Error compacting journal {self.journal_file}: {e}")
+                self.discard(staged)
+                return False
+            return self.install(staged, segments, blocking=blocking, completed_ids=completed_ids)
+
+    def install(self, staged: List[Tuple[Path, Path, Optional[List[Tuple[str, int, int]]]]],
+                segments: List[Segment], obsolete: Iterable[Path] = (), blocking: bool = True,
+                completed_ids: Iterable[str] = ()) -> bool:
+        """Rename staged CSV files into place with a manifest of the segments,
+        delete obsolete files and drop the journal, through an intent record,
+        then add `completed_ids`, the tasks new to the segments, to the Bloom filter.
+
+        Returns False, discarding the staged files, if it failed or if
+        blocking is False and readers hold the swap lock.
+        """
+        # The filter is only extended if it covers the segments being replaced
+        bloom = self.completed_filter()
+        if bloom is not None:
+            with bloom:
+                bloom = bloom.copy()
+        swap_lock = self.swap_lock()
+        try:
+            # The manifest is always replaced, which is what version() looks for
+            manifest_staged = self.manifest.path.with_name(self.manifest.path.name + STAGED_SUFFIX)
+            with open(manifest_staged, 'wb') as file:
+                write_manifest(file, segments)
+                fsync_file(file)
+            staged.append((manifest_staged, self.manifest.path, None))
+
+            if not swap_lock.acquire(blocking):
+                self.discard(staged)
+                return False
+
+            # Renamed files keep the permissions of the files they replace
+            for staged_path, file_path, _ in staged:
+                os.chmod(staged_path, file_mode(file_path))
+
+            renames = [[staged_path.name, file_path.name] for staged_path, file_path, _ in staged]
+            renames += [[file_path.name, None] for file_path in obsolete]
+            with atomic_write(self.intent_file) as file:
+                file.write(json.dumps(renames).encode('utf-8'))
+            fsync_dir(self.data_dir)
+        except Exception as e:
+            print(f"Error replacing the task files in {self.data_dir}: {e}")
+            swap_lock.release()
+            self.discard(staged)
+            return False
+
+        try:
+            self.apply_intent()
+        finally:
+            swap_lock.release()
+        for _, file_path, index_entries in staged:
+            if index_entries is not None:
+                write_index(file_path, index_entries)
+        self.update_filter(bloom, completed_ids)
+        return True
+
+    def update_filter(self, bloom: Optional[BloomFilter], completed_ids: Iterable[str]) -> None:
+        """Write the Bloom filter of the current segments, adding IDs to the
+        in-memory filter of the previous ones, or rebuilding it from the ID
+        indexes if there is none or it would grow past its capacity."""
+        segment_paths = [file_path for _, file_path in self.state_files('X')]
+        try:
+            if bloom is not None:
+                for task_id in completed_ids:
+                    if task_id not in bloom:
+                        bloom.add(task_id)
+            if bloom is None or bloom.count > bloom.capacity:
+                bloom = self.build_filter(segment_paths)
+            bloom.write(self.bloom_file, segments_digest(segment_paths))
+        except Exception as e:
+            print(f"Error writing the completed ID filter {self.bloom_file}: {e}")
+
+    def build_filter(self, segment_paths: List[Path]) -> BloomFilter:
+        """Build a Bloom filter of the IDs in the segment files from their ID indexes."""
+        with ExitStack() as stack:
+            indexes = [stack.enter_context(open_index(file_path)) for file_path in segment_paths]
+            bloom = BloomFilter.for_ids(sum(len(index) for index in indexes))
+            for index in indexes:
+                for task_id in index.ids_with_prefix('', len(index)):
+                    bloom.add(task_id)
+        return bloom
+
+    def discard(self, staged: List[Tuple[Path, Path, Optional[List[Tuple[str, int, int]]]]]) -> None:
+        """Delete staged files that will not be installed."""
+        for staged_path, _, _ in staged:
+            if staged_path.exists():
+                staged_path.unlink()
+
+    def compact_state(self, state: str, records: List[Dict[str, Any]],
+                      entries_by_id: Dict[str, List[Tuple[int, Dict[str, Any]]]],
+                      staged: List[Tuple[Path, Path, Optional[List[Tuple[str, int, int]]]]],
+                      appended_ids: List[str]) -> List[Segment]:
+        """Stage the new CSV files of a state for a compaction, adding them to
+        `staged` and the IDs of the tasks appended to them to `appended_ids`,
+        and return the files of the state afterwards."""
+        files = self.state_files(state)
+        with ExitStack() as stack:
+            sources = [(stack.enter_context(open_index(file_path)), stack.enter_context(open_csv(file_path)))
+                       for _, file_path in files]
+            appended = []
+            placed = self.place_records(sources, entries_by_id, state, appended)
+        groups = self.group_appended(state, files[-1][0], records, fold_appended(entries_by_id, state, appended))
+        appended_ids.extend(task['id'] for tasks in groups.values() for task in tasks)
+
+        for number, (month, file_path) in enumerate(files):
+            tail = groups.pop(month, []) if number == len(files) - 1 else []
+            # Files the journal leaves alone, like sealed segments, are not rewritten
+            if not placed[number] and not tail:
+                continue
+            # A damaged file is left for fsck rather than rewritten with whatever could be read
+            check_file(file_path)
+            with open_rows(file_path) as source:
+                staged += self.stage_file(file_path, chain(replace_rows(source, placed[number]), tail))
+        for month, tasks in groups.items():
+            file_path = segment_path(self.data_dir, month)
+            staged += self.stage_file(file_path, tasks)
+            files.append((month, file_path))
+        return files
+
+    def group_appended(self, state: str, last_month: Optional[str], records: List[Dict[str, Any]],
+                       appended: List[Tuple[int, Dict[str, str]]]) -> Dict[Optional[str], List[Dict[str, str]]]:
+        """Group the (journal position, task) pairs a compaction appends to a state
+        by the month of the file they go to.
+
+        Active tasks all go to active.csv. Completed tasks go to the segment of
+        the month they were completed in, but never to one before the last
+        segment, so the segments keep completed tasks in the order they were
+        completed.
+        """
+        groups = {}
+        month = last_month
+        for position, task in appended:
+            if state == 'X':
+                completed = completion_month(records[position])
+                if month is None or completed > month:
+                    month = completed
+            groups.setdefault(month, []).append(task)
+        return groups
+
+    def stage_file(self, file_path: Path, tasks: Iterable[Dict[str, str]],
+                   codec: Optional[str] = None) -> List[Tuple[Path, Path, Optional[List[Tuple[str, int, int]]]]]:
+        """Write the new version of a CSV file next to it, with its snapshot and
+        checksums, and return the (staged path, path, index entries) of each;
+        only the CSV file has index entries.
+
+        The sidecars are staged like the CSV file, so they are renamed into
+        place or discarded together with it. Compressed files are written
+        with `codec`, by default the codec of the file they replace.
+        """
+        staged_path = file_path.with_name(file_path.name + STAGED_SUFFIX)
+        sums_path = checksum_path(file_path)
+        sums_staged = sums_path.with_name(sums_path.name + STAGED_SUFFIX)
+        if is_compressed(file_path):
+            # Archived segments are read block by block; a snapshot would undo the savings
+            with open(staged_path, 'wb') as file:
+                writer = BlockWriter(file, codec or file_codec(file_path))
+                index_entries = write_csv(writer, tasks)
+                writer.finish()
+                fsync_file(file)
+            write_checksums(staged_path, sums_staged)
+            return [(staged_path, file_path, index_entries), (sums_staged, sums_path, None)]
+
+        # Rows are streamed to the new file and its snapshot
+        snap_path = snapshot_path(file_path)
+        snap_staged = snap_path.with_name(snap_path.name + STAGED_SUFFIX)
+        with open(staged_path, 'wb') as file, open(snap_staged, 'wb') as snapshot_file:
+            snapshot = SnapshotWriter(snapshot_file)
+            index_entries = write_csv(file, snapshot.record(tasks))
+            fsync_file(file)
+            snapshot.finish(staged_path)
+            fsync_file(snapshot_file)
+        write_checksums(staged_path, sums_staged)
+        return [(staged_path, file_path, index_entries), (snap_staged, snap_path, None), (sums_staged, sums_path, None)]
+
+    def archive(self, codec: Optional[str] = None) -> List[Path]:
+        """Compress the sealed segments of the completed tasks and return the new files.
+
+        Every segment before the current month's, completed.csv included, is
+        rewritten as a block-compressed file (see compression.py) with
+        `codec`, or with the codec that suits its contents best. The journal
+        is compacted first, since installing the new files drops it.
+        """
+        with self.transaction():
+            if not self.compact():
+                # The compaction said why
+                return []
+
+            month = current_month()
+            segments = self.state_files('X')
+            staged = []
+            obsolete = []
+            try:
+                for number, (segment_month, file_path) in enumerate(segments):
+                    if is_compressed(file_path) or (segment_month is not None and segment_month >= month):
+                        continue
+                    with open_index(file_path) as index:
+                        if not len(index):
+                            continue
+                    check_file(file_path)
+                    target = file_path.with_suffix(COMPRESSED_SUFFIX)
+                    with open_rows(file_path) as source:
+                        staged += self.stage_file(target, source, codec or choose_codec(file_path))
+                    segments[number] = (segment_month, target)
+                    obsolete += [file_path, snapshot_path(file_path)]
+            except Exception as e:
+                print(f"Error archiving completed segments: {e}")
+                self.discard(staged)
+                return []
+
+            if not staged:
+                return []
+            archived = [file_path for _, file_path, index_entries in staged if index_entries is not None]
+            return archived if self.install(staged, segments, obsolete) else []
+
+    def segment_stats(self) -> List[Dict[str, Any]]:
+        """Return the file, codec, CSV text size and size on disk of each completed segment."""
+        stats = []
+        with self.read_lock():
+            for month, file_path in self.state_files('X'):
+                stats.append({
+                    'file': file_path.name,
+                    'month': month,
+                    'codec': file_codec(file_path) if is_compressed(file_path) else None,
+                    'text_bytes': text_size(file_path),
+                    'stored_bytes': file_path.stat().st_size,
+                })
+        return stats
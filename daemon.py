@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+daemon mode: serve commands over a Unix domain socket
+
+`task-tracker serve` keeps the task store in memory and answers commands
+forwarded by the CLI, so each invocation skips startup work and parsing the
+store. Each connection carries one JSON request line and one JSON response
+line:
+
+    request:  {"argv": [...], "backend": "csv"}
+    response: {"status": 0, "stdout": "...", "stderr": "..."}
+              {"fallback": true}   (the client should run the command itself)
+
+The daemon can also start a maintenance command, such as compacting the
+store, every MAINTENANCE_INTERVAL seconds. It runs as a child process, so
+commands keep being answered while it works and it shares no state with
+them; its output is printed once it exits.
+"""
+
+import os
+import json
+import time
+import signal
+import socket
+import subprocess
+import socketserver
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+# File name of the daemon socket inside the data directory
+SOCKET_FILE_NAME = 'daemon.sock'
+
+# Seconds a client waits for the daemon before running the command itself
+CONNECT_TIMEOUT = 1.0
+
+# Seconds between the end of one maintenance run and the start of the next
+MAINTENANCE_INTERVAL = 60.0
+
+RequestHandler = Callable[[Dict[str, Any]], Dict[str, Any]]
+
+def send_message(sock: socket.socket, message: Dict[str, Any]) -> None:
+    """Send one JSON message line."""
+    sock.sendall(json.dumps(message).encode('utf-8') + b"\n")
+
+def receive_message(sock: socket.socket) -> Optional[Dict[str, Any]]:
+    """Receive one JSON message line, or None if the peer closed the connection."""
+    chunks = []
+    while True:
+        chunk = sock.recv(65536)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        if chunk.endswith(b"\n"):
+            break
+    if not chunks:
+        return None
+    return json.loads(b"".join(chunks))
+
+def forward_command(socket_path: Path, argv: List[str], backend: str) -> Optional[Dict[str, Any]]:
+    """Run a command in the daemon and return its response, or None if no daemon is running."""
+    if not socket_path.exists():
+        return None
+
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(CONNECT_TIMEOUT)
+            sock.connect(str(socket_path))
+            # Commands themselves may take longer than connecting
+            sock.settimeout(None)
+            send_message(sock, {'argv': argv, 'backend': backend})
+            response = receive_message(sock)
+    except OSError:
+        return None
+
+    if response is None or response.get('fallback'):
+        return None
+    return response
+
+class CommandServer(socketserver.UnixStreamServer):
+    """Unix socket server handing each request to a single handler function.
+
+    The maintenance command runs in a child process that the serving thread
+    starts and collects between requests, so it never holds up a command.
+    """
+
+    def __init__(self, socket_path: Path, handle_request: RequestHandler,
+                 maintenance: Optional[List[str]] = None):
+        self.handle_request_message = handle_request
+        self.maintenance = maintenance
+        self.maintenance_process = None
+        self.last_maintenance = time.monotonic()
+        super().__init__(str(socket_path), CommandConnection)
+
+    def service_actions(self) -> None:
+        # Called by serve_forever() after each request and poll interval
+        if self.maintenance is None:
+            return
+        if self.maintenance_process is not None:
+            if self.maintenance_process.poll() is None:
+                return
+            self.finish_maintenance()
+        if time.monotonic() - self.last_maintenance < MAINTENANCE_INTERVAL:
+            return
+        try:
+            self.maintenance_process = subprocess.Popen(self.maintenance, stdin=subprocess.DEVNULL,
+                                                        stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        except OSError as e:
+            print(f"Error starting maintenance: {e}")
+            self.last_maintenance = time.monotonic()
+
+    def finish_maintenance(self) -> None:
+        """Print the output of the maintenance process, which has exited."""
+        output, _ = self.maintenance_process.communicate()
+        print(output.decode('utf-8', errors='replace'), end="")
+        if self.maintenance_process.returncode:
+            print(f"Error: Maintenance exited with status {self.maintenance_process.returncode}")
+        self.maintenance_process = None
+        self.last_maintenance = time.monotonic()
+
+    def server_close(self) -> None:
+        # Maintenance is safe to interrupt, e.g. compaction is recovered on the next start
+        if self.maintenance_process is not None:
+            self.maintenance_process.terminate()
+            self.maintenance_process.wait()
+        super().server_close()
+
+class CommandConnection(socketserver.BaseRequestHandler):
+    """One client connection carrying a single request."""
+
+    def handle(self) -> None:
+        request = receive_message(self.request)
+        if request is None:
+            return
+        try:
+            response = self.server.handle_request_message(request)
+        except Exception as e:
+            response = {'status': 1, 'stdout': "", 'stderr': f"Error: {e}\n"}
+        send_message(self.request, response)
+
+def serve(socket_path: Path, handle_request: RequestHandler,
+          maintenance: Optional[List[str]] = None) -> None:
+    """Serve requests on a Unix socket until interrupted, running the
+    `maintenance` command line every MAINTENANCE_INTERVAL seconds if given."""
+    if socket_path.exists():
+        if is_listening(socket_path):
+            raise RuntimeError(f"A daemon is already listening on {socket_path}")
+        # Left behind by a daemon that did not shut down cleanly
+        socket_path.unlink()
+
+    server = CommandServer(socket_path, handle_request, maintenance)
+    # Shut down cleanly on SIGTERM as well as on Ctrl-C
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if socket_path.exists():
+            os.unlink(str(socket_path))
+
+def is_listening(socket_path: Path) -> bool:
+    """Check whether something accepts connections on a Unix socket."""
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(CONNECT_TIMEOUT)
+            sock.connect(str(socket_path))
+        return True
+    except OSError:
+        return False
@@ -1 +1,27 @@
-TASK_FIELDS = ['id', 'title', 'state', 'note']
\ No newline at end of file
+import sys
+from typing import Dict
+
+TASK_FIELDS = ['id', 'title', 'state', 'note']
+
+class Task:
+    """Compact form of a task for stores that keep many tasks in memory.
+
+    A dict per task carries a hash table of its own; slots cut that several
+    fold. The TaskStore interface still passes tasks as dicts.
+    """
+
+    __slots__ = ('id', 'title', 'state', 'note')
+
+    def __init__(self, id: str, title: str, state: str, note: str):
+        self.id = id
+        self.title = title
+        # States are a handful of values shared by every task
+        self.state = sys.intern(state)
+        self.note = note
+
+    @classmethod
+    def from_dict(cls, task: Dict[str, str]) -> 'Task':
+        return cls(task['id'], task['title'], task['state'], task['note'])
+
+    def to_dict(self) -> Dict[str, str]:
+        return {'id': self.id, 'title': self.title, 'state': self.state, 'note': self.note}
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+crash-safe file writing helpers
+"""
+
+import os
+import stat
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+from typing import BinaryIO, Iterator
+
+# The umask can only be read by setting it, so it is read once, at import
+UMASK = os.umask(0)
+os.umask(UMASK)
+
+def fsync_file(file: BinaryIO) -> None:
+    """Flush a file and force its contents to disk."""
+    file.flush()
+    os.fsync(file.fileno())
+
+def fsync_dir(dir_path: Path) -> None:
+    """Force a directory entry change (create, rename, unlink) to disk."""
+    if not hasattr(os, 'O_DIRECTORY'):
+        return
+    fd = os.open(str(dir_path), os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def file_mode(file_path: Path) -> int:
+    """Return the permission bits of a file, or those open() gives a new file if it does not exist."""
+    try:
+        return stat.S_IMODE(file_path.stat().st_mode)
+    except FileNotFoundError:
+        return 0o666 & ~UMASK
+
+@contextmanager
+def atomic_write(file_path: Path, durable: bool = True) -> Iterator[BinaryIO]:
+    """Write a file through a temporary file in the same directory that replaces it on success.
+
+    Readers see either the old or the new contents, never a partial file.
+    The file keeps the mode of the file it replaces, and a new file gets the
+    mode open() would give it. With durable=False the data is not fsynced,
+    for files that can be rebuilt.
+    """
+    mode = file_mode(file_path)
+    fd, temp_name = tempfile.mkstemp(dir=str(file_path.parent), prefix=file_path.name + '.', suffix='.tmp')
+    try:
+        # mkstemp creates the file readable by its owner only
+        os.fchmod(fd, mode)
+        with os.fdopen(fd, 'wb') as file:
+            yield file
+            if durable:
+                fsync_file(file)
+        os.replace(temp_name, str(file_path))
+    except BaseException:
+        os.unlink(temp_name)
+        raise
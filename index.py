@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""
+persistent ID index for the task CSV files
+
+Each CSV file has a sidecar `.idx` file listing its task IDs in sorted order
+as fixed-width entries (id, byte offset of the row, row number). Looking up
+an ID is a binary search over the memory-mapped index followed by parsing a
+single CSV row, instead of parsing the whole file. After the entries, the
+byte offset of every row is stored in row order, so reading can start at any
+row without parsing the rows before it.
+"""
+
+import csv
+import io
+import os
+import mmap
+import struct
+from bisect import bisect_left, bisect_right
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+from fileio import atomic_write
+from compression import CorruptFileError, is_compressed, map_csv, open_csv
+from checksums import check_file
+
+INDEX_MAGIC = b'TTIDX2\n\0'
+# magic, size and mtime of the indexed CSV file, number of entries
+INDEX_HEADER = struct.Struct('>8sQQI')
+# Longest task ID that can be indexed
+ID_WIDTH = 32
+INDEX_ENTRY = struct.Struct(f'>{ID_WIDTH}sQI')
+# Byte offset of a row, in the row order table
+ROW_OFFSET = struct.Struct('>Q')
+
+class StaleIndexError(Exception):
+    """Raised when an index is missing or out of date with its CSV file."""
+
+def index_path(file_path: Path) -> Path:
+    """Return the path of the index file for a CSV file."""
+    return file_path.with_suffix('.idx')
+
+def index_key(task_id: str) -> bytes:
+    """Encode a task ID the way it is stored in index entries."""
+    return task_id.encode('utf-8').ljust(ID_WIDTH, b'\0')
+
+def write_index(file_path: Path, entries: List[Tuple[str, int, int]]) -> None:
+    """Write the index for a CSV file from (id, offset, row) entries in row order."""
+    stat = file_path.stat()
+    keyed = sorted((index_key(task_id), offset, row) for task_id, offset, row in entries)
+
+    # The index can always be rebuilt from the CSV file, so it is not fsynced
+    with atomic_write(index_path(file_path), durable=False) as file:
+        file.write(INDEX_HEADER.pack(INDEX_MAGIC, stat.st_size, stat.st_mtime_ns, len(keyed)))
+        for key, offset, row in keyed:
+            file.write(INDEX_ENTRY.pack(key, offset, row))
+        for _, offset, _ in entries:
+            file.write(ROW_OFFSET.pack(offset))
+
+def read_record(file) -> bytes:
+    """Read one CSV record, which spans several lines when a quoted field contains newlines."""
+    record = file.readline()
+    # Quotes inside quoted fields are doubled, so an odd count means the record continues
+    while record.count(b'"') % 2 == 1:
+        line = file.readline()
+        if not line:
+            break
+        record += line
+    return record
+
+def map_file(file_path: Path) -> Optional[mmap.mmap]:
+    """Memory-map a CSV file for reading, or return None if it is empty.
+
+    Compressed files are decompressed into anonymous memory.
+    """
+    if is_compressed(file_path):
+        return map_csv(file_path)
+    with open(file_path, 'rb') as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return None
+        return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+def record_spans(data: mmap.mmap) -> Iterator[Tuple[int, int]]:
+    """Yield the (start, end) byte range of each CSV record after the header.
+
+    Records end at a newline outside quoted fields; since quotes inside
+    quoted fields are doubled, that is a newline preceded by an even number
+    of quotes. Lines without quotes, the common case, are never copied.
+    """
+    start = position = 0
+    quotes = 0
+    header = True
+    while position < len(data):
+        newline = data.find(b'\n', position)
+        end = len(data) if newline < 0 else newline + 1
+        if data.find(b'"', position, end) >= 0:
+            quotes += data[position:end].count(b'"')
+        position = end
+        if quotes % 2 == 0:
+            if not header:
+                yield start, end
+            header = False
+            start = end
+    if start < len(data) and not header:
+        # A record torn by an unbalanced quote runs to the end of the file
+        yield start, len(data)
+
+def record_id(data: mmap.mmap, start: int, end: int) -> Optional[str]:
+    """Return the ID, the first field, of the CSV record in a byte range, or None for a blank line."""
+    if data[start:start + 1] == b'"':
+        # Quoted IDs may contain anything, so let the csv module unquote them
+        fields = next(csv.reader(io.StringIO(data[start:end].decode('utf-8'), newline='')), None)
+        return fields[0] if fields else None
+    comma = data.find(b',', start, end)
+    field = data[start:end if comma < 0 else comma].rstrip(b'\r\n')
+    if comma < 0 and not field:
+        return None
+    return field.decode('utf-8')
+
+def scan_offsets(file_path: Path) -> List[Tuple[str, int, int]]:
+    """Scan a CSV file for the (id, offset, row) of every task, parsing only the IDs."""
+    data = map_file(file_path)
+    if data is None:
+        return []
+    entries = []
+    with data:
+        for start, end in record_spans(data):
+            task_id = record_id(data, start, end)
+            if task_id is not None:
+                entries.append((task_id, start, len(entries)))
+    return entries
+
+def search_row(file_path: Path, task_id: str) -> Optional[int]:
+    """Find the byte offset of the row of a task by searching the raw CSV bytes for
+    its ID at the start of a line, or return None if there is no such row."""
+    key = task_id.encode('utf-8')
+    if any(char in key for char in b',"\r\n'):
+        # The ID is quoted in the file; look it up the slow way
+        for entry_id, offset, _ in scan_offsets(file_path):
+            if entry_id == task_id:
+                return offset
+        return None
+
+    data = map_file(file_path)
+    if data is None:
+        return None
+    needle = b'\n' + key + b','
+    with data:
+        # A line start is a row start if the quotes before it are balanced
+        quotes = 0
+        counted = 0
+        position = data.find(needle)
+        while position >= 0:
+            quotes += data[counted:position].count(b'"')
+            counted = position
+            if quotes % 2 == 0:
+                return position + 1
+            position = data.find(needle, position + 1)
+    return None
+
+def parse_row(header: bytes, record: bytes) -> Dict[str, str]:
+    """Parse a single CSV record given the header record of its file."""
+    text = (header + record).decode('utf-8')
+    return next(csv.DictReader(io.StringIO(text, newline='')))
+
+def read_row_at(file_path: Path, offset: int) -> Dict[str, str]:
+    """Parse the single task row starting at a byte offset of a CSV file."""
+    with open_csv(file_path) as file:
+        header = read_record(file)
+        file.seek(offset)
+        return parse_row(header, read_record(file))
+
+class IdIndex:
+    """Read-only view of the ID index of a CSV file."""
+
+    def __init__(self, file_path: Path):
+        try:
+            stat = file_path.stat()
+            with open(index_path(file_path), 'rb') as file:
+                self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            raise StaleIndexError(f"No index for {file_path}")
+
+        try:
+            magic, size, mtime_ns, count = INDEX_HEADER.unpack_from(self._map)
+        except struct.error:
+            magic, size, mtime_ns, count = b'', 0, 0, 0
+        expected_length = INDEX_HEADER.size + count * (INDEX_ENTRY.size + ROW_OFFSET.size)
+        if (magic != INDEX_MAGIC or (size, mtime_ns) != (stat.st_size, stat.st_mtime_ns)
+                or len(self._map) != expected_length):
+            self._map.close()
+            raise StaleIndexError(f"Index for {file_path} is out of date")
+        self._count = count
+
+    def __enter__(self) -> 'IdIndex':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._map.close()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def entry(self, position: int) -> Tuple[bytes, int, int]:
+        """Return the (key, offset, row) entry at a position in sorted order."""
+        return INDEX_ENTRY.unpack_from(self._map, INDEX_HEADER.size + position * INDEX_ENTRY.size)
+
+    def bisect(self, key: bytes) -> int:
+        """Return the position of the first entry whose key is not less than `key`."""
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            if self.entry(middle)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def row_offset(self, row: int) -> int:
+        """Return the byte offset of a row."""
+        position = INDEX_HEADER.size + self._count * INDEX_ENTRY.size + row * ROW_OFFSET.size
+        return ROW_OFFSET.unpack_from(self._map, position)[0]
+
+    def ids_with_prefix(self, prefix: str, limit: int) -> List[str]:
+        """Return the indexed IDs starting with a prefix, in sorted order, at most `limit` of them."""
+        key = prefix.encode('utf-8')
+        task_ids = []
+        position = self.bisect(key)
+        while position < self._count and len(task_ids) < limit:
+            entry_key = self.entry(position)[0]
+            if not entry_key.startswith(key):
+                break
+            task_ids.append(entry_key.rstrip(b'\0').decode('utf-8'))
+            position += 1
+        return task_ids
+
+    def find(self, task_id: str) -> Optional[Tuple[int, int]]:
+        """Return the (offset, row) of a task ID, or None if it is not indexed."""
+        key = index_key(task_id)
+        position = self.bisect(key)
+        if position < self._count:
+            entry_key, offset, row = self.entry(position)
+            if entry_key == key:
+                return offset, row
+        return None
+
+    def find_many(self, task_ids: List[str]) -> List[Tuple[str, int, int]]:
+        """Return the (id, offset, row) of the IDs of a sorted list that are indexed.
+
+        Only IDs between the first and the last indexed ID are looked up, so
+        IDs newer than every indexed task, like those of new tasks, cost nothing.
+        """
+        if not self._count:
+            return []
+        first = self.entry(0)[0].rstrip(b'\0').decode('utf-8')
+        last = self.entry(self._count - 1)[0].rstrip(b'\0').decode('utf-8')
+        found = []
+        for task_id in task_ids[bisect_left(task_ids, first):bisect_right(task_ids, last)]:
+            entry = self.find(task_id)
+            if entry is not None:
+                found.append((task_id,) + entry)
+        return found
+
+def open_index(file_path: Path) -> IdIndex:
+    """Open the ID index of a CSV file, rebuilding it first if it is stale.
+
+    A stale index means the file changed since the tracker wrote it, so the
+    file is checked against its checksums before it is indexed.
+    """
+    try:
+        return IdIndex(file_path)
+    except StaleIndexError:
+        check_file(file_path)
+        try:
+            entries = scan_offsets(file_path)
+        except UnicodeDecodeError as e:
+            raise CorruptFileError(f"{file_path.name} is not valid UTF-8: {e}")
+        write_index(file_path, entries)
+        return IdIndex(file_path)
+
+def check_changed(file_path: Path) -> None:
+    """Check a CSV file against its checksums if it changed since its ID index was written."""
+    try:
+        with IdIndex(file_path):
+            return
+    except StaleIndexError:
+        check_file(file_path)
+
+def find_row(file_path: Path, task_id: str) -> Optional[Dict[str, str]]:
+    """Read a single task from a CSV file through its ID index.
+
+    A stale index is left for open_index() to rebuild; the row is found by
+    searching the raw bytes of the file instead, which is much cheaper than
+    parsing every row.
+    """
+    try:
+        with IdIndex(file_path) as index:
+            entry = index.find(task_id)
+        offset = entry[0] if entry is not None else None
+    except StaleIndexError:
+        check_file(file_path)
+        offset = search_row(file_path, task_id)
+
+    if offset is None:
+        return None
+    try:
+        return read_row_at(file_path, offset)
+    except UnicodeDecodeError as e:
+        raise CorruptFileError(f"{file_path.name} is not valid UTF-8: {e}")
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+append-only mutation journal for the task store
+
+Every mutation is appended as one JSON line instead of rewriting the CSV
+files. Readers fold the journal over the CSV contents, and the journal is
+compacted back into the CSV files once it grows past JOURNAL_COMPACT_BYTES.
+
+Record formats:
+- {"op": "put", "task": {...}}                  create a task or move it to task['state'];
+                                                completed tasks also have "at": "YYYY-MM"
+- {"op": "update", "id": ..., "fields": {...}}  overwrite some fields
+- {"op": "note", "id": ..., "text": ...}        append a line to the note (only written by
+                                                versions before note histories)
+- {"op": "remove", "id": ...}                   delete a task
+"""
+
+import os
+import json
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Any, Tuple
+from fileio import fsync_file
+
+# Fold the journal back into the CSV files once it grows past this size
+JOURNAL_COMPACT_BYTES = 1024 * 1024
+
+def append_records(journal_path: Path, records: List[Dict[str, Any]]) -> int:
+    """Durably append mutation records to the journal and return the new journal size."""
+    data = "".join(json.dumps(record) + "\n" for record in records).encode('utf-8')
+    with open(journal_path, 'ab+') as file:
+        # Start on a fresh line if an earlier append was torn by a crash
+        if file.tell() and os.pread(file.fileno(), 1, file.tell() - 1) != b"\n":
+            data = b"\n" + data
+        file.write(data)
+        fsync_file(file)
+        return file.tell()
+
+def read_records(journal_path: Path) -> List[Dict[str, Any]]:
+    """Read all mutation records from the journal."""
+    if not journal_path.exists():
+        return []
+
+    records = []
+    with open(journal_path, 'r', encoding='utf-8') as file:
+        for line in file:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                # A torn line from an interrupted append
+                continue
+    return records
+
+def torn_records(journal_path: Path) -> int:
+    """Count the lines of the journal that are not valid records, which read_records() skips."""
+    if not journal_path.exists():
+        return 0
+
+    torn = 0
+    with open(journal_path, 'rb') as file:
+        for line in file:
+            try:
+                json.loads(line)
+            except ValueError:
+                torn += 1
+    return torn
+
+def record_task_id(record: Dict[str, Any]) -> str:
+    """Return the ID of the task a record applies to."""
+    if record['op'] == 'put':
+        return record['task']['id']
+    return record['id']
+
+def append_note(note: str, entry: str) -> str:
+    """Append a note line to an existing note, preserving previous notes."""
+    current_note = note.strip()
+    if current_note:
+        return f"{current_note}\n{entry}"
+    return entry
+
+def group_records(records: List[Dict[str, Any]]) -> Dict[str, List[Tuple[int, Dict[str, Any]]]]:
+    """Group records by task ID as (position in the journal, record) entries."""
+    entries_by_id = {}
+    for position, record in enumerate(records):
+        entries_by_id.setdefault(record_task_id(record), []).append((position, record))
+    return entries_by_id
+
+def replay_records(task: Optional[Dict[str, str]], entries: List[Tuple[int, Dict[str, Any]]],
+                   state: str) -> Tuple[Optional[Dict[str, str]], Optional[int]]:
+    """Apply the (position, record) journal entries of one task to it.
+
+    Return the resulting task, or None if it is not in `state`, and the
+    journal position at which it was (re)inserted, or None if it keeps its
+    place in the file.
+    """
+    task = dict(task) if task is not None else None
+    inserted = None
+
+    for position, record in entries:
+        op = record['op']
+        if op == 'put':
+            if record['task']['state'] == state:
+                if task is None:
+                    inserted = position
+                task = dict(record['task'])
+            else:
+                # The task moved to the other file
+                task = None
+        elif op == 'remove':
+            task = None
+        elif task is not None:
+            if op == 'update':
+                task.update(record['fields'])
+            elif op == 'note':
+                task['note'] = append_note(task['note'], record['text'])
+
+    return task, inserted
+
+def fold_in_place(tasks: Iterable[Dict[str, str]], entries_by_id: Dict[str, List[Tuple[int, Dict[str, Any]]]],
+                  state: str, appended: List[Tuple[int, Dict[str, str]]]) -> Iterator[Dict[str, str]]:
+    """Lazily apply grouped journal entries to the tasks of a file, popping the entries of each task read.
+
+    Tasks that keep their place are yielded; tasks the journal re-adds are
+    added to `appended` as (journal position, task) pairs instead.
+    """
+    for task in tasks:
+        entries = entries_by_id.pop(task['id'], None)
+        if entries is None:
+            yield task
+            continue
+        task, inserted = replay_records(task, entries, state)
+        if task is not None and inserted is None:
+            yield task
+        elif task is not None:
+            appended.append((inserted, task))
+
+def fold_appended(entries_by_id: Dict[str, List[Tuple[int, Dict[str, Any]]]], state: str,
+                  appended: List[Tuple[int, Dict[str, str]]]) -> List[Tuple[int, Dict[str, str]]]:
+    """Add the tasks the journal creates from the entries left over to the appended
+    (journal position, task) pairs and return them in journal order."""
+    for entries in entries_by_id.values():
+        task, inserted = replay_records(None, entries, state)
+        if task is not None:
+            appended.append((inserted, task))
+    appended.sort(key=lambda item: item[0])
+    return appended
+
+def fold_stream(tasks: Iterable[Dict[str, str]], records: List[Dict[str, Any]],
+                state: str) -> Iterator[Dict[str, str]]:
+    """Lazily apply journal records to the tasks of the file holding `state` tasks.
+
+    Tasks the journal does not touch are passed through as they are read, so
+    memory use depends on the size of the journal, not of the file. Tasks the
+    journal adds or re-adds follow at the end, in journal order.
+    """
+    entries_by_id = group_records(records)
+    appended = []
+    yield from fold_in_place(tasks, entries_by_id, state, appended)
+    for _, task in fold_appended(entries_by_id, state, appended):
+        yield task
+
+def fold_records(tasks: List[Dict[str, str]], records: List[Dict[str, Any]],
+                 state: str) -> List[Dict[str, str]]:
+    """Apply journal records to the tasks of the file holding `state` tasks."""
+    return list(fold_stream(tasks, records, state))
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+advisory file locks shared between task-tracker processes
+
+Locks are fcntl.flock locks on small files in the data directory, acquired
+by polling with a timeout. Every acquisition that had to wait, and every
+timeout, is appended to a stats file so lock contention can be inspected
+with `task-tracker lock-stats`.
+"""
+
+import os
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Platforms without fcntl run without locking
+    fcntl = None
+
+# File name of the contention stats inside the data directory
+LOCK_STATS_FILE_NAME = 'lock-stats.log'
+
+# Seconds to wait for a lock before giving up
+LOCK_TIMEOUT = float(os.environ.get('TASK_TRACKER_LOCK_TIMEOUT', '10'))
+
+# Polling interval bounds while waiting for a lock, in seconds
+MIN_POLL_INTERVAL = 0.001
+MAX_POLL_INTERVAL = 0.05
+
+class LockTimeout(Exception):
+    """Raised when a lock could not be acquired within its timeout."""
+
+class FileLock:
+    """A shared or exclusive advisory lock on a lock file."""
+
+    def __init__(self, lock_path: Path, exclusive: bool = True, timeout: float = LOCK_TIMEOUT,
+                 stats_path: Optional[Path] = None):
+        self.lock_path = lock_path
+        self.exclusive = exclusive
+        self.timeout = timeout
+        self.stats_path = stats_path
+        self._fd = None
+
+    def acquire(self, blocking: bool = True) -> bool:
+        """Acquire the lock; return False if it is busy and blocking is False."""
+        if fcntl is None:
+            return True
+
+        fd = os.open(str(self.lock_path), os.O_RDWR | os.O_CREAT, 0o644)
+        operation = (fcntl.LOCK_EX if self.exclusive else fcntl.LOCK_SH) | fcntl.LOCK_NB
+        start = time.monotonic()
+        interval = MIN_POLL_INTERVAL
+        contended = False
+
+        while True:
+            try:
+                fcntl.flock(fd, operation)
+                break
+            except BlockingIOError:
+                contended = True
+                waited = time.monotonic() - start
+                if not blocking or waited >= self.timeout:
+                    os.close(fd)
+                    if blocking:
+                        self.record_stats('timeout', waited)
+                        raise LockTimeout(f"Timed out after {waited:.1f}s waiting for {self.lock_path}")
+                    return False
+                time.sleep(interval)
+                interval = min(interval * 2, MAX_POLL_INTERVAL)
+
+        if contended:
+            self.record_stats('contended', time.monotonic() - start)
+        self._fd = fd
+        return True
+
+    def release(self) -> None:
+        """Release the lock."""
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self) -> 'FileLock':
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.release()
+
+    def record_stats(self, outcome: str, waited: float) -> None:
+        """Append one contention event to the stats file."""
+        if self.stats_path is None:
+            return
+        mode = 'exclusive' if self.exclusive else 'shared'
+        line = (f"{datetime.now().isoformat(timespec='seconds')}\t{os.getpid()}\t"
+                f"{self.lock_path.name}\t{mode}\t{outcome}\t{waited * 1000:.1f}\n")
+        try:
+            with open(self.stats_path, 'a', encoding='utf-8') as file:
+                file.write(line)
+        except OSError:
+            pass
+
+def summarize_stats(stats_path: Path) -> List[Dict[str, object]]:
+    """Summarize contention events per lock file and mode."""
+    if not stats_path.exists():
+        return []
+
+    summary = {}
+    with open(stats_path, 'r', encoding='utf-8') as file:
+        for line in file:
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) != 6:
+                continue
+            _, _, lock_name, mode, outcome, wait_ms = fields
+            entry = summary.setdefault((lock_name, mode), {
+                'lock': lock_name, 'mode': mode, 'contended': 0, 'timeouts': 0,
+                'total_wait_ms': 0.0, 'max_wait_ms': 0.0,
+            })
+            entry['timeouts' if outcome == 'timeout' else 'contended'] += 1
+            entry['total_wait_ms'] += float(wait_ms)
+            entry['max_wait_ms'] = max(entry['max_wait_ms'], float(wait_ms))
+    return list(summary.values())
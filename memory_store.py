@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+in-memory task stores layered over a backing store
+
+MemoryTaskStore keeps every task in memory as a slotted Task indexed by id,
+with a sorted list of the IDs for prefix lookups, and writes through to the
+backing store, so reads never touch the disk. The backing store's
+version is checked before each operation and the cache is reloaded when
+another process has changed it.
+
+StagedTaskStore keeps changes in memory until they are committed to the
+backing store in a single write.
+"""
+
+from bisect import bisect_left, insort
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from data import Task
+from store import TaskStore
+from query import TaskQuery
+
+class MemoryTaskStore(TaskStore):
+    """Write-through in-memory cache over another task store."""
+
+    def __init__(self, backing: TaskStore):
+        self.backing = backing
+        self.load()
+
+    def load(self) -> None:
+        """Load every task from the backing store."""
+        self.tasks = {}
+        # Task IDs per state, in order; dicts are used as ordered sets
+        self.order = {'O': {}, 'X': {}}
+        self.loaded_version = self.backing.version()
+
+        for state, task_ids in self.order.items():
+            for task in self.backing.iterate(state):
+                self.tasks[task['id']] = Task.from_dict(task)
+                task_ids[task['id']] = None
+        self.sorted_ids = sorted(self.tasks)
+
+    def refresh(self) -> None:
+        """Reload the cache if another process changed the backing store."""
+        if self.backing.version() != self.loaded_version:
+            self.load()
+
+    def remember(self, task: Dict[str, str]) -> None:
+        """Store a task in the cache, moving it to the end of its state if it changed state."""
+        previous = self.tasks.get(task['id'])
+        if previous is None:
+            # New time-ordered IDs sort last, so this is usually an append
+            insort(self.sorted_ids, task['id'])
+        elif previous.state != task['state']:
+            del self.order[previous.state][task['id']]
+        self.order[task['state']][task['id']] = None
+        self.tasks[task['id']] = Task.from_dict(task)
+
+    def forget(self, task_id: str) -> None:
+        """Drop a task from the cache."""
+        task = self.tasks.pop(task_id)
+        del self.order[task.state][task_id]
+        del self.sorted_ids[bisect_left(self.sorted_ids, task_id)]
+
+    def close(self) -> None:
+        self.backing.close()
+
+    def compact(self) -> bool:
+        # Not in a transaction, which would keep SQLite from running VACUUM
+        # and checkpointing; the rewritten files are then reloaded
+        compacted = self.backing.compact()
+        self.refresh()
+        return compacted
+
+    def disk_usage(self) -> int:
+        return self.backing.disk_usage()
+
+    def garbage_ratio(self) -> float:
+        return self.backing.garbage_ratio()
+
+    def verify(self) -> Dict[str, Optional[List[str]]]:
+        return self.backing.verify()
+
+    def version(self) -> object:
+        return self.backing.version()
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        with self.backing.transaction():
+            self.refresh()
+            yield
+            # Our own writes must not look like another process's
+            self.loaded_version = self.backing.version()
+
+    def records_completion_months(self) -> bool:
+        return self.backing.records_completion_months()
+
+    def get(self, task_id: str) -> Optional[Dict[str, str]]:
+        self.refresh()
+        task = self.tasks.get(task_id)
+        return task.to_dict() if task else None
+
+    def match_ids(self, prefix: str, limit: int) -> List[str]:
+        self.refresh()
+        matches = []
+        position = bisect_left(self.sorted_ids, prefix)
+        while position < len(self.sorted_ids) and len(matches) < limit:
+            task_id = self.sorted_ids[position]
+            if not task_id.startswith(prefix):
+                break
+            matches.append(task_id)
+            position += 1
+        return matches
+
+    def iterate(self, state: str) -> Iterator[Dict[str, str]]:
+        self.refresh()
+        for task_id in list(self.order[state]):
+            yield self.tasks[task_id].to_dict()
+
+    def select(self, state: str, query: TaskQuery) -> Iterator[Dict[str, str]]:
+        if query.has_completed_range():
+            # Completion months are not cached
+            return self.backing.select(state, query)
+        return super().select(state, query)
+
+    def put_many(self, tasks: List[Dict[str, str]]) -> None:
+        with self.transaction():
+            self.backing.put_many(tasks)
+            for task in tasks:
+                self.remember(task)
+
+    def update(self, task_id: str, fields: Dict[str, str]) -> bool:
+        with self.transaction():
+            if task_id not in self.tasks:
+                return False
+            self.backing.update(task_id, fields)
+            self.tasks[task_id] = Task.from_dict(dict(self.tasks[task_id].to_dict(), **fields))
+            return True
+
+    def append_notes(self, entries: List[Tuple[str, str, str]]) -> None:
+        # Note histories are not cached
+        with self.transaction():
+            self.backing.append_notes(entries)
+
+    def replace_notes(self, entries: List[Tuple[str, str, str]]) -> None:
+        with self.transaction():
+            self.backing.replace_notes(entries)
+
+    def notes(self, task_id: str, since: Optional[str] = None) -> Iterator[Tuple[str, str]]:
+        return self.backing.notes(task_id, since)
+
+    def delete_many(self, task_ids: Iterable[str]) -> int:
+        with self.transaction():
+            existing = [task_id for task_id in dict.fromkeys(task_ids) if task_id in self.tasks]
+            self.backing.delete_many(existing)
+            for task_id in existing:
+                self.forget(task_id)
+            return len(existing)
+
+    def move_state(self, task_id: str, state: str) -> Optional[Dict[str, str]]:
+        with self.transaction():
+            if task_id not in self.tasks:
+                return None
+            self.backing.move_state(task_id, state)
+            task = dict(self.tasks[task_id].to_dict(), state=state)
+            self.remember(task)
+            return task
+
+class StagedTaskStore(TaskStore):
+    """Collects changes in memory on top of another store until commit() writes them at once."""
+
+    def __init__(self, backing: TaskStore):
+        self.backing = backing
+        # Task ID -> staged version of every task looked at, or None if it does not exist
+        self.tasks = {}
+        # IDs of the staged tasks that changed, in order; a dict is used as an ordered set
+        self.changed = {}
+        # Staged (task ID, time, text) note entries
+        self.note_entries = []
+
+    def commit(self) -> int:
+        """Write every staged change to the backing store and return how many tasks changed."""
+        changes = {task_id: self.tasks[task_id] for task_id in self.changed}
+        # Notes of tasks deleted later on are dropped with them
+        note_entries = [entry for entry in self.note_entries if self.tasks.get(entry[0]) is not None]
+        with self.backing.transaction():
+            if changes:
+                self.backing.write_changes(changes)
+            if note_entries:
+                self.backing.append_notes(note_entries)
+        self.changed = {}
+        self.note_entries = []
+        return len(changes)
+
+    def lookup(self, task_id: str) -> Optional[Dict[str, str]]:
+        """Return the staged version of a task, reading it from the backing store the first time."""
+        if task_id not in self.tasks:
+            self.tasks[task_id] = self.backing.get(task_id)
+        return self.tasks[task_id]
+
+    def stage(self, task_id: str, task: Optional[Dict[str, str]]) -> None:
+        """Record the new version of a task, or None to delete it."""
+        self.tasks[task_id] = task
+        self.changed[task_id] = None
+
+    def get(self, task_id: str) -> Optional[Dict[str, str]]:
+        task = self.lookup(task_id)
+        return dict(task) if task else None
+
+    def match_ids(self, prefix: str, limit: int) -> List[str]:
+        staged = [task_id for task_id in self.changed if task_id.startswith(prefix)]
+        matches = set(self.backing.match_ids(prefix, limit + len(staged)))
+        for task_id in staged:
+            if self.tasks[task_id] is None:
+                matches.discard(task_id)
+            else:
+                matches.add(task_id)
+        return sorted(matches)[:limit]
+
+    def iterate(self, state: str) -> Iterator[Dict[str, str]]:
+        for task in self.backing.iterate(state):
+            if task['id'] not in self.changed:
+                yield task
+        for task_id in self.changed:
+            task = self.tasks[task_id]
+            if task is not None and task['state'] == state:
+                yield dict(task)
+
+    def put_many(self, tasks: List[Dict[str, str]]) -> None:
+        for task in tasks:
+            self.stage(task['id'], dict(task))
+
+    def update(self, task_id: str, fields: Dict[str, str]) -> bool:
+        task = self.lookup(task_id)
+        if task is None:
+            return False
+        self.stage(task_id, dict(task, **fields))
+        return True
+
+    def append_notes(self, entries: List[Tuple[str, str, str]]) -> None:
+        self.note_entries.extend(entries)
+
+    def notes(self, task_id: str, since: Optional[str] = None) -> Iterator[Tuple[str, str]]:
+        yield from self.backing.notes(task_id, since)
+        for entry_task_id, time, text in self.note_entries:
+            if entry_task_id == task_id and (since is None or time >= since):
+                yield time, text
+
+    def delete_many(self, task_ids: Iterable[str]) -> int:
+        count = 0
+        for task_id in task_ids:
+            if self.lookup(task_id) is not None:
+                self.stage(task_id, None)
+                count += 1
+        return count
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+per-task note history for the CSV backend
+
+The notes of each task are kept in their own append-only file,
+`notes/<task id>.log`, one JSON line per note:
+
+    {"time": "YYYY-MM-DD HH:MM", "text": "..."}
+
+Adding a note appends one line to one small file, whatever the size of the
+task files or the number of earlier notes. Notes are appended in time order,
+so reading the notes since some time binary-searches the file for the first
+one instead of reading it from the start.
+"""
+
+import os
+import json
+from pathlib import Path
+from typing import BinaryIO, Iterable, Iterator, List, Optional, Set, Tuple
+from urllib.parse import quote, unquote
+from journal import append_records
+
+# Directory of the note logs inside the data directory
+NOTES_DIR_NAME = 'notes'
+NOTE_LOG_SUFFIX = '.log'
+
+# A note entry: (timestamp as 'YYYY-MM-DD HH:MM', text)
+NoteEntry = Tuple[str, str]
+
+def parse_entry(line: bytes) -> Optional[NoteEntry]:
+    """Parse one note log line, or return None for a line torn by a crash."""
+    try:
+        entry = json.loads(line)
+        return entry['time'], entry['text']
+    except (ValueError, KeyError, TypeError):
+        return None
+
+def seek_since(file: BinaryIO, since: str) -> None:
+    """Position a note log at the first line written at or after `since`."""
+    low, high = 0, os.fstat(file.fileno()).st_size
+    while low < high:
+        middle = (low + high) // 2
+        # Start of the first line beginning at or after `middle`
+        file.seek(middle - 1 if middle else 0)
+        if middle:
+            file.readline()
+        entry = parse_entry(file.readline())
+        if entry is not None and entry[0] < since:
+            low = middle + 1
+        else:
+            high = middle
+
+    file.seek(low - 1 if low else 0)
+    if low:
+        file.readline()
+
+class NoteLogs:
+    """The note logs of every task in a data directory."""
+
+    def __init__(self, data_dir: Path):
+        self.notes_dir = data_dir / NOTES_DIR_NAME
+
+    def log_path(self, task_id: str) -> Path:
+        """Return the path of the note log of a task."""
+        # Task IDs are quoted so that they are always safe file names
+        return self.notes_dir / (quote(task_id, safe='') + NOTE_LOG_SUFFIX)
+
+    def task_ids(self) -> Set[str]:
+        """Return the IDs of the tasks that have notes."""
+        try:
+            names = os.listdir(self.notes_dir)
+        except FileNotFoundError:
+            return set()
+        return {unquote(name[:-len(NOTE_LOG_SUFFIX)]) for name in names if name.endswith(NOTE_LOG_SUFFIX)}
+
+    def append(self, task_id: str, entries: List[NoteEntry]) -> None:
+        """Durably append note entries to the log of a task."""
+        self.notes_dir.mkdir(exist_ok=True)
+        append_records(self.log_path(task_id), [{'time': time, 'text': text} for time, text in entries])
+
+    def read(self, task_id: str, since: Optional[str] = None) -> Iterator[NoteEntry]:
+        """Iterate over the note entries of a task in order, starting at `since` if given."""
+        try:
+            file = open(self.log_path(task_id), 'rb')
+        except FileNotFoundError:
+            return
+
+        with file:
+            if since is not None:
+                seek_since(file, since)
+            for line in file:
+                entry = parse_entry(line)
+                if entry is not None and (since is None or entry[0] >= since):
+                    yield entry
+
+    def delete(self, task_ids: Iterable[str]) -> None:
+        """Delete the note logs of tasks."""
+        for task_id in task_ids:
+            try:
+                self.log_path(task_id).unlink()
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+task filters for `ls`
+
+A TaskQuery holds the conditions given on the command line. Backends use
+its parts to narrow down the rows they read (an ID index range, SQL
+conditions, a substring check on raw CSV rows) and then check the tasks
+that remain with matches(). ID prefixes and creation times both select a
+range of IDs, since time-ordered IDs sort in creation order. Completion
+months select the completed segments of the CSV backend to read.
+"""
+
+import re
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+from ids import created_at, first_id_at
+
+# Sorts after every character, closing ID ranges
+MAX_CHAR = chr(0x10FFFF)
+
+# Timestamp prefix of the note lines written by the note command
+NOTE_TIMESTAMP = re.compile(r'^\[(\d{4}-\d{2}-\d{2} \d{2}:\d{2})\]', re.MULTILINE)
+
+def note_timestamps(note: str) -> List[str]:
+    """Return the timestamps of the note lines of a task, as 'YYYY-MM-DD HH:MM'."""
+    return NOTE_TIMESTAMP.findall(note)
+
+class TaskQuery:
+    """Conditions a task must meet to be listed; conditions left as None match every task.
+
+    Title and note conditions are case-sensitive substrings of the title and
+    of the note given when the task was created or of one of the notes added
+    to its history since. since and until are
+    'YYYY-MM-DD HH:MM' timestamps, and a task matches if one of its notes was
+    added between them, inclusive. created_since and created_until are
+    timestamps in the same format, which only tasks with time-ordered IDs can
+    match. completed_since and completed_until are 'YYYY-MM' months, checked by
+    backends that record when tasks were completed with matches_completed().
+    """
+
+    def __init__(self, title: Optional[str] = None, note: Optional[str] = None,
+                 id_prefix: Optional[str] = None, since: Optional[str] = None,
+                 until: Optional[str] = None, created_since: Optional[str] = None,
+                 created_until: Optional[str] = None, completed_since: Optional[str] = None,
+                 completed_until: Optional[str] = None):
+        self.title = title
+        self.note = note
+        self.id_prefix = id_prefix
+        self.since = since
+        self.until = until
+        self.created_since = created_since
+        self.created_until = created_until
+        self.completed_since = completed_since
+        self.completed_until = completed_until
+
+    def __bool__(self) -> bool:
+        return any(value is not None for value in
+                   (self.title, self.note, self.id_prefix, self.since, self.until,
+                    self.created_since, self.created_until, self.completed_since, self.completed_until))
+
+    def id_range(self) -> Optional[Tuple[str, str]]:
+        """Return the range [low, high) of the IDs of matching tasks, or None if
+        any ID can match."""
+        if self.id_prefix is None and self.created_since is None and self.created_until is None:
+            return None
+
+        low, high = '', MAX_CHAR
+        if self.id_prefix is not None:
+            low, high = self.id_prefix, self.id_prefix + MAX_CHAR
+        if self.created_since is not None:
+            low = max(low, first_id_at(datetime.strptime(self.created_since, "%Y-%m-%d %H:%M")))
+        if self.created_until is not None:
+            end = datetime.strptime(self.created_until, "%Y-%m-%d %H:%M") + timedelta(minutes=1)
+            high = min(high, first_id_at(end))
+        return low, high
+
+    def matches_created(self, task_id: str) -> bool:
+        """Check whether a task ID was created in the created_since/created_until range."""
+        if self.created_since is None and self.created_until is None:
+            return True
+        created = created_at(task_id)
+        if created is None:
+            return False
+        timestamp = created.strftime("%Y-%m-%d %H:%M")
+        return ((self.created_since is None or timestamp >= self.created_since)
+                and (self.created_until is None or timestamp <= self.created_until))
+
+    def has_completed_range(self) -> bool:
+        """Check whether the query selects tasks by the month they were completed in."""
+        return self.completed_since is not None or self.completed_until is not None
+
+    def matches_completed(self, month: Optional[str]) -> bool:
+        """Check whether a 'YYYY-MM' completion month is in the completed_since/completed_until
+        range; None stands for an unknown month before any other, or for active tasks."""
+        if month is None:
+            return self.completed_since is None
+        return ((self.completed_since is None or month >= self.completed_since)
+                and (self.completed_until is None or month <= self.completed_until))
+
+    def substrings(self, with_history: bool = False) -> List[str]:
+        """Return the substrings every matching row must contain; the note of a
+        task `with_history` need not contain the note text, its history may."""
+        return [text for text in (self.title, None if with_history else self.note) if text]
+
+    def in_range(self, timestamp: str) -> bool:
+        """Check whether a timestamp is in the since/until range."""
+        return ((self.since is None or timestamp >= self.since)
+                and (self.until is None or timestamp <= self.until))
+
+    def matches_timestamps(self, note: str, history: Iterable[str] = ()) -> bool:
+        """Check whether a note line, or a note history entry, was written in the
+        since/until range, given the history entry times in order."""
+        if self.since is None and self.until is None:
+            return True
+        # Notes written before the note history existed are lines of the task's note
+        if any(self.in_range(timestamp) for timestamp in note_timestamps(note)):
+            return True
+        for timestamp in history:
+            if self.until is not None and timestamp > self.until:
+                break
+            if self.in_range(timestamp):
+                return True
+        return False
+
+    def matches(self, task: Dict[str, str], history: Iterable[str] = (),
+                history_texts: Iterable[str] = ()) -> bool:
+        """Check whether a task meets every condition, given the times and the
+        texts of its note history, which are only read as needed."""
+        return ((self.id_prefix is None or task['id'].startswith(self.id_prefix))
+                and self.matches_created(task['id'])
+                and (self.title is None or self.title in task['title'])
+                and (self.note is None or self.note in task['note']
+                     or any(self.note in text for text in history_texts))
+                and self.matches_timestamps(task['note'], history))
+
+def parse_timestamp(value: str, end: bool = False) -> str:
+    """Normalize a 'YYYY-MM-DD' or 'YYYY-MM-DD HH:MM' command line value to
+    'YYYY-MM-DD HH:MM'; a bare date covers the whole day."""
+    value = value.strip()
+    try:
+        return datetime.strptime(value, "%Y-%m-%d %H:%M").strftime("%Y-%m-%d %H:%M")
+    except ValueError:
+        pass
+    try:
+        day = datetime.strptime(value, "%Y-%m-%d").strftime("%Y-%m-%d")
+        return day + (" 23:59" if end else " 00:00")
+    except ValueError:
+        pass
+    raise ValueError(f"Invalid timestamp '{value}', expected YYYY-MM-DD or 'YYYY-MM-DD HH:MM'")
+
+def parse_month(value: str) -> str:
+    """Normalize a 'YYYY-MM' command line value."""
+    try:
+        return datetime.strptime(value.strip(), "%Y-%m").strftime("%Y-%m")
+    except ValueError:
+        raise ValueError(f"Invalid month '{value}', expected YYYY-MM")
@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+full-text search over task titles and notes
+
+Each backend has an inverted index in a SQLite FTS5 database next to its
+storage (`search-<backend>.db`), kept up to date by IndexedTaskStore as tasks
+are created, updated, annotated and removed. Each note history entry is a
+document of its own, so adding a note indexes only the new text. Searches
+are answered from the index and ranked with BM25, titles weighing more than
+notes.
+
+The index is built from the store on the first search, and can be rebuilt
+with `task-tracker search --rebuild` if it ever falls behind, e.g. after the
+storage files were edited by hand.
+"""
+
+import sqlite3
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from store import TaskStore
+from query import TaskQuery
+from locking import LOCK_TIMEOUT
+
+# File name of the index inside the data directory, per backend
+SEARCH_FILE_NAME = 'search-{backend}.db'
+
+# BM25 weights of the title and note columns
+TITLE_WEIGHT = 2.0
+NOTE_WEIGHT = 1.0
+
+# Bumped whenever SCHEMA changes; older indexes are dropped and rebuilt
+SCHEMA_VERSION = 2
+
+# Each task has a 'task' document with its title and note, and a 'note'
+# document per entry of its note history
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS documents (
+    rowid INTEGER PRIMARY KEY,
+    id TEXT NOT NULL,
+    kind TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS documents_id ON documents (id, kind);
+CREATE VIRTUAL TABLE IF NOT EXISTS task_text USING fts5(title, note, tokenize = 'unicode61');
+INSERT INTO task_text (task_text, rank) VALUES ('rank', 'bm25({TITLE_WEIGHT}, {NOTE_WEIGHT})');
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+PRAGMA user_version = {SCHEMA_VERSION};
+"""
+
+def match_expression(text: str) -> str:
+    """Turn search words into an FTS5 query for tasks containing all of them;
+    a word ending in * matches every word starting with it."""
+    terms = []
+    for word in text.split():
+        prefix = word.endswith('*')
+        word = word.rstrip('*')
+        if word:
+            terms.append('"' + word.replace('"', '""') + '"' + ('*' if prefix else ''))
+    return ' '.join(terms)
+
+class SearchIndex:
+    """Inverted index of task titles and notes in a SQLite FTS5 database."""
+
+    def __init__(self, db_file: Path):
+        self.db_file = db_file
+        # Opened on first use, so commands that do not change tasks never touch it
+        self.connection = None
+
+    def connect(self) -> sqlite3.Connection:
+        """Return the connection to the index database, opening it if needed."""
+        if self.connection is None:
+            self.connection = sqlite3.connect(str(self.db_file), timeout=LOCK_TIMEOUT)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            if self.connection.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+                self.connection.executescript(
+                    "DROP TABLE IF EXISTS documents; DROP TABLE IF EXISTS task_text; DROP TABLE IF EXISTS meta;"
+                    + SCHEMA)
+        return self.connection
+
+    def close(self) -> None:
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def is_built(self) -> bool:
+        """Check whether the index has been built from the whole store."""
+        row = self.connect().execute("SELECT value FROM meta WHERE key = 'built'").fetchone()
+        return row is not None
+
+    def add_document(self, task_id: str, kind: str, title: str, note: str) -> None:
+        """Index one document of a task."""
+        rowid = self.connection.execute(
+            "INSERT INTO documents (id, kind) VALUES (?, ?)", (task_id, kind)).lastrowid
+        self.connection.execute(
+            "INSERT INTO task_text (rowid, title, note) VALUES (?, ?, ?)", (rowid, title, note))
+
+    def delete_documents(self, task_id: str, kinds: Tuple[str, ...]) -> None:
+        """Drop the documents of some kinds of a task."""
+        for kind in kinds:
+            rows = self.connection.execute(
+                "SELECT rowid FROM documents WHERE id = ? AND kind = ?", (task_id, kind)).fetchall()
+            for row in rows:
+                self.connection.execute("DELETE FROM task_text WHERE rowid = ?", (row[0],))
+                self.connection.execute("DELETE FROM documents WHERE rowid = ?", (row[0],))
+
+    def put_many(self, tasks: Iterable[Dict[str, str]]) -> None:
+        """Index or re-index the titles and notes of tasks."""
+        with self.connect():
+            for task in tasks:
+                self.delete_documents(task['id'], ('task',))
+                self.add_document(task['id'], 'task', task['title'], task['note'])
+
+    def add_notes(self, entries: Iterable[Tuple[str, str, str]]) -> None:
+        """Index (task ID, time, text) note history entries."""
+        with self.connect():
+            for task_id, _, text in entries:
+                self.add_document(task_id, 'note', '', text)
+
+    def replace_notes(self, entries: List[Tuple[str, str, str]]) -> None:
+        """Replace the indexed note histories of the tasks in (task ID, time, text) entries."""
+        with self.connect():
+            for task_id in dict.fromkeys(entry[0] for entry in entries):
+                self.delete_documents(task_id, ('note',))
+            for task_id, _, text in entries:
+                self.add_document(task_id, 'note', '', text)
+
+    def delete_many(self, task_ids: Iterable[str]) -> None:
+        """Drop tasks and their notes from the index."""
+        with self.connect():
+            for task_id in task_ids:
+                self.delete_documents(task_id, ('task', 'note'))
+
+    def rebuild(self, tasks: Iterable[Tuple[Dict[str, str], Iterable[Tuple[str, str]]]]) -> int:
+        """Replace the whole index with the given (task, note history) pairs and
+        return how many tasks were indexed."""
+        connection = self.connect()
+        count = 0
+        with connection:
+            connection.execute("DELETE FROM task_text")
+            connection.execute("DELETE FROM documents")
+            for task, notes in tasks:
+                self.add_document(task['id'], 'task', task['title'], task['note'])
+                for _, text in notes:
+                    self.add_document(task['id'], 'note', '', text)
+                count += 1
+            connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('built', '1')")
+        return count
+
+    def search(self, text: str, limit: int) -> List[Tuple[str, float]]:
+        """Return the (task ID, score) of the best matches for some words, best first.
+
+        A task is scored by its best matching document, so all words must
+        appear in its title and note or in a single note history entry.
+        """
+        expression = match_expression(text)
+        if not expression:
+            return []
+        # rank is the weighted bm25() score configured in SCHEMA
+        rows = self.connect().execute(
+            "SELECT documents.id, MIN(task_text.rank) AS score"
+            " FROM task_text JOIN documents ON documents.rowid = task_text.rowid"
+            " WHERE task_text MATCH ? GROUP BY documents.id ORDER BY score LIMIT ?",
+            (expression, limit))
+        # BM25 scores are negative, lower is better
+        return [(task_id, -score) for task_id, score in rows]
+
+class IndexedTaskStore(TaskStore):
+    """Keeps a search index up to date with the writes to another task store."""
+
+    def __init__(self, backing: TaskStore, index: SearchIndex):
+        self.backing = backing
+        self.index = index
+
+    def search(self, text: str, limit: int) -> List[Dict[str, str]]:
+        """Return the tasks best matching some words, best first, building the index if needed."""
+        if not self.index.is_built():
+            self.rebuild_index()
+        tasks = []
+        for task_id, _ in self.index.search(text, limit):
+            task = self.backing.get(task_id)
+            # Skip entries the index has not caught up with
+            if task is not None:
+                tasks.append(task)
+        return tasks
+
+    def rebuild_index(self) -> int:
+        """Rebuild the search index from every task in the store."""
+        with self.backing.transaction():
+            return self.index.rebuild((task, self.backing.notes(task['id']))
+                                      for state in ('O', 'X') for task in self.backing.iterate(state))
+
+    def reindex(self, task_id: str) -> None:
+        """Re-index a task after a change."""
+        task = self.backing.get(task_id)
+        if task is not None:
+            self.index.put_many([task])
+
+    def close(self) -> None:
+        self.index.close()
+        self.backing.close()
+
+    def compact(self) -> bool:
+        return self.backing.compact()
+
+    def disk_usage(self) -> int:
+        return self.backing.disk_usage()
+
+    def garbage_ratio(self) -> float:
+        return self.backing.garbage_ratio()
+
+    def verify(self) -> Dict[str, Optional[List[str]]]:
+        return self.backing.verify()
+
+    def version(self) -> object:
+        return self.backing.version()
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        with self.backing.transaction():
+            yield
+
+    @contextmanager
+    def bulk_load(self) -> Iterator[None]:
+        with self.backing.bulk_load():
+            yield
+
+    def records_completion_months(self) -> bool:
+        return self.backing.records_completion_months()
+
+    def get(self, task_id: str) -> Optional[Dict[str, str]]:
+        return self.backing.get(task_id)
+
+    def match_ids(self, prefix: str, limit: int) -> List[str]:
+        return self.backing.match_ids(prefix, limit)
+
+    def iterate(self, state: str) -> Iterator[Dict[str, str]]:
+        return self.backing.iterate(state)
+
+    def select(self, state: str, query: TaskQuery) -> Iterator[Dict[str, str]]:
+        return self.backing.select(state, query)
+
+    def page(self, state: str, offset: int = 0, limit: Optional[int] = None,
+             after: Optional[str] = None, query: Optional[TaskQuery] = None) -> Iterator[Dict[str, str]]:
+        return self.backing.page(state, offset, limit, after, query)
+
+    def put_many(self, tasks: List[Dict[str, str]]) -> None:
+        with self.transaction():
+            self.backing.put_many(tasks)
+            self.index.put_many(tasks)
+
+    def update(self, task_id: str, fields: Dict[str, str]) -> bool:
+        with self.transaction():
+            if not self.backing.update(task_id, fields):
+                return False
+            if 'title' in fields or 'note' in fields:
+                self.reindex(task_id)
+            return True
+
+    def append_notes(self, entries: List[Tuple[str, str, str]]) -> None:
+        with self.transaction():
+            self.backing.append_notes(entries)
+            self.index.add_notes(entries)
+
+    def replace_notes(self, entries: List[Tuple[str, str, str]]) -> None:
+        with self.transaction():
+            self.backing.replace_notes(entries)
+            self.index.replace_notes(entries)
+
+    def notes(self, task_id: str, since: Optional[str] = None) -> Iterator[Tuple[str, str]]:
+        return self.backing.notes(task_id, since)
+
+    def delete_many(self, task_ids: Iterable[str]) -> int:
+        task_ids = list(task_ids)
+        with self.transaction():
+            count = self.backing.delete_many(task_ids)
+            self.index.delete_many(task_ids)
+            return count
+
+    def write_changes(self, changes: Dict[str, Optional[Dict[str, str]]]) -> None:
+        with self.transaction():
+            self.backing.write_changes(changes)
+            self.index.put_many(task for task in changes.values() if task is not None)
+            self.index.delete_many(task_id for task_id, task in changes.items() if task is None)
+
+    def move_state(self, task_id: str, state: str) -> Optional[Dict[str, str]]:
+        # The indexed text does not depend on the state
+        return self.backing.move_state(task_id, state)
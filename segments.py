@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+monthly segments of the completed tasks
+
+Completed tasks are split into CSV files by the month they were completed
+in, `completed-YYYY-MM.csv`, each with its own ID index and snapshot. The
+manifest `segments.json` lists them in order:
+
+    {"segments": [{"file": "completed.csv", "month": null}, {"file": "completed-2026-10.csv", "month": "2026-10"}]}
+
+completed.csv comes first and holds the tasks completed before segments
+existed, whose month is unknown; without a manifest it is the only segment.
+
+Journal records that complete a task carry the month. A compaction appends
+newly completed tasks to the segment of their month, starting a new segment
+when a month begins, so segments of past months are sealed: they are only
+rewritten when the journal changes or removes one of their tasks. Listing the
+tasks completed in a range of months only opens the segments of those months.
+"""
+
+import json
+from datetime import datetime
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple
+
+MANIFEST_FILE_NAME = 'segments.json'
+SEGMENT_FILE_NAME = 'completed-{month}.csv'
+
+# A segment: (month as 'YYYY-MM' or None if unknown, path of its CSV file)
+Segment = Tuple[Optional[str], Path]
+
+def current_month() -> str:
+    """Return the current month as 'YYYY-MM'."""
+    return datetime.now().strftime("%Y-%m")
+
+def completion_month(record: Dict[str, Any]) -> str:
+    """Return the month of the journal record that completed a task; records
+    written before segments existed count as completed now."""
+    return record.get('at') or current_month()
+
+def segment_path(data_dir: Path, month: str) -> Path:
+    """Return the path of the segment of a month."""
+    return data_dir / SEGMENT_FILE_NAME.format(month=month)
+
+def write_manifest(file: BinaryIO, segments: List[Segment]) -> None:
+    """Write a manifest listing segments in order."""
+    entries = [{'file': path.name, 'month': month} for month, path in segments]
+    file.write(json.dumps({'segments': entries}).encode('utf-8'))
+
+class SegmentManifest:
+    """The segments of the completed tasks, reread only when the manifest changes."""
+
+    def __init__(self, data_dir: Path, base_path: Path):
+        self.path = data_dir / MANIFEST_FILE_NAME
+        self.data_dir = data_dir
+        self.base_path = base_path
+        self._signature = None
+        self._segments = [(None, base_path)]
+
+    def segments(self) -> List[Segment]:
+        """Return the segments in order, oldest first."""
+        try:
+            stat = self.path.stat()
+        except FileNotFoundError:
+            return [(None, self.base_path)]
+
+        signature = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        if signature != self._signature:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                entries = json.load(file)['segments']
+            self._segments = [(entry['month'], self.data_dir / entry['file']) for entry in entries]
+            self._signature = signature
+        return list(self._segments)
@@ -0,0 +1,415 @@
+#!/usr/bin/env python3
+"""
+slotted storage backend
+
+Tasks live in fixed-size slots of `tasks.slots`, an on-disk hash table: the
+slot of a task is found from a CRC32 of its ID with linear probing, so no
+index is needed and a change to a task rewrites only its slot. Completing a
+task or editing a short title is a single pwrite of the slot (plus the file
+header when the task moves to the end of another state's order).
+
+Titles and notes longer than a slot's inline space go to an append-only
+overflow file, `tasks.heap.<generation>`. The slot file grows by being
+rebuilt at twice the size once it is MAX_LOAD full; rebuilding, like
+compact(), also drops deleted slots and dead overflow data into a heap of
+the next generation, and the rename of the new slot file switches both at
+once. Note histories live in per-task logs as in the CSV backend.
+"""
+
+import os
+import struct
+import zlib
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from store import TaskStore
+from index import ID_WIDTH, index_key
+from notes import NoteLogs
+from fileio import atomic_write, fsync_dir
+from locking import LOCK_STATS_FILE_NAME, FileLock
+
+# File names inside the data directory
+SLOTS_FILE_NAME = 'tasks.slots'
+HEAP_FILE_NAME = 'tasks.heap.{generation}'
+SLOTS_LOCK_FILE_NAME = 'slots.lock'
+
+SLOTS_MAGIC = b'TTSLOT1\0'
+# magic, capacity in slots, next order number, used slots, deleted slots, heap generation
+HEADER = struct.Struct('>8sQQQQQ')
+
+# Bytes of a title or note kept in the slot itself
+INLINE_WIDTH = 92
+# state, order number, id, then title and note as (heap offset, length, inline bytes);
+# 256 bytes, so slots never straddle a disk sector
+SLOT = struct.Struct(f'>1s7xQ{ID_WIDTH}sQI{INLINE_WIDTH}sQI{INLINE_WIDTH}s')
+SLOT_SIZE = SLOT.size
+# The state and order number at the start of a slot
+SLOT_ORDER = struct.Struct('>1s7xQ')
+
+# Slot states besides the task states O and X
+FREE = b'\0'
+DELETED = b'-'
+
+# Overflow offsets start after the magic, so offset 0 means inline
+HEAP_MAGIC = b'TTHEAP1\0'
+
+INITIAL_CAPACITY = 1024
+# Fraction of used and deleted slots at which the slot file is rebuilt
+MAX_LOAD = 0.7
+# Slots read at a time while probing or scanning
+READ_SLOTS = 16
+SCAN_SLOTS = 4096
+
+# A title or note as stored in a slot: (heap offset or 0, length, inline bytes)
+Field = Tuple[int, int, bytes]
+
+def slot_offset(position: int) -> int:
+    """Return the byte offset of a slot; the header takes the place of slot 0."""
+    return (position + 1) * SLOT_SIZE
+
+def home_slot(key: bytes, capacity: int) -> int:
+    """Return the slot where probing for an ID key starts."""
+    return zlib.crc32(key) % capacity
+
+class SlotTaskStore(TaskStore):
+    """Task storage in a file of fixed-size slots addressed by task ID.
+
+    Writers serialize on an exclusive lock. Readers take no lock: every
+    write is a single pwrite of a slot or the header, and a rebuilt slot
+    file replaces the old one by a rename.
+    """
+
+    def __init__(self, data_dir: Path):
+        self.data_dir = data_dir
+        self.slots_file = data_dir / SLOTS_FILE_NAME
+        self.stats_file = data_dir / LOCK_STATS_FILE_NAME
+        self.note_logs = NoteLogs(data_dir)
+        self.write_lock = FileLock(data_dir / SLOTS_LOCK_FILE_NAME, stats_path=self.stats_file)
+        self.transaction_depth = 0
+        self.slots_fd = None
+        self.heap_fd = None
+        self.generation = None
+
+        if not self.slots_file.exists():
+            with self.transaction():
+                if not self.slots_file.exists():
+                    self.rebuild(INITIAL_CAPACITY)
+        self.reopen()
+
+    def heap_file(self, generation: int) -> Path:
+        """Return the path of the overflow file of a generation."""
+        return self.data_dir / HEAP_FILE_NAME.format(generation=generation)
+
+    def reopen(self) -> None:
+        """Open the slot file and its heap, again if a rebuild has replaced them."""
+        if self.slots_fd is not None and os.fstat(self.slots_fd).st_ino == os.stat(self.slots_file).st_ino:
+            return
+        while True:
+            self.close()
+            self.slots_fd = os.open(str(self.slots_file), os.O_RDWR)
+            self.generation = self.read_header()[4]
+            try:
+                self.heap_fd = os.open(str(self.heap_file(self.generation)), os.O_RDWR)
+                return
+            except FileNotFoundError:
+                # Another rebuild replaced the slot file since it was opened
+                continue
+
+    def close(self) -> None:
+        for fd in (self.slots_fd, self.heap_fd):
+            if fd is not None:
+                os.close(fd)
+        self.slots_fd = self.heap_fd = None
+
+    def read_header(self) -> List[int]:
+        """Return [capacity, next order number, used, deleted, heap generation]."""
+        magic, *header = HEADER.unpack(os.pread(self.slots_fd, HEADER.size, 0))
+        if magic != SLOTS_MAGIC:
+            raise ValueError(f"{self.slots_file} is not a task slot file")
+        return header
+
+    def write_header(self, header: List[int]) -> None:
+        os.pwrite(self.slots_fd, HEADER.pack(SLOTS_MAGIC, *header), 0)
+
+    def version(self) -> object:
+        stat = self.slots_file.stat()
+        return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        if self.transaction_depth == 0:
+            self.write_lock.acquire()
+        self.transaction_depth += 1
+        try:
+            if self.transaction_depth == 1 and self.slots_file.exists():
+                self.reopen()
+            yield
+        finally:
+            self.transaction_depth -= 1
+            if self.transaction_depth == 0:
+                self.write_lock.release()
+
+    def locate(self, key: bytes, capacity: int) -> Tuple[int, Optional[tuple]]:
+        """Find the slot of an ID key: (slot, its fields) if the task is stored,
+        else (the slot to store it in, None)."""
+        position = home_slot(key, capacity)
+        reusable = None
+        probed = 0
+        while probed < capacity:
+            count = min(READ_SLOTS, capacity - position)
+            data = os.pread(self.slots_fd, count * SLOT_SIZE, slot_offset(position))
+            for index in range(count):
+                slot = SLOT.unpack_from(data, index * SLOT_SIZE)
+                if slot[0] == FREE:
+                    return (position + index if reusable is None else reusable), None
+                if slot[0] == DELETED:
+                    if reusable is None:
+                        reusable = position + index
+                elif slot[2] == key:
+                    return position + index, slot
+            probed += count
+            position = (position + count) % capacity
+        return reusable, None
+
+    def read_field(self, offset: int, length: int, inline: bytes) -> str:
+        if offset == 0:
+            return inline[:length].decode('utf-8')
+        return os.pread(self.heap_fd, length, offset).decode('utf-8')
+
+    def write_field(self, text: str) -> Field:
+        """Encode a title or note for a slot, appending it to the heap if it does not fit inline."""
+        data = text.encode('utf-8')
+        if len(data) <= INLINE_WIDTH:
+            return 0, len(data), data
+        offset = os.lseek(self.heap_fd, 0, os.SEEK_END)
+        os.pwrite(self.heap_fd, data, offset)
+        return offset, len(data), b''
+
+    def decode(self, slot: tuple) -> Dict[str, str]:
+        """Turn the fields of a slot into a task."""
+        return {
+            'id': slot[2].rstrip(b'\0').decode('utf-8'),
+            'title': self.read_field(*slot[3:6]),
+            'state': slot[0].decode('ascii'),
+            'note': self.read_field(*slot[6:9]),
+        }
+
+    def get(self, task_id: str) -> Optional[Dict[str, str]]:
+        self.reopen()
+        _, slot = self.locate(index_key(task_id), self.read_header()[0])
+        return self.decode(slot) if slot else None
+
+    def scan(self) -> Iterator[tuple]:
+        """Yield the fields of every slot holding a task."""
+        capacity = self.read_header()[0]
+        for start in range(0, capacity, SCAN_SLOTS):
+            data = os.pread(self.slots_fd, min(SCAN_SLOTS, capacity - start) * SLOT_SIZE, slot_offset(start))
+            # The state bytes of all slots in the chunk, to skip empty slots without unpacking them
+            for index, state in enumerate(data[::SLOT_SIZE]):
+                if state not in b'\0-':
+                    yield SLOT.unpack_from(data, index * SLOT_SIZE)
+
+    def iterate(self, state: str) -> Iterator[Dict[str, str]]:
+        self.reopen()
+        code = state.encode('ascii')
+        slots = sorted((slot for slot in self.scan() if slot[0] == code), key=lambda slot: slot[1])
+        for slot in slots:
+            yield self.decode(slot)
+
+    def match_ids(self, prefix: str, limit: int) -> List[str]:
+        self.reopen()
+        key = prefix.encode('utf-8')
+        return sorted(slot[2].rstrip(b'\0').decode('utf-8') for slot in self.scan()
+                      if slot[2].startswith(key))[:limit]
+
+    def reserve(self, header: List[int], count: int) -> List[int]:
+        """Make room for `count` more tasks, rebuilding the slot file if it would get
+        too full, and return the current header."""
+        capacity, _, used, deleted, _ = header
+        if used + deleted + count <= capacity * MAX_LOAD:
+            return header
+        while (used + count) * 2 > capacity * MAX_LOAD:
+            capacity *= 2
+        self.rebuild(capacity)
+        self.reopen()
+        return self.read_header()
+
+    def write_slot(self, position: int, state: bytes, order: int, key: bytes,
+                   title: Field, note: Field) -> None:
+        os.pwrite(self.slots_fd, SLOT.pack(state, order, key, *title, *note), slot_offset(position))
+
+    def put_many(self, tasks: List[Dict[str, str]]) -> None:
+        # Every ID is checked before anything is written, so a bad one leaves the files as they were
+        keys = [index_key(task['id']) for task in tasks]
+        for task, key in zip(tasks, keys):
+            if len(key) > ID_WIDTH:
+                raise ValueError(f"Task ID longer than {ID_WIDTH} bytes: {task['id']}")
+
+        with self.transaction():
+            header = self.reserve(self.read_header(), len(tasks))
+            # Overflow data is made durable before any slot points to it
+            fields = [(self.write_field(task['title']), self.write_field(task['note'])) for task in tasks]
+            os.fsync(self.heap_fd)
+
+            for task, key, (title, note) in zip(tasks, keys, fields):
+                state = task['state'].encode('ascii')
+                position, slot = self.locate(key, header[0])
+                if slot is not None and slot[0] == state:
+                    order = slot[1]
+                else:
+                    # New tasks and tasks changing state go to the end of their state
+                    order = header[1]
+                    header[1] += 1
+                if slot is None:
+                    header[2] += 1
+                    if os.pread(self.slots_fd, 1, slot_offset(position)) == DELETED:
+                        header[3] -= 1
+                self.write_slot(position, state, order, key, title, note)
+            self.write_header(header)
+            os.fsync(self.slots_fd)
+
+    def update(self, task_id: str, fields: Dict[str, str]) -> bool:
+        with self.transaction():
+            key = index_key(task_id)
+            position, slot = self.locate(key, self.read_header()[0])
+            if slot is None:
+                return False
+            # Unchanged fields keep their encoding, so no overflow data is rewritten
+            title = self.write_field(fields['title']) if 'title' in fields else slot[3:6]
+            note = self.write_field(fields['note']) if 'note' in fields else slot[6:9]
+            state = fields['state'].encode('ascii') if 'state' in fields else slot[0]
+            if ('title' in fields and title[0]) or ('note' in fields and note[0]):
+                os.fsync(self.heap_fd)
+            self.write_slot(position, state, slot[1], key, title, note)
+            os.fsync(self.slots_fd)
+            return True
+
+    def move_state(self, task_id: str, state: str) -> Optional[Dict[str, str]]:
+        with self.transaction():
+            header = self.read_header()
+            position, slot = self.locate(index_key(task_id), header[0])
+            if slot is None:
+                return None
+            task = self.decode(slot)
+            if task['state'] != state:
+                os.pwrite(self.slots_fd, SLOT_ORDER.pack(state.encode('ascii'), header[1]), slot_offset(position))
+                header[1] += 1
+                self.write_header(header)
+                os.fsync(self.slots_fd)
+                task['state'] = state
+            return task
+
+    def append_notes(self, entries: List[Tuple[str, str, str]]) -> None:
+        entries_by_id = {}
+        for task_id, time, text in entries:
+            entries_by_id.setdefault(task_id, []).append((time, text))
+        with self.transaction():
+            for task_id, task_entries in entries_by_id.items():
+                self.note_logs.append(task_id, task_entries)
+
+    def replace_notes(self, entries: List[Tuple[str, str, str]]) -> None:
+        with self.transaction():
+            self.note_logs.delete({entry[0] for entry in entries})
+            self.append_notes(entries)
+
+    def notes(self, task_id: str, since: Optional[str] = None) -> Iterator[Tuple[str, str]]:
+        return self.note_logs.read(task_id, since)
+
+    def delete_many(self, task_ids: Iterable[str]) -> int:
+        with self.transaction():
+            header = self.read_header()
+            existing = []
+            for task_id in dict.fromkeys(task_ids):
+                position, slot = self.locate(index_key(task_id), header[0])
+                if slot is not None:
+                    os.pwrite(self.slots_fd, DELETED, slot_offset(position))
+                    existing.append(task_id)
+            if existing:
+                header[2] -= len(existing)
+                header[3] += len(existing)
+                self.write_header(header)
+                os.fsync(self.slots_fd)
+            self.note_logs.delete(existing)
+            return len(existing)
+
+    def disk_usage(self) -> int:
+        self.reopen()
+        # The free slots are a hole in the slot file, so count its allocated blocks
+        return sum(os.fstat(fd).st_blocks * 512 for fd in (self.slots_fd, self.heap_fd))
+
+    def garbage_ratio(self) -> float:
+        # Dead overflow data is only known by scanning, so count deleted slots
+        self.reopen()
+        _, _, used, deleted, _ = self.read_header()
+        return deleted / (used + deleted) if used + deleted else 0.0
+
+    def verify(self) -> Dict[str, Optional[List[str]]]:
+        self.reopen()
+        problems = []
+        capacity, _, used, _, _ = self.read_header()
+        size = os.fstat(self.slots_fd).st_size
+        if size != slot_offset(capacity):
+            problems.append(f"size is {size} bytes, expected {slot_offset(capacity)} for {capacity} slots")
+        stored = 0
+        heap_size = os.fstat(self.heap_fd).st_size
+        for slot in self.scan():
+            stored += 1
+            if slot[0] not in (b'O', b'X'):
+                problems.append(f"slot of {slot[2].rstrip(bytes(1))!r} has unknown state {slot[0]!r}")
+            for offset, length, _ in (slot[3:6], slot[6:9]):
+                if offset and offset + length > heap_size:
+                    problems.append(f"slot of {slot[2].rstrip(bytes(1))!r} points past the end of the heap")
+        if stored != used:
+            problems.append(f"{stored} slots hold tasks, the header says {used}")
+        return {self.slots_file.name: problems}
+
+    def compact(self) -> bool:
+        """Rebuild the slot file without deleted slots and the heap without dead data."""
+        with self.transaction():
+            capacity, _, used, _, _ = self.read_header()
+            # Shrink only while keeping the load well under MAX_LOAD
+            while capacity > INITIAL_CAPACITY and used * 4 < capacity * MAX_LOAD:
+                capacity //= 2
+            self.rebuild(capacity)
+            self.reopen()
+        return True
+
+    def rebuild(self, capacity: int) -> None:
+        """Write a new slot file of some capacity and a heap of the next generation
+        holding the current tasks, then switch to them with one rename."""
+        generation = self.generation + 1 if self.generation is not None else 0
+        # Free slots are tracked in memory, so slots are placed without reading the new file back
+        occupied = bytearray(capacity)
+        used = 0
+        next_order = 0
+
+        with atomic_write(self.slots_file) as file:
+            file.write(bytes(SLOT_SIZE))
+            # Free slots are a hole in the file
+            file.truncate(slot_offset(capacity))
+            with atomic_write(self.heap_file(generation)) as heap:
+                heap.write(HEAP_MAGIC)
+                for slot in (self.scan() if self.slots_fd is not None else ()):
+                    fields = []
+                    for offset, length, inline in (slot[3:6], slot[6:9]):
+                        if offset:
+                            fields += [heap.tell(), length, b'']
+                            heap.write(os.pread(self.heap_fd, length, offset))
+                        else:
+                            fields += [0, length, inline]
+                    position = home_slot(slot[2], capacity)
+                    while occupied[position]:
+                        position = (position + 1) % capacity
+                    occupied[position] = 1
+                    file.seek(slot_offset(position))
+                    file.write(SLOT.pack(slot[0], slot[1], slot[2], *fields))
+                    used += 1
+                    next_order = max(next_order, slot[1] + 1)
+            # The new heap must be in place before the slot file that points into it
+            fsync_dir(self.data_dir)
+            file.seek(0)
+            file.write(HEADER.pack(SLOTS_MAGIC, capacity, next_order, used, 0, generation))
+        fsync_dir(self.data_dir)
+
+        if self.generation is not None:
+            self.heap_file(self.generation).unlink()
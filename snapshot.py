@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+columnar snapshots of the task CSV files
+
+Each compaction also writes a `.snap` file next to each CSV file with the
+same tasks in a binary layout that loads without CSV parsing. Rows are
+stored in blocks of SNAPSHOT_BLOCK_ROWS; a block holds each TASK_FIELDS
+column as the lengths of its values followed by their UTF-8 text joined with
+NUL characters, so a whole column of a block is decoded and split at once.
+The lengths are only needed for values that contain NUL themselves. The file
+is memory-mapped and read a block at a time, keeping memory use flat.
+
+Like the ID index, a snapshot records the size and mtime of its CSV file and
+is ignored once the CSV file has changed; readers then parse the CSV file.
+"""
+
+import io
+import csv
+import mmap
+import struct
+from itertools import accumulate, repeat
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Union
+from data import TASK_FIELDS
+from compression import CorruptFileError, open_csv
+from index import check_changed
+
+SNAPSHOT_MAGIC = b'TTSNP1\n\0'
+# magic, size and mtime of the CSV file, number of rows, length of the blocks
+SNAPSHOT_HEADER = struct.Struct('>8sQQIQ')
+# Number of rows, then per column the byte length of its text
+BLOCK_HEADER = struct.Struct(f'>I{len(TASK_FIELDS)}I')
+
+# Rows per block; a block is decoded at once
+SNAPSHOT_BLOCK_ROWS = 4096
+
+class StaleSnapshotError(Exception):
+    """Raised when a snapshot is missing or out of date with its CSV file."""
+
+def snapshot_path(file_path: Path) -> Path:
+    """Return the path of the snapshot file for a CSV file."""
+    return file_path.with_suffix('.snap')
+
+class SnapshotWriter:
+    """Writes the snapshot of a CSV file from its tasks as they are written to it."""
+
+    def __init__(self, file: BinaryIO):
+        self.file = file
+        self.block = []
+        self.rows = 0
+        # The header is filled in by finish(), once the CSV file is complete
+        self.file.write(bytes(SNAPSHOT_HEADER.size))
+
+    def record(self, tasks: Iterable[Dict[str, str]]) -> Iterator[Dict[str, str]]:
+        """Pass tasks through, adding each to the snapshot."""
+        for task in tasks:
+            self.block.append(task)
+            if len(self.block) == SNAPSHOT_BLOCK_ROWS:
+                self.write_block()
+            yield task
+
+    def write_block(self) -> None:
+        """Write the buffered rows as one block."""
+        lengths = []
+        texts = []
+        for field in TASK_FIELDS:
+            # Short hand-edited CSV rows read as None
+            values = [task[field] or '' for task in self.block]
+            lengths.append(struct.pack(f'>{len(values)}I', *map(len, values)))
+            texts.append('\0'.join(values).encode('utf-8'))
+        self.file.write(BLOCK_HEADER.pack(len(self.block), *map(len, texts)))
+        for column_lengths, text in zip(lengths, texts):
+            self.file.write(column_lengths)
+            self.file.write(text)
+        self.rows += len(self.block)
+        self.block = []
+
+    def finish(self, csv_path: Path) -> None:
+        """Write the last block and the header, given the finished CSV file."""
+        if self.block:
+            self.write_block()
+        length = self.file.tell() - SNAPSHOT_HEADER.size
+        stat = csv_path.stat()
+        self.file.seek(0)
+        self.file.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, stat.st_size, stat.st_mtime_ns, self.rows, length))
+
+class Snapshot:
+    """Read-only view of the snapshot of a CSV file, iterating over its tasks."""
+
+    def __init__(self, file_path: Path):
+        try:
+            stat = file_path.stat()
+            with open(snapshot_path(file_path), 'rb') as file:
+                self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            raise StaleSnapshotError(f"No snapshot for {file_path}")
+
+        try:
+            magic, size, mtime_ns, rows, length = SNAPSHOT_HEADER.unpack_from(self._map)
+        except struct.error:
+            magic, size, mtime_ns, rows, length = b'', 0, 0, 0, 0
+        if (magic != SNAPSHOT_MAGIC or (size, mtime_ns) != (stat.st_size, stat.st_mtime_ns)
+                or len(self._map) != SNAPSHOT_HEADER.size + length):
+            self._map.close()
+            raise StaleSnapshotError(f"Snapshot for {file_path} is out of date")
+        self._rows = rows
+
+    def __enter__(self) -> 'Snapshot':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._map.close()
+
+    def __len__(self) -> int:
+        return self._rows
+
+    def read_block(self, position: int) -> List[List[str]]:
+        """Return the columns of the block at a byte position."""
+        count, *text_lengths = BLOCK_HEADER.unpack_from(self._map, position)
+        position += BLOCK_HEADER.size
+        columns = []
+        for text_length in text_lengths:
+            lengths_position = position
+            position += 4 * count
+            text = self._map[position:position + text_length].decode('utf-8')
+            position += text_length
+            values = text.split('\0')
+            if len(values) != count:
+                values = self.slice_values(text, lengths_position, count)
+            columns.append(values)
+        return columns
+
+    def slice_values(self, text: str, lengths_position: int, count: int) -> List[str]:
+        """Cut a column text into its values by their stored lengths."""
+        lengths = struct.unpack_from(f'>{count}I', self._map, lengths_position)
+        # Each value but the first is preceded by a separator
+        starts = [start + index for index, start in enumerate(accumulate((0,) + lengths[:-1]))]
+        return [text[start:start + length] for start, length in zip(starts, lengths)]
+
+    def block_positions(self) -> Iterator[int]:
+        """Yield the byte position of each block."""
+        position = SNAPSHOT_HEADER.size
+        while position < len(self._map):
+            yield position
+            count, *text_lengths = BLOCK_HEADER.unpack_from(self._map, position)
+            position += BLOCK_HEADER.size + 4 * count * len(text_lengths) + sum(text_lengths)
+
+    def __iter__(self) -> Iterator[Dict[str, str]]:
+        for position in self.block_positions():
+            yield from map(dict, map(zip, repeat(TASK_FIELDS), zip(*self.read_block(position))))
+
+class CsvRows:
+    """Iterates over the tasks of a CSV file by parsing it, for files without a fresh snapshot."""
+
+    def __init__(self, file_path: Path):
+        self._name = file_path.name
+        self._file = io.TextIOWrapper(open_csv(file_path), encoding='utf-8', newline='')
+
+    def __enter__(self) -> 'CsvRows':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._file.close()
+
+    def __iter__(self) -> Iterator[Dict[str, str]]:
+        try:
+            yield from csv.DictReader(self._file)
+        except (UnicodeDecodeError, csv.Error) as e:
+            raise CorruptFileError(f"{self._name} cannot be parsed: {e}")
+
+def open_rows(file_path: Path) -> Union[Snapshot, CsvRows]:
+    """Open the tasks of a CSV file for iteration, from its snapshot if it is up to date.
+
+    The result is a context manager; the rows stay readable after a
+    compaction replaces the files.
+    """
+    try:
+        return Snapshot(file_path)
+    except StaleSnapshotError:
+        # Snapshots are renamed into place with their CSV file, so the file
+        # may have been changed by something else
+        check_changed(file_path)
+        return CsvRows(file_path)
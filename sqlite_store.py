@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+SQLite storage backend
+
+All tasks live in a single table indexed on id and state, so point updates,
+deletes and state transitions are single-row statements. Note histories live
+in a second table indexed on task ID and time.
+"""
+
+import sqlite3
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from data import TASK_FIELDS
+from store import TaskStore
+from query import TaskQuery
+from ids import TIME_ID_LENGTH
+from locking import LOCK_TIMEOUT, LockTimeout
+
+# File name inside the data directory
+DB_FILE_NAME = 'tasks.db'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    seq INTEGER PRIMARY KEY,
+    id TEXT NOT NULL UNIQUE,
+    title TEXT NOT NULL,
+    state TEXT NOT NULL,
+    note TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS tasks_state ON tasks (state, seq);
+CREATE TABLE IF NOT EXISTS notes (
+    seq INTEGER PRIMARY KEY,
+    task_id TEXT NOT NULL,
+    time TEXT NOT NULL,
+    text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS notes_task ON notes (task_id, time);
+"""
+
+# Columns selected for tasks, in TASK_FIELDS order
+TASK_COLUMNS = ', '.join(TASK_FIELDS)
+
+# Moves a task to the end of the order of its new state
+NEXT_SEQ = "(SELECT MAX(seq) + 1 FROM tasks)"
+
+def add_query_conditions(query: TaskQuery, conditions: List[str], parameters: Dict[str, object]) -> None:
+    """Translate the conditions of a query into SQL conditions and their parameters."""
+    id_range = query.id_range()
+    if id_range is not None:
+        # ID prefixes and creation times are ranges on the unique ID index
+        conditions.append("id >= :id_low AND id < :id_high")
+        parameters['id_low'], parameters['id_high'] = id_range
+    if query.created_since is not None or query.created_until is not None:
+        # Only time-ordered IDs encode a creation time
+        conditions.append(f"length(id) = {TIME_ID_LENGTH}")
+    if query.title is not None:
+        conditions.append("instr(title, :title) > 0")
+        parameters['title'] = query.title
+    if query.note is not None:
+        conditions.append("(instr(note, :note) > 0 OR EXISTS (SELECT 1 FROM notes"
+                          " WHERE task_id = tasks.id AND instr(text, :note) > 0))")
+        parameters['note'] = query.note
+    if query.since is not None or query.until is not None:
+        conditions.append(
+            "(note_in_range(note, :since, :until) OR EXISTS (SELECT 1 FROM notes"
+            " WHERE task_id = tasks.id AND time >= coalesce(:since, '') AND time <= coalesce(:until, char(1114111))))")
+        parameters.update(since=query.since, until=query.until)
+
+def note_in_range(note: str, since: Optional[str], until: Optional[str]) -> bool:
+    """SQL function checking whether a note has a line written in a timestamp range,
+    for notes added before note histories existed."""
+    return TaskQuery(since=since, until=until).matches_timestamps(note)
+
+class SqliteTaskStore(TaskStore):
+    """Task storage in a SQLite database running in WAL mode.
+
+    Readers see a consistent snapshot without blocking writers, and writers
+    serialize on SQLite's own write lock, waiting up to LOCK_TIMEOUT for it.
+    """
+
+    def __init__(self, data_dir: Path):
+        self.db_file = data_dir / DB_FILE_NAME
+        self.wal_file = data_dir / (DB_FILE_NAME + '-wal')
+        # Transactions are managed explicitly, see transaction()
+        self.connection = sqlite3.connect(str(self.db_file), timeout=LOCK_TIMEOUT, isolation_level=None)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.create_function('note_in_range', 3, note_in_range, deterministic=True)
+        self.transaction_depth = 0
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def compact(self) -> bool:
+        """Rebuild the database without its free pages and checkpoint the
+        write-ahead log into the database file.
+
+        Neither can run inside a transaction. Readers keep reading their
+        snapshot while it runs; the part of the log a snapshot still needs
+        cannot be checkpointed, which is reported as an incomplete compaction.
+        """
+        if self.transaction_depth:
+            print(f"Error compacting {self.db_file}: not possible inside a transaction")
+            return False
+        if self.pragma('freelist_count'):
+            self.connection.execute("VACUUM")
+        busy, log_pages, checkpointed = self.connection.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+        if busy or checkpointed < log_pages:
+            print(f"Checkpoint of {self.wal_file.name} incomplete: {checkpointed} of {log_pages} pages "
+                  f"copied while readers hold a snapshot")
+            return False
+        return True
+
+    def verify(self) -> Dict[str, Optional[List[str]]]:
+        # SQLite checksums nothing itself; quick_check verifies the structure of every page
+        messages = [row[0] for row in self.connection.execute("PRAGMA quick_check")]
+        return {self.db_file.name: [] if messages == ['ok'] else messages}
+
+    def pragma(self, name: str) -> int:
+        """Return the value of an integer pragma."""
+        return self.connection.execute(f"PRAGMA {name}").fetchone()[0]
+
+    def disk_usage(self) -> int:
+        return sum(file_path.stat().st_size for file_path in (self.db_file, self.wal_file) if file_path.exists())
+
+    def garbage_ratio(self) -> float:
+        usage = self.disk_usage()
+        if not usage:
+            return 0.0
+        free_bytes = self.pragma('freelist_count') * self.pragma('page_size')
+        wal_bytes = self.wal_file.stat().st_size if self.wal_file.exists() else 0
+        return (free_bytes + wal_bytes) / usage
+
+    def version(self) -> object:
+        # data_version only changes when another connection commits
+        return self.connection.execute("PRAGMA data_version").fetchone()[0]
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        if self.transaction_depth == 0:
+            try:
+                self.connection.execute("BEGIN IMMEDIATE")
+            except sqlite3.OperationalError as e:
+                raise LockTimeout(f"Timed out waiting for {self.db_file}: {e}")
+        self.transaction_depth += 1
+        try:
+            yield
+        except BaseException:
+            self.transaction_depth -= 1
+            if self.transaction_depth == 0:
+                self.connection.execute("ROLLBACK")
+            raise
+        self.transaction_depth -= 1
+        if self.transaction_depth == 0:
+            self.connection.execute("COMMIT")
+
+    def get(self, task_id: str) -> Optional[Dict[str, str]]:
+        row = self.connection.execute(
+            f"SELECT {TASK_COLUMNS} FROM tasks WHERE id = ?", (task_id,)).fetchone()
+        return dict(row) if row else None
+
+    def match_ids(self, prefix: str, limit: int) -> List[str]:
+        rows = self.connection.execute(
+            "SELECT id FROM tasks WHERE id >= :prefix AND id < :prefix || char(1114111) ORDER BY id LIMIT :limit",
+            {'prefix': prefix, 'limit': limit})
+        return [row['id'] for row in rows]
+
+    def iterate(self, state: str) -> Iterator[Dict[str, str]]:
+        rows = self.connection.execute(
+            f"SELECT {TASK_COLUMNS} FROM tasks WHERE state = ? ORDER BY seq", (state,))
+        for row in rows:
+            yield dict(row)
+
+    def select(self, state: str, query: TaskQuery) -> Iterator[Dict[str, str]]:
+        return self.page(state, query=query)
+
+    def page(self, state: str, offset: int = 0, limit: Optional[int] = None,
+             after: Optional[str] = None, query: Optional[TaskQuery] = None) -> Iterator[Dict[str, str]]:
+        conditions = ["state = :state"]
+        parameters = {'state': state, 'offset': offset, 'limit': -1 if limit is None else limit}
+        if after is not None:
+            # Cursor pagination seeks the (state, seq) index instead of skipping rows
+            conditions.append("seq > (SELECT seq FROM tasks WHERE id = :after AND state = :state)")
+            parameters['after'] = after
+        if query:
+            add_query_conditions(query, conditions, parameters)
+
+        rows = self.connection.execute(
+            f"SELECT {TASK_COLUMNS} FROM tasks WHERE {' AND '.join(conditions)}"
+            " ORDER BY seq LIMIT :limit OFFSET :offset", parameters)
+        for row in rows:
+            yield dict(row)
+
+    def put_many(self, tasks: List[Dict[str, str]]) -> None:
+        with self.transaction():
+            self.connection.executemany(
+                f"INSERT INTO tasks ({TASK_COLUMNS}) VALUES (:id, :title, :state, :note)"
+                " ON CONFLICT (id) DO UPDATE SET"
+                " title = excluded.title, note = excluded.note, state = excluded.state,"
+                f" seq = CASE WHEN state = excluded.state THEN seq ELSE {NEXT_SEQ} END",
+                tasks)
+
+    def update(self, task_id: str, fields: Dict[str, str]) -> bool:
+        fields = {field: value for field, value in fields.items() if field in TASK_FIELDS}
+        if not fields:
+            return self.get(task_id) is not None
+
+        assignments = ', '.join(f"{field} = :{field}" for field in fields)
+        with self.transaction():
+            cursor = self.connection.execute(
+                f"UPDATE tasks SET {assignments} WHERE id = :task_id",
+                dict(fields, task_id=task_id))
+        return cursor.rowcount > 0
+
+    def append_notes(self, entries: List[Tuple[str, str, str]]) -> None:
+        with self.transaction():
+            self.connection.executemany("INSERT INTO notes (task_id, time, text) VALUES (?, ?, ?)", entries)
+
+    def replace_notes(self, entries: List[Tuple[str, str, str]]) -> None:
+        with self.transaction():
+            self.connection.executemany("DELETE FROM notes WHERE task_id = ?",
+                                        [(task_id,) for task_id in dict.fromkeys(entry[0] for entry in entries)])
+            self.append_notes(entries)
+
+    def notes(self, task_id: str, since: Optional[str] = None) -> Iterator[Tuple[str, str]]:
+        rows = self.connection.execute(
+            "SELECT time, text FROM notes WHERE task_id = ? AND time >= ? ORDER BY time, seq",
+            (task_id, since or ''))
+        for row in rows:
+            yield row['time'], row['text']
+
+    def delete_many(self, task_ids: Iterable[str]) -> int:
+        task_ids = [(task_id,) for task_id in task_ids]
+        with self.transaction():
+            cursor = self.connection.executemany("DELETE FROM tasks WHERE id = ?", task_ids)
+            count = cursor.rowcount
+            self.connection.executemany("DELETE FROM notes WHERE task_id = ?", task_ids)
+        return count
+
+    def move_state(self, task_id: str, state: str) -> Optional[Dict[str, str]]:
+        with self.transaction():
+            self.connection.execute(
+                f"UPDATE tasks SET state = :state, seq = {NEXT_SEQ}"
+                " WHERE id = :id AND state != :state",
+                {'id': task_id, 'state': state})
+        return self.get(task_id)
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+storage interface shared by all task backends
+
+Command functions only talk to a TaskStore, so backends can be swapped and
+benchmarked against each other without touching the command logic. A task is
+a dict with the TASK_FIELDS keys; its 'state' (O or X) says which part of the
+store it lives in. Notes added after a task was created are kept apart from
+the task as a history of (timestamp, text) entries.
+"""
+
+from contextlib import contextmanager
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from query import TaskQuery
+
+class TaskStore:
+    """Base class for task storage backends."""
+
+    def close(self) -> None:
+        """Release resources held by the store."""
+
+    def compact(self) -> bool:
+        """Reclaim space and fold pending writes into the main storage.
+
+        Returns False if it could not finish, after printing why.
+        """
+        return True
+
+    def disk_usage(self) -> int:
+        """Return the bytes the stored tasks take on disk, not counting note histories."""
+        return 0
+
+    def garbage_ratio(self) -> float:
+        """Estimate the fraction of disk_usage() that compact() would reclaim or fold away."""
+        return 0.0
+
+    def verify(self) -> Dict[str, Optional[List[str]]]:
+        """Check the stored files for corruption, mapping each file name to the
+        problems found in it, or to None if it cannot be checked."""
+        return {}
+
+    def version(self) -> object:
+        """Return a value that changes whenever the stored tasks may have changed."""
+        return None
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        """Make a sequence of reads and writes atomic with respect to other processes.
+
+        Single store operations are atomic on their own; a transaction is
+        needed when a command decides what to write based on what it read.
+        Transactions can be nested.
+        """
+        yield
+
+    @contextmanager
+    def bulk_load(self) -> Iterator[None]:
+        """Hold the store for a long run of writes, such as an import.
+
+        Works like a transaction; backends may put off maintenance work, like
+        compaction, until it ends.
+        """
+        with self.transaction():
+            yield
+
+    def records_completion_months(self) -> bool:
+        """Check whether the store records the month tasks were completed in,
+        which queries with completed_since/completed_until need."""
+        return False
+
+    def get(self, task_id: str) -> Optional[Dict[str, str]]:
+        """Return the task with an ID, or None if there is no such task."""
+        raise NotImplementedError
+
+    def match_ids(self, prefix: str, limit: int) -> List[str]:
+        """Return the IDs of tasks in any state that start with a prefix, in
+        sorted order, at most `limit` of them."""
+        return sorted(task['id'] for state in ('O', 'X') for task in self.iterate(state)
+                      if task['id'].startswith(prefix))[:limit]
+
+    def iterate(self, state: str) -> Iterator[Dict[str, str]]:
+        """Iterate over the tasks in a state, in the order they entered it."""
+        raise NotImplementedError
+
+    def select(self, state: str, query: TaskQuery) -> Iterator[Dict[str, str]]:
+        """Iterate over the tasks in a state that match a query, in order."""
+        return (task for task in self.iterate(state)
+                if query.matches(task, self.note_times(task['id'], query.since), self.note_texts(task['id'])))
+
+    def page(self, state: str, offset: int = 0, limit: Optional[int] = None,
+             after: Optional[str] = None, query: Optional[TaskQuery] = None) -> Iterator[Dict[str, str]]:
+        """Iterate over a page of the tasks in a state, or of those matching a
+        query: start just after the task with ID `after` if given (nothing if
+        it is not in the state), skip `offset` tasks and stop after `limit` tasks."""
+        if after is None:
+            tasks = self.select(state, query) if query else self.iterate(state)
+        elif query:
+            tasks = self.select_after(state, query, after)
+        else:
+            tasks = self.iterate(state)
+            for task in tasks:
+                if task['id'] == after:
+                    break
+            else:
+                return
+        yield from islice(tasks, offset, None if limit is None else offset + limit)
+
+    def select_after(self, state: str, query: TaskQuery, after: str) -> Iterator[Dict[str, str]]:
+        """Iterate over the tasks in a state that match a query and come after the
+        task with ID `after`, which need not match; nothing if it is not in the state."""
+        # Matching tasks come in the same order as all tasks, so one pass over
+        # all tasks tells which matching tasks come after `after`
+        order = (task['id'] for task in self.iterate(state))
+        passed = False
+        for task in self.select(state, query):
+            if not passed:
+                for task_id in order:
+                    if task_id == after:
+                        passed = True
+                    if task_id == task['id']:
+                        break
+                if not passed or task['id'] == after:
+                    continue
+            yield task
+
+    def put(self, task: Dict[str, str]) -> None:
+        """Insert a task, or replace the task with the same ID."""
+        self.put_many([task])
+
+    def put_many(self, tasks: List[Dict[str, str]]) -> None:
+        """Insert or replace several tasks in one write."""
+        raise NotImplementedError
+
+    def update(self, task_id: str, fields: Dict[str, str]) -> bool:
+        """Overwrite some fields of a task; return False if there is no such task."""
+        raise NotImplementedError
+
+    def append_note(self, task_id: str, time: str, text: str) -> bool:
+        """Add an entry to the note history of a task; return False if there is no such task."""
+        with self.transaction():
+            if self.get(task_id) is None:
+                return False
+            self.append_notes([(task_id, time, text)])
+            return True
+
+    def append_notes(self, entries: List[Tuple[str, str, str]]) -> None:
+        """Add (task ID, time, text) entries to the note histories of existing tasks in one write."""
+        raise NotImplementedError
+
+    def replace_notes(self, entries: List[Tuple[str, str, str]]) -> None:
+        """Replace the note histories of the tasks in (task ID, time, text) entries,
+        given in time order per task, in one write."""
+        raise NotImplementedError
+
+    def notes(self, task_id: str, since: Optional[str] = None) -> Iterator[Tuple[str, str]]:
+        """Iterate over the (time, text) note entries of a task in the order they
+        were added, from the first one added at or after `since` if given."""
+        raise NotImplementedError
+
+    def note_times(self, task_id: str, since: Optional[str] = None) -> Iterator[str]:
+        """Iterate over the times of the note entries of a task, read only as needed."""
+        for time, _ in self.notes(task_id, since):
+            yield time
+
+    def note_texts(self, task_id: str) -> Iterator[str]:
+        """Iterate over the texts of the note entries of a task, read only as needed."""
+        for _, text in self.notes(task_id):
+            yield text
+
+    def delete(self, task_id: str) -> bool:
+        """Delete a task; return False if there is no such task."""
+        return self.delete_many([task_id]) == 1
+
+    def delete_many(self, task_ids: Iterable[str]) -> int:
+        """Delete several tasks in one write and return how many existed."""
+        raise NotImplementedError
+
+    def write_changes(self, changes: Dict[str, Optional[Dict[str, str]]]) -> None:
+        """Apply a set of changes in one write: each task ID maps to its new
+        version, or to None if the task is deleted."""
+        with self.transaction():
+            self.put_many([task for task in changes.values() if task is not None])
+            self.delete_many([task_id for task_id, task in changes.items() if task is None])
+
+    def move_state(self, task_id: str, state: str) -> Optional[Dict[str, str]]:
+        """Move a task to another state and return it, or None if there is no such task."""
+        task = self.get(task_id)
+        if task is None:
+            return None
+        task['state'] = state
+        self.put(task)
+        return task
@@ -6,233 +6,522 @@ A simple command line tool for task tracking with the following features:
 - Task properties: id, title, state, note (all strings)
 - States: O (open), X (completed)
 - Commands: c (create), rm (remove), upd (update), done (complete), note (add note)
-- Storage: CSV files (active.csv for open tasks, completed.csv for completed tasks)
+- Storage: CSV files (active.csv for open tasks, monthly segments for completed tasks),
+  a SQLite database (tasks.db) selected with --backend sqlite, or a file of
+  fixed-size slots (tasks.slots) selected with --backend slots
+- Full-text search over titles and notes (search)
+- Bulk import and export as CSV or JSON lines (import, export)
+- Compressed archives of the completed tasks of past months (archive)
+- Compaction on demand (compact) or in the background of the daemon
+- Integrity checks of the stored files against block checksums (fsck)
 """
 
+import io
 import os
 import sys
-import csv
-import uuid
+import time
+import shlex
 import argparse
+from contextlib import redirect_stderr, redirect_stdout
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Optional, Any
-from utils import display_tasks
-from data import TASK_FIELDS
+from typing import Dict, Iterable, List, Optional, Any, Tuple
+from utils import display_tasks, display_tasks_plain, display_lock_stats, display_segment_stats, format_size
+from locking import LOCK_STATS_FILE_NAME, LockTimeout, summarize_stats
+from store import TaskStore
+from query import TaskQuery, parse_month, parse_timestamp
+from ids import new_id
+from csv_store import CsvTaskStore
+from compression import CODECS, CorruptFileError
+from sqlite_store import SqliteTaskStore
+from slot_store import SlotTaskStore
+from memory_store import MemoryTaskStore, StagedTaskStore
+from search import SEARCH_FILE_NAME, IndexedTaskStore, SearchIndex
+from transfer import CHUNK_SIZE, TRANSFER_FORMATS, detect_format, export_tasks, import_tasks
+from daemon import SOCKET_FILE_NAME, forward_command, serve
 
-# File paths for storage
+# Directory holding the task storage files
 DATA_DIR = Path.home() / '.vsz-clap'
-ACTIVE_TASKS_FILE = DATA_DIR / 'active.csv'
-COMPLETED_TASKS_FILE = DATA_DIR / 'completed.csv'
 
-def ensure_data_dir() -> None:
-    """Ensure the data directory exists."""
-    DATA_DIR.mkdir(parents=True, exist_ok=True)
+# Storage backends, selected with --backend or TASK_TRACKER_BACKEND
+BACKENDS = {
+    'csv': CsvTaskStore,
+    'sqlite': SqliteTaskStore,
+    'slots': SlotTaskStore,
+}
+DEFAULT_BACKEND = os.environ.get('TASK_TRACKER_BACKEND', 'csv')
 
-def ensure_files_exist() -> None:
-    """Ensure CSV files exist with headers."""
-    ensure_data_dir()
-    
-    for file_path in [ACTIVE_TASKS_FILE, COMPLETED_TASKS_FILE]:
-        if not file_path.exists():
-            with open(file_path, 'w', newline='') as file:
-                writer = csv.DictWriter(file, fieldnames=TASK_FIELDS)
-                writer.writeheader()
-
-def read_tasks(file_path: Path) -> List[Dict[str, str]]:
-    """Read tasks from CSV file."""
-    if not file_path.exists():
-        return []
-    
+# Errors that fail a command: the store is locked, damaged or cannot be written
+STORE_ERRORS = (LockTimeout, CorruptFileError, OSError)
+
+# Commands a running daemon executes on behalf of the CLI
+DAEMON_COMMANDS = {'c', 'rm', 'upd', 'done', 'note', 'show', 'ls'}
+
+# Commands that take a task ID, which may be given as a unique prefix
+TASK_ID_COMMANDS = {'rm', 'upd', 'done', 'note', 'show'}
+
+# Candidates listed when a task ID prefix is ambiguous
+AMBIGUOUS_ID_CANDIDATES = 5
+
+# Commands accepted on the lines of a batch
+BATCH_COMMANDS = {'c', 'rm', 'upd', 'done', 'note'}
+
+def non_negative_int(value: str) -> int:
+    """Parse a command line count that must not be negative."""
+    number = int(value)
+    if number < 0:
+        raise argparse.ArgumentTypeError(f"must not be negative: {value}")
+    return number
+
+def positive_int(value: str) -> int:
+    """Parse a command line count that must be at least 1."""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1: {value}")
+    return number
+
+def since_timestamp(value: str) -> str:
+    """Parse the start of a note timestamp range from the command line."""
     try:
-        with open(file_path, 'r', newline='') as file:
-            reader = csv.DictReader(file)
-            return list(reader)
-    except Exception as e:
-        print(f"Error reading tasks from {file_path}: {e}")
-        return []
-
-def write_tasks(file_path: Path, tasks: List[Dict[str, str]]) -> None:
-    """Write tasks to CSV file."""
+        return parse_timestamp(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+def until_timestamp(value: str) -> str:
+    """Parse the end of a note timestamp range from the command line."""
+    try:
+        return parse_timestamp(value, end=True)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+def month_value(value: str) -> str:
+    """Parse a 'YYYY-MM' month from the command line."""
     try:
-        with open(file_path, 'w', newline='') as file:
-            writer = csv.DictWriter(file, fieldnames=TASK_FIELDS)
-            writer.writeheader()
-            writer.writerows(tasks)
-    except Exception as e:
-        print(f"Error writing tasks to {file_path}: {e}")
-
-def create_task(title: str, note: str = "") -> None:
+        return parse_month(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+def garbage_ratio(value: str) -> float:
+    """Parse a fraction of the store from the command line."""
+    ratio = float(value)
+    if not 0 <= ratio <= 1:
+        raise argparse.ArgumentTypeError(f"must be between 0 and 1: {value}")
+    return ratio
+
+def ensure_data_dir(data_dir: Path = DATA_DIR) -> None:
+    """Ensure the data directory exists."""
+    data_dir.mkdir(parents=True, exist_ok=True)
+
+def open_store(backend: str, data_dir: Path = DATA_DIR) -> TaskStore:
+    """Open the task store of a storage backend, with its search index."""
+    ensure_data_dir(data_dir)
+    index = SearchIndex(data_dir / SEARCH_FILE_NAME.format(backend=backend))
+    return IndexedTaskStore(BACKENDS[backend](data_dir), index)
+
+def resolve_task_id(store: TaskStore, task_id: str) -> Optional[str]:
+    """Resolve a task ID or a unique prefix of one to the full ID.
+
+    An ID that matches nothing is returned as given, so the command reports
+    the missing task; an ambiguous prefix is reported here and gives None.
+    """
+    if store.get(task_id) is not None:
+        return task_id
+
+    matches = store.match_ids(task_id, AMBIGUOUS_ID_CANDIDATES + 1)
+    if not matches:
+        return task_id
+    if len(matches) == 1:
+        return matches[0]
+
+    candidates = ", ".join(matches[:AMBIGUOUS_ID_CANDIDATES])
+    more = ", ..." if len(matches) > AMBIGUOUS_ID_CANDIDATES else ""
+    print(f"Error: ID prefix '{task_id}' is ambiguous, it matches {candidates}{more}")
+    return None
+
+def create_task(store: TaskStore, title: str, note: str = "") -> None:
     """Create a new task."""
     # Validate required title
     if not title.strip():
         print("Error: Title is required")
         return
         
-    task = {
-        'id': str(uuid.uuid4())[:8],  # Using shortened UUID for better readability
-        'title': title,
-        'state': 'O',  # New tasks are always open
-        'note': note
-    }
-
-    tasks = read_tasks(ACTIVE_TASKS_FILE)
-    tasks.append(task)
-    write_tasks(ACTIVE_TASKS_FILE, tasks)
-    
+    with store.transaction():
+        # IDs are checked against the store, so an unlucky random ID is never reused
+        task_id = new_id()
+        while store.get(task_id) is not None:
+            task_id = new_id()
+
+        task = {
+            'id': task_id,
+            'title': title,
+            'state': 'O',  # New tasks are always open
+            'note': note
+        }
+        store.put(task)
+
     print(f"Task created with ID: {task['id']}")
 
-def remove_task(task_id: str) -> None:
+def remove_task(store: TaskStore, task_id: str) -> None:
     """Remove a task by ID."""
-    # Try to remove from active tasks
-    active_tasks = read_tasks(ACTIVE_TASKS_FILE)
-    initial_active_count = len(active_tasks)
-    active_tasks = [task for task in active_tasks if task['id'] != task_id]
-    
-    if len(active_tasks) < initial_active_count:
-        write_tasks(ACTIVE_TASKS_FILE, active_tasks)
-        print(f"Task {task_id} has been removed.")
-        return
-    
-    # If not found in active tasks, try completed tasks
-    completed_tasks = read_tasks(COMPLETED_TASKS_FILE)
-    initial_completed_count = len(completed_tasks)
-    completed_tasks = [task for task in completed_tasks if task['id'] != task_id]
-    
-    if len(completed_tasks) < initial_completed_count:
-        write_tasks(COMPLETED_TASKS_FILE, completed_tasks)
+    if store.delete(task_id):
         print(f"Task {task_id} has been removed.")
-        return
-    
-    print(f"No task found with ID: {task_id}")
+    else:
+        print(f"No task found with ID: {task_id}")
 
-def update_task(task_id: str, title: Optional[str] = None, note: Optional[str] = None) -> None:
+def update_task(store: TaskStore, task_id: str, title: Optional[str] = None, note: Optional[str] = None) -> None:
     """Update a task by ID."""
-    # Try to update in active tasks
-    active_tasks = read_tasks(ACTIVE_TASKS_FILE)
-    
-    for task in active_tasks:
-        if task['id'] == task_id:
-            if title is not None:
-                task['title'] = title
-            if note is not None:
-                task['note'] = note
-            write_tasks(ACTIVE_TASKS_FILE, active_tasks)
-            print(f"Task {task_id} has been updated.")
-            return
-    
-    # Try to update in completed tasks
-    completed_tasks = read_tasks(COMPLETED_TASKS_FILE)
-    
-    for task in completed_tasks:
-        if task['id'] == task_id:
-            if title is not None:
-                task['title'] = title
-            if note is not None:
-                task['note'] = note
-            write_tasks(COMPLETED_TASKS_FILE, completed_tasks)
-            print(f"Task {task_id} has been updated.")
-            return
-    
-    print(f"No task found with ID: {task_id}")
+    fields = {}
+    if title is not None:
+        fields['title'] = title
+    if note is not None:
+        fields['note'] = note
+
+    if store.update(task_id, fields):
+        print(f"Task {task_id} has been updated.")
+    else:
+        print(f"No task found with ID: {task_id}")
 
-def add_note(task_id: str, additional_note: str) -> None:
-    """Add a note to an existing task, preserving previous notes."""
-    if not additional_note.strip():
+def add_note(store: TaskStore, task_id: str, additional_note: Optional[str]) -> None:
+    """Add a timestamped note to the note history of an existing task."""
+    if additional_note is None or not additional_note.strip():
         print("Error: Note content is required")
         return
-        
-    # Format with timestamp
+
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M")
-    formatted_note = f"[{timestamp}] {additional_note}"
-    
-    # Try to find in active tasks
-    active_tasks = read_tasks(ACTIVE_TASKS_FILE)
-    
-    for task in active_tasks:
-        if task['id'] == task_id:
-            # Add to existing note or set as new note
-            current_note = task['note'].strip()
-            if current_note:
-                task['note'] = f"{current_note}\n{formatted_note}"
-            else:
-                task['note'] = formatted_note
-            
-            write_tasks(ACTIVE_TASKS_FILE, active_tasks)
-            print(f"Note added to task {task_id}.")
-            return
-    
-    # Try to find in completed tasks
-    completed_tasks = read_tasks(COMPLETED_TASKS_FILE)
-    
-    for task in completed_tasks:
-        if task['id'] == task_id:
-            # Add to existing note or set as new note
-            current_note = task['note'].strip()
-            if current_note:
-                task['note'] = f"{current_note}\n{formatted_note}"
-            else:
-                task['note'] = formatted_note
-                
-            write_tasks(COMPLETED_TASKS_FILE, completed_tasks)
-            print(f"Note added to task {task_id}.")
-            return
-    
-    print(f"No task found with ID: {task_id}")
 
-def complete_task(task_id: str) -> None:
-    """Mark a task as completed."""
-    # Find the task in active tasks
-    active_tasks = read_tasks(ACTIVE_TASKS_FILE)
-    completed_task = None
-    
-    for i, task in enumerate(active_tasks):
-        if task['id'] == task_id:
-            completed_task = task
-            completed_task['state'] = 'X'
-            active_tasks.pop(i)
-            break
-    
-    if completed_task is None:
-        print(f"No active task found with ID: {task_id}")
+    if store.append_note(task_id, timestamp, additional_note):
+        print(f"Note added to task {task_id}.")
+    else:
+        print(f"No task found with ID: {task_id}")
+
+def list_notes(store: TaskStore, task_id: str, since: Optional[str] = None) -> None:
+    """List the note history of a task, optionally only the notes added since a time."""
+    if store.get(task_id) is None:
+        print(f"No task found with ID: {task_id}")
         return
-    
-    # Write updated active tasks
-    write_tasks(ACTIVE_TASKS_FILE, active_tasks)
-    
-    # Add to completed tasks
-    completed_tasks = read_tasks(COMPLETED_TASKS_FILE)
-    completed_tasks.append(completed_task)
-    write_tasks(COMPLETED_TASKS_FILE, completed_tasks)
+
+    count = 0
+    for timestamp, text in store.notes(task_id, since):
+        print(f"[{timestamp}] {text}")
+        count += 1
+    if count == 0:
+        print("No notes found.")
+
+def complete_task(store: TaskStore, task_id: str) -> None:
+    """Mark a task as completed."""
+    with store.transaction():
+        # Find the task in active tasks
+        task = store.get(task_id)
+
+        if task is None or task['state'] != 'O':
+            print(f"No active task found with ID: {task_id}")
+            return
+
+        store.move_state(task_id, 'X')
     
     print(f"Task {task_id} has been marked as completed.")
 
-def list_tasks(show_completed: bool = False) -> None:
-    """List tasks."""
-    file_path = COMPLETED_TASKS_FILE if show_completed else ACTIVE_TASKS_FILE
-    tasks = read_tasks(file_path)
-    
+def list_tasks(store: TaskStore, show_completed: bool = False, output_format: str = 'grid',
+               offset: int = 0, limit: Optional[int] = None, after: Optional[str] = None,
+               query: Optional[TaskQuery] = None) -> None:
+    """List tasks, or a page of them, optionally only those matching a query."""
+    tasks = store.page('X' if show_completed else 'O', offset, limit, after, query)
+
     print(f"\n--- {'COMPLETED' if show_completed else 'ACTIVE'} TASKS ---")
-    display_tasks(tasks)
+    if output_format == 'plain':
+        display_tasks_plain(tasks)
+    else:
+        display_tasks(list(tasks))
 
-def show_task(task_id: str) -> None:
+def show_task(store: TaskStore, task_id: str) -> None:
     """Show task details."""
-    file_path = ACTIVE_TASKS_FILE
-    tasks = read_tasks(file_path)
-    task = next((t for t in tasks if t.get("id") == task_id), None)
+    task = store.get(task_id)
 
-    if task:
+    if task and task['state'] == 'O':
         display_tasks([task])
+        for timestamp, text in store.notes(task_id):
+            print(f"[{timestamp}] {text}")
     else:
         print(f"No active task found with ID: {task_id}")
 
-def main() -> None:
-    """Main CLI entry point."""
-    # Ensure data files exist
-    ensure_files_exist()
-    
+def search_tasks(store: IndexedTaskStore, words: List[str], limit: int = 20, rebuild: bool = False) -> None:
+    """Search task titles and notes, showing the best matches first."""
+    if rebuild:
+        count = store.rebuild_index()
+        print(f"Search index rebuilt with {count} tasks.")
+        if not words:
+            return
+
+    if not words:
+        print("Error: Search words are required")
+        return
+
+    display_tasks(store.search(" ".join(words), limit))
+
+def migrate_tasks(source_backend: str, target_backend: str) -> None:
+    """Copy every task from one storage backend to another."""
+    if source_backend == target_backend:
+        # The tasks would be written back over themselves, with their note histories doubled
+        print(f"Error: Cannot migrate the {source_backend} backend to itself")
+        return
+
+    source = open_store(source_backend)
+    target = open_store(target_backend)
+
+    count = 0
+    try:
+        for state in ['O', 'X']:
+            tasks = list(source.iterate(state))
+            with target.transaction():
+                target.put_many(tasks)
+                # Replaced rather than appended, so that migrating again does not repeat them
+                target.replace_notes([(task['id'], timestamp, text) for task in tasks
+                                      for timestamp, text in source.notes(task['id'])])
+            count += len(tasks)
+    finally:
+        source.close()
+        target.close()
+
+    print(f"Migrated {count} tasks from {source_backend} to {target_backend}.")
+
+def transfer_rate(count: int, elapsed: float) -> str:
+    """Describe how long a bulk transfer took and its throughput."""
+    rate = count / elapsed if elapsed > 0 else 0
+    return f"in {elapsed:.2f}s ({rate:.0f} tasks/s)"
+
+def import_file(store: TaskStore, file_name: str, file_format: Optional[str] = None,
+                chunk_size: int = CHUNK_SIZE) -> None:
+    """Import tasks from a CSV or JSON lines file, or stdin, reporting throughput."""
+    file_format = detect_format(file_name, file_format)
+    started = time.perf_counter()
+    try:
+        if file_name == "-":
+            written, duplicates, rejected = import_tasks(store, sys.stdin, file_format, chunk_size)
+        else:
+            with open(file_name, 'r', newline='', encoding='utf-8') as file:
+                written, duplicates, rejected = import_tasks(store, file, file_format, chunk_size)
+    except (OSError, UnicodeDecodeError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    elapsed = time.perf_counter() - started
+
+    print(f"Imported {written} tasks {transfer_rate(written, elapsed)}; "
+          f"skipped {duplicates} duplicate and {rejected} invalid records.")
+
+def export_file(store: TaskStore, file_name: str, file_format: Optional[str] = None) -> None:
+    """Export every task to a CSV or JSON lines file, or stdout, reporting throughput."""
+    file_format = detect_format(file_name, file_format)
+    started = time.perf_counter()
+    try:
+        if file_name == "-":
+            count = export_tasks(store, sys.stdout, file_format)
+        else:
+            with open(file_name, 'w', newline='', encoding='utf-8') as file:
+                count = export_tasks(store, file, file_format)
+    except OSError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    elapsed = time.perf_counter() - started
+
+    # Keep the summary out of exported data written to stdout
+    summary = sys.stderr if file_name == "-" else sys.stdout
+    print(f"Exported {count} tasks {transfer_rate(count, elapsed)}.", file=summary)
+
+def parse_batch_line(parser: argparse.ArgumentParser, line: str) -> Optional[argparse.Namespace]:
+    """Parse one batch line into command arguments, printing why it is rejected."""
+    try:
+        args = parse_command(parser, shlex.split(line))
+    except ValueError as e:
+        print(f"Error: {e}")
+        return None
+    except SystemExit:
+        # argparse has already printed the error
+        return None
+
+    if args.command not in BATCH_COMMANDS:
+        print(f"Error: '{args.command}' cannot be used in a batch")
+        return None
+    return args
+
+def run_batch(store: TaskStore, lines: Iterable[str]) -> None:
+    """Run one command per line against an in-memory copy of the store, then commit
+    all changes in a single write, reporting the result of each line.
+
+    The input is read and staged before the write lock is taken, so a slow
+    writer on stdin does not hold up other processes. If another process
+    changed the store meanwhile, the lines are staged again under the lock.
+    """
+    lines = list(lines)
+    version = store.version()
+    staged, results, executed = stage_batch(store, lines)
+    with store.transaction():
+        if store.version() != version:
+            staged, results, executed = stage_batch(store, lines)
+        changed = staged.commit()
+
+    for line_number, message in results:
+        print(f"{line_number}: {message}")
+    print(f"Batch complete: {executed} commands executed, {changed} tasks written.")
+
+def stage_batch(store: TaskStore, lines: List[str]) -> Tuple[StagedTaskStore, List[Tuple[int, str]], int]:
+    """Run batch lines against a StagedTaskStore over a store; return it, the
+    (line number, message) result of each line and the number of commands run."""
+    parser = build_parser()
+    staged = StagedTaskStore(store)
+    results = []
+    executed = 0
+    for line_number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+
+        output = io.StringIO()
+        with redirect_stdout(output), redirect_stderr(output):
+            args = parse_batch_line(parser, line)
+            if args is not None:
+                run_command(staged, args)
+                executed += 1
+
+        messages = output.getvalue().strip().splitlines()
+        results.append((line_number, messages[-1] if messages else 'ok'))
+    return staged, results, executed
+
+def show_lock_stats() -> None:
+    """Show lock contention recorded by all task-tracker processes."""
+    display_lock_stats(summarize_stats(DATA_DIR / LOCK_STATS_FILE_NAME))
+
+def archive_segments(backend: str, codec: Optional[str] = None, report_only: bool = False) -> None:
+    """Compress the sealed completed segments of the CSV backend and show the space they take."""
+    if backend != 'csv':
+        print("Error: Only the csv backend keeps completed tasks in segments")
+        return
+
+    ensure_data_dir()
+    store = CsvTaskStore(DATA_DIR)
+    try:
+        if not report_only:
+            start = time.perf_counter()
+            archived = store.archive(codec)
+            print(f"Archived {len(archived)} segments in {time.perf_counter() - start:.1f}s.")
+        display_segment_stats(store.segment_stats())
+    finally:
+        store.close()
+
+def compact_store(store: TaskStore, min_garbage: float = 0.0) -> bool:
+    """Compact a store if at least `min_garbage` of it is garbage, and report
+    the bytes reclaimed; return False if the compaction failed."""
+    garbage = store.garbage_ratio()
+    if garbage < min_garbage:
+        print(f"Nothing to compact: {garbage:.0%} garbage, below {min_garbage:.0%}.")
+        return True
+
+    before = store.disk_usage()
+    start = time.perf_counter()
+    if not store.compact():
+        print("Error: Compaction did not finish")
+        return False
+    elapsed = time.perf_counter() - start
+    after = store.disk_usage()
+    # Folding pending writes into new files can take more space than the writes did
+    change = (f"reclaimed {format_size(before - after)}" if after <= before
+              else f"grew by {format_size(after - before)} folding pending writes")
+    print(f"Compacted in {elapsed * 1000:.0f} ms: {format_size(before)} -> {format_size(after)}, "
+          f"{change} ({garbage:.0%} garbage).")
+    return True
+
+def check_store(backend: str, accept: bool = False) -> bool:
+    """Check the stored files of a backend for corruption and report each one;
+    return False if any is damaged.
+
+    With `accept`, the CSV files are first recorded as correct as they are,
+    for files that were edited by hand.
+    """
+    if accept and backend != 'csv':
+        print("Error: Only the csv backend keeps checksums of its files")
+        return False
+
+    ensure_data_dir()
+    store = BACKENDS[backend](DATA_DIR)
+    try:
+        if accept:
+            for file_path in store.accept_files():
+                print(f"Accepted {file_path.name} as it is.")
+        start = time.perf_counter()
+        results = store.verify()
+        elapsed = time.perf_counter() - start
+    finally:
+        store.close()
+
+    damaged = 0
+    for name, problems in results.items():
+        if problems is None:
+            print(f"{name}: no checksums")
+        elif problems:
+            damaged += 1
+            for problem in problems:
+                print(f"{name}: {problem}")
+        else:
+            print(f"{name}: ok")
+    print(f"Checked {len(results)} files in {elapsed * 1000:.0f} ms, {damaged} damaged.")
+    return damaged == 0
+
+def serve_tasks(backend: str, compact_ratio: Optional[float] = None) -> None:
+    """Run the daemon, serving commands from an in-memory copy of the store and
+    compacting it in the background once `compact_ratio` of it is garbage."""
+    store = MemoryTaskStore(open_store(backend))
+    socket_path = DATA_DIR / SOCKET_FILE_NAME
+    # Parsers for the default backend of each client environment
+    parsers = {}
+
+    def handle_request(request: Dict[str, Any]) -> Dict[str, Any]:
+        default_backend = request.get('backend') or DEFAULT_BACKEND
+        if default_backend not in parsers:
+            parsers[default_backend] = build_parser(default_backend)
+
+        stdout, stderr = io.StringIO(), io.StringIO()
+        status = 0
+        with redirect_stdout(stdout), redirect_stderr(stderr):
+            try:
+                args = parse_command(parsers[default_backend], request['argv'])
+                if args.command not in DAEMON_COMMANDS or args.backend != backend:
+                    return {'fallback': True}
+                run_command(store, args)
+            except SystemExit as e:
+                status = e.code if isinstance(e.code, int) else 1
+            except STORE_ERRORS as e:
+                print(f"Error: {e}")
+                status = 1
+        return {'status': status, 'stdout': stdout.getvalue(), 'stderr': stderr.getvalue()}
+
+    # Compactions run in a child process with a store of their own; the cache
+    # is reloaded before the next command, like after any other process's writes
+    maintenance = None
+    if compact_ratio is not None:
+        maintenance = [sys.executable, str(Path(__file__).resolve()), "--backend", backend,
+                       "compact", "--min-garbage", str(compact_ratio)]
+
+    print(f"Serving {backend} tasks on {socket_path}")
+    try:
+        serve(socket_path, handle_request, maintenance)
+    except RuntimeError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    finally:
+        store.close()
+
+def parse_command(parser: argparse.ArgumentParser, argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Parse a command line, also rejecting options that only apply together."""
+    args = parser.parse_args(argv)
+    if args.command == "note" and args.since is not None and not args.list:
+        parser.error("note: --since only applies with --list")
+    return args
+
+def build_parser(default_backend: str = DEFAULT_BACKEND) -> argparse.ArgumentParser:
+    """Build the command line parser."""
     # Set up argument parser
     parser = argparse.ArgumentParser(description="Task Tracker CLI")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default=default_backend,
+                        help="Storage backend (default: %(default)s)")
     subparsers = parser.add_subparsers(dest="command", help="Command to execute")
     
     # Create task command
@@ -254,9 +543,12 @@ def main() -> None:
     complete_parser.add_argument("id", help="Task ID to complete")
     
     # Add note command
-    note_parser = subparsers.add_parser("note", help="Add a note to a task")
+    note_parser = subparsers.add_parser("note", help="Add a note to a task, or list its notes")
     note_parser.add_argument("id", help="Task ID")
-    note_parser.add_argument("text", help="Note text")
+    note_parser.add_argument("text", nargs="?", help="Note text")
+    note_parser.add_argument("--list", "-l", action="store_true", help="List the notes of the task")
+    note_parser.add_argument("--since", type=since_timestamp,
+                             help="With --list, only notes added at or after YYYY-MM-DD[ HH:MM]")
 
     # Show task details
     show_parser = subparsers.add_parser("show", help="Show task details")
@@ -266,32 +558,196 @@ def main() -> None:
     list_parser = subparsers.add_parser("ls", help="List tasks")
     list_parser.add_argument("--completed", "-c", action="store_true", help="Show completed tasks")
     list_parser.add_argument("--all", "-a", action="store_true", help="Show all tasks")
+    list_parser.add_argument("--format", "-f", choices=["grid", "plain"], default="grid",
+                             help="Output format; plain prints tasks as they are read (default: %(default)s)")
+    list_parser.add_argument("--limit", type=non_negative_int, help="Show at most this many tasks")
+    list_parser.add_argument("--offset", type=non_negative_int, default=0, help="Skip this many tasks")
+    list_parser.add_argument("--after", metavar="ID", help="Start after the task with this ID")
+    list_parser.add_argument("--title", help="Only tasks whose title contains this text")
+    list_parser.add_argument("--note", help="Only tasks whose note, or a note added later, contains this text")
+    list_parser.add_argument("--id-prefix", help="Only tasks whose ID starts with this prefix")
+    list_parser.add_argument("--since", type=since_timestamp,
+                             help="Only tasks with a note added at or after YYYY-MM-DD[ HH:MM]")
+    list_parser.add_argument("--until", type=until_timestamp,
+                             help="Only tasks with a note added at or before YYYY-MM-DD[ HH:MM]")
+    list_parser.add_argument("--created-since", type=since_timestamp,
+                             help="Only tasks created at or after YYYY-MM-DD[ HH:MM]")
+    list_parser.add_argument("--created-until", type=until_timestamp,
+                             help="Only tasks created at or before YYYY-MM-DD[ HH:MM]")
+    list_parser.add_argument("--completed-since", type=month_value, metavar="YYYY-MM",
+                             help="Only tasks completed in or after this month (with -c)")
+    list_parser.add_argument("--completed-until", type=month_value, metavar="YYYY-MM",
+                             help="Only tasks completed in or before this month (with -c)")
+
+    # Full-text search command
+    search_parser = subparsers.add_parser("search", help="Search task titles and notes")
+    search_parser.add_argument("words", nargs="*", help="Words a task must contain; end a word with * to match a prefix")
+    search_parser.add_argument("--limit", type=non_negative_int, default=20,
+                               help="Show at most this many tasks (default: %(default)s)")
+    search_parser.add_argument("--rebuild", action="store_true", help="Rebuild the search index from the stored tasks")
+
+    # Migrate tasks between backends command
+    migrate_parser = subparsers.add_parser("migrate", help="Copy all tasks to another storage backend")
+    migrate_parser.add_argument("--from", dest="source", choices=sorted(BACKENDS), default="csv",
+                                help="Backend to copy from (default: %(default)s)")
+    migrate_parser.add_argument("--to", dest="target", choices=sorted(BACKENDS), default="sqlite",
+                                help="Backend to copy into (default: %(default)s)")
     
-    # Parse arguments
-    args = parser.parse_args()
-    
-    # Execute command
+    # Bulk import and export commands
+    import_parser = subparsers.add_parser("import", help="Import tasks from a CSV or JSON lines file")
+    import_parser.add_argument("file", nargs="?", default="-", help="File to import (default: stdin)")
+    import_parser.add_argument("--format", choices=TRANSFER_FORMATS,
+                               help="Input format (default: csv for .csv files, else jsonl)")
+    import_parser.add_argument("--chunk-size", type=positive_int, default=CHUNK_SIZE,
+                               help="Records written at a time (default: %(default)s)")
+    export_parser = subparsers.add_parser("export", help="Export all tasks to a CSV or JSON lines file")
+    export_parser.add_argument("file", nargs="?", default="-", help="File to write (default: stdout)")
+    export_parser.add_argument("--format", choices=TRANSFER_FORMATS,
+                               help="Output format (default: csv for .csv files, else jsonl)")
+
+    # Archive completed segments command
+    archive_parser = subparsers.add_parser("archive", help="Compress the completed tasks of past months")
+    archive_parser.add_argument("--codec", choices=list(CODECS),
+                                help="Compression codec (default: the best one for each segment)")
+    archive_parser.add_argument("--report", action="store_true",
+                                help="Only show the size of the completed segments")
+
+    # Compaction command
+    compact_parser = subparsers.add_parser("compact", help="Reclaim space and fold pending writes into the store")
+    compact_parser.add_argument("--min-garbage", type=garbage_ratio, default=0.0, metavar="RATIO",
+                                help="Only compact if at least this fraction of the store is garbage")
+
+    # Integrity check command
+    fsck_parser = subparsers.add_parser("fsck", help="Check the stored files for corruption")
+    fsck_parser.add_argument("--accept", action="store_true",
+                             help="First record the CSV files as correct as they are, after editing them by hand")
+
+    # Lock contention stats command
+    subparsers.add_parser("lock-stats", help="Show lock contention between concurrent invocations")
+
+    # Batch command
+    batch_parser = subparsers.add_parser("batch", help="Run many commands with a single write")
+    batch_parser.add_argument("file", nargs="?", default="-",
+                              help="File with one command per line, e.g. 'c \"Title\" -n note' (default: stdin)")
+
+    # Daemon command
+    serve_parser = subparsers.add_parser("serve", help="Run a daemon that keeps tasks in memory for faster commands")
+    serve_parser.add_argument("--compact-ratio", type=garbage_ratio, metavar="RATIO",
+                              help="Compact in the background once this fraction of the store is garbage")
+
+    return parser
+
+def run_command(store: TaskStore, args: argparse.Namespace) -> None:
+    """Execute a parsed task command against a store."""
+    if args.command in TASK_ID_COMMANDS:
+        args.id = resolve_task_id(store, args.id)
+        if args.id is None:
+            return
+
     if args.command == "c":
-        create_task(args.title, args.note or "")
+        create_task(store, args.title, args.note or "")
     elif args.command == "rm":
-        remove_task(args.id)
+        remove_task(store, args.id)
     elif args.command == "upd":
-        update_task(args.id, args.title)
+        update_task(store, args.id, args.title)
     elif args.command == "done":
-        complete_task(args.id)
+        complete_task(store, args.id)
     elif args.command == "note":
-        add_note(args.id, args.text)
+        if args.list:
+            list_notes(store, args.id, args.since)
+        else:
+            add_note(store, args.id, args.text)
     elif args.command == "show":
-        show_task(args.id)
+        show_task(store, args.id)
     elif args.command == "ls":
+        query = TaskQuery(args.title, args.note, args.id_prefix, args.since, args.until,
+                          args.created_since, args.created_until, args.completed_since, args.completed_until)
+        if query.has_completed_range():
+            if args.all or not args.completed:
+                print("Error: --completed-since and --completed-until only apply to completed tasks (-c)")
+                return
+            if not store.records_completion_months():
+                print("Error: This backend does not record when tasks were completed")
+                return
         if args.all:
-            list_tasks(False)
-            list_tasks(True)
+            list_tasks(store, False, args.format, args.offset, args.limit, args.after, query)
+            list_tasks(store, True, args.format, args.offset, args.limit, args.after, query)
         else:
-            list_tasks(args.completed)
-    else:
+            list_tasks(store, args.completed, args.format, args.offset, args.limit, args.after, query)
+    elif args.command == "search":
+        search_tasks(store, args.words, args.limit, args.rebuild)
+    elif args.command == "import":
+        import_file(store, args.file, args.format, args.chunk_size)
+    elif args.command == "export":
+        export_file(store, args.file, args.format)
+    elif args.command == "compact":
+        if not compact_store(store, args.min_garbage):
+            sys.exit(1)
+    elif args.command == "batch":
+        if args.file == "-":
+            run_batch(store, sys.stdin)
+        else:
+            with open(args.file, 'r', encoding='utf-8') as file:
+                run_batch(store, file)
+
+def main() -> None:
+    """Main CLI entry point."""
+    # Let a running daemon execute the command, before paying for argument parsing
+    response = forward_command(DATA_DIR / SOCKET_FILE_NAME, sys.argv[1:], DEFAULT_BACKEND)
+    if response is not None:
+        sys.stdout.write(response['stdout'])
+        sys.stderr.write(response['stderr'])
+        sys.exit(response['status'])
+
+    parser = build_parser()
+    
+    # Parse arguments
+    args = parse_command(parser)
+
+    if args.command is None:
         parser.print_help()
         sys.exit(1)
 
+    if args.command == "migrate":
+        migrate_tasks(args.source, args.target)
+        return
+    if args.command == "lock-stats":
+        show_lock_stats()
+        return
+    if args.command == "archive":
+        try:
+            archive_segments(args.backend, args.codec, args.report)
+        except STORE_ERRORS as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        return
+    if args.command == "fsck":
+        try:
+            healthy = check_store(args.backend, args.accept)
+        except STORE_ERRORS as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        if not healthy:
+            sys.exit(1)
+        return
+    if args.command == "serve":
+        serve_tasks(args.backend, args.compact_ratio)
+        return
+
+    try:
+        store = open_store(args.backend)
+    except STORE_ERRORS as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    
+    # Execute command
+    try:
+        run_command(store, args)
+    except STORE_ERRORS as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    finally:
+        store.close()
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
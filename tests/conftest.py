@@ -0,0 +1,34 @@
+import os
+import sys
+import subprocess
+import pytest
+from pathlib import Path
+
+# The modules live at the top of the repository rather than in a package
+REPO_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_DIR))
+
+class CommandLine:
+    """Runs task_tracker.py in a subprocess with a home directory, and so a data directory, of its own."""
+
+    def __init__(self, home: Path):
+        self.data_dir = home / '.vsz-clap'
+        self.env = dict(os.environ, HOME=str(home))
+        for name in ('TASK_TRACKER_BACKEND', 'TASK_TRACKER_ID_SCHEME'):
+            self.env.pop(name, None)
+
+    def __call__(self, *argv: str, status: int = 0, input: str = None, **env: str) -> str:
+        """Run a command and return its output, failing unless it exits with `status`."""
+        result = subprocess.run([sys.executable, str(REPO_DIR / 'task_tracker.py'), *argv], input=input,
+                                capture_output=True, text=True, env=dict(self.env, **env))
+        assert result.returncode == status, result.stdout + result.stderr
+        return result.stdout + result.stderr
+
+    def create(self, title: str, *options: str, backend: str = 'csv', **env: str) -> str:
+        """Create a task and return its ID."""
+        output = self('--backend', backend, 'c', title, *options, **env)
+        return output.rsplit('Task created with ID: ', 1)[1].split()[0]
+
+@pytest.fixture
+def cli(tmp_path):
+    return CommandLine(tmp_path / 'home')
@@ -0,0 +1,58 @@
+"""
+Running many commands with one write in batch mode.
+"""
+
+import task_tracker
+from csv_store import CsvTaskStore
+
+def new_store(data_dir, *task_ids):
+    store = CsvTaskStore(data_dir)
+    store.put_many([{'id': task_id, 'title': f"Task {task_id}", 'state': 'O', 'note': ""} for task_id in task_ids])
+    return store
+
+def test_batch_applies_every_line(tmp_path, capsys):
+    store = new_store(tmp_path, 'task1', 'task2')
+    task_tracker.run_batch(store, ['done task1', '# a comment', '', 'upd task2 --title Renamed', 'rm nosuchtask'])
+
+    output = capsys.readouterr().out
+    assert "1: " in output and "5: No task found with ID: nosuchtask" in output
+    assert "Batch complete: 3 commands executed, 2 tasks written." in output
+    assert store.get('task1')['state'] == 'X'
+    assert store.get('task2')['title'] == "Renamed"
+
+def test_batch_reads_input_without_the_write_lock(tmp_path, monkeypatch):
+    monkeypatch.setattr(CsvTaskStore, 'compact_threshold', lambda self: 2**40)
+    store = new_store(tmp_path, 'task1')
+    other = CsvTaskStore(tmp_path)
+
+    def lines():
+        yield 'done task1'
+        # Would time out if the batch held the write lock while reading
+        other.write_lock.timeout = 0.5
+        other.put_many([{'id': 'task2', 'title': "Written meanwhile", 'state': 'O', 'note': ""}])
+        yield 'c Another'
+
+    task_tracker.run_batch(store, lines())
+    assert store.get('task1')['state'] == 'X'
+    assert store.get('task2')['title'] == "Written meanwhile"
+
+def test_batch_is_staged_again_after_a_concurrent_change(tmp_path, monkeypatch, capsys):
+    store = new_store(tmp_path, 'task1')
+    stage_batch = task_tracker.stage_batch
+    calls = []
+
+    def stage_then_remove(store, lines):
+        staged = stage_batch(store, lines)
+        if not calls:
+            # Another process removes the task after the batch read it
+            other = CsvTaskStore(tmp_path)
+            other.delete_many(['task1'])
+            other.close()
+        calls.append(lines)
+        return staged
+    monkeypatch.setattr(task_tracker, 'stage_batch', stage_then_remove)
+
+    task_tracker.run_batch(store, ['done task1', 'c Another'])
+    assert len(calls) == 2
+    assert "1: No active task found with ID: task1" in capsys.readouterr().out
+    assert store.get('task1') is None
@@ -0,0 +1,98 @@
+"""
+The Bloom filter of the completed task IDs.
+"""
+
+import os
+import shutil
+import bloom
+from bloom import BloomFilter, open_filter, segments_digest
+from csv_store import CsvTaskStore
+
+def new_tasks(task_ids, state):
+    return [{'id': task_id, 'title': "Task", 'state': state, 'note': ""} for task_id in task_ids]
+
+def test_filter_finds_every_id_added(tmp_path):
+    task_ids = [f"task{number}" for number in range(1000)]
+    bloom_filter = BloomFilter.for_ids(len(task_ids))
+    for task_id in task_ids:
+        bloom_filter.add(task_id)
+    assert all(task_id in bloom_filter for task_id in task_ids)
+    false_positives = sum(f"other{number}" in bloom_filter for number in range(10000))
+    assert false_positives < 200
+
+    digest = b'0123456789abcdef'
+    bloom_filter.write(tmp_path / 'test.bloom', digest)
+    with open_filter(tmp_path / 'test.bloom', digest) as opened:
+        assert opened.count == len(task_ids) and opened.capacity == bloom_filter.capacity
+        assert all(task_id in opened for task_id in task_ids)
+    assert open_filter(tmp_path / 'test.bloom', b'fedcba9876543210') is None
+    assert open_filter(tmp_path / 'test.bloom', None) is None
+    assert open_filter(tmp_path / 'missing.bloom', digest) is None
+
+    (tmp_path / 'test.bloom').write_bytes((tmp_path / 'test.bloom').read_bytes()[:-1])
+    assert open_filter(tmp_path / 'test.bloom', digest) is None
+
+def test_digest_follows_the_segment_files(tmp_path):
+    segment = tmp_path / 'completed.csv'
+    segment.write_text("id,title,state,note\r\n")
+    digest = segments_digest([segment])
+    assert segments_digest([segment]) == digest
+    stat = segment.stat()
+    os.utime(segment, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    assert segments_digest([segment]) != digest
+    assert segments_digest([segment, tmp_path / 'missing.csv']) is None
+
+def test_compaction_keeps_the_filter_current(tmp_path):
+    store = CsvTaskStore(tmp_path)
+    store.put_many(new_tasks(['done1', 'done2'], 'X') + new_tasks(['open1'], 'O'))
+    assert store.completed_filter() is None
+    assert store.compact()
+    assert store.may_be_completed('done1') and store.may_be_completed('done2')
+    assert not store.may_be_completed('open1')
+
+    store.move_state('open1', 'X')
+    assert store.compact()
+    assert store.may_be_completed('open1')
+
+def test_filter_of_other_segments_is_ignored(tmp_path):
+    store = CsvTaskStore(tmp_path)
+    store.put_many(new_tasks(['done1'], 'X'))
+    assert store.compact()
+    shutil.copy(store.bloom_file, tmp_path / 'old.bloom')
+
+    store.put_many(new_tasks(['done2'], 'X'))
+    assert store.compact()
+    # A filter left from before the last compaction does not know done2
+    shutil.copy(tmp_path / 'old.bloom', store.bloom_file)
+    assert store.completed_filter() is None
+    assert store.may_be_completed('nosuchtask')
+    assert store.get('done2')['state'] == 'X'
+
+    # So does any change to a segment file made without the store
+    store.put_many(new_tasks(['done3'], 'X'))
+    assert store.compact()
+    assert store.completed_filter() is not None
+    segment = store.state_files('X')[-1][1]
+    stat = segment.stat()
+    os.utime(segment, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert store.completed_filter() is None
+    assert store.get('done3')['state'] == 'X'
+
+def test_filter_is_rebuilt_past_its_capacity(tmp_path, monkeypatch):
+    monkeypatch.setattr(bloom, 'MIN_CAPACITY', 1)
+    store = CsvTaskStore(tmp_path)
+    store.put_many(new_tasks(['done1', 'done2'], 'X'))
+    assert store.compact()
+    with store.completed_filter() as built:
+        assert (built.count, built.capacity) == (2, 4)
+
+    store.put_many(new_tasks(['done3'], 'X'))
+    assert store.compact()
+    with store.completed_filter() as extended:
+        assert (extended.count, extended.capacity) == (3, 4)
+
+    store.put_many(new_tasks([f"more{number}" for number in range(4)], 'X'))
+    assert store.compact()
+    with store.completed_filter() as rebuilt:
+        assert (rebuilt.count, rebuilt.capacity) == (7, 14)
+        assert all(f"more{number}" in rebuilt for number in range(4))
@@ -0,0 +1,49 @@
+"""
+Garbage estimates and the compact command.
+"""
+
+from csv_store import CsvTaskStore
+
+def put_tasks(store, count, first=0):
+    store.put_many([{'id': f"task{number:05d}", 'title': f"Title {number}", 'state': 'O', 'note': ""}
+                    for number in range(first, first + count)])
+
+def test_new_tasks_are_not_garbage(tmp_path):
+    store = CsvTaskStore(tmp_path)
+    put_tasks(store, 100)
+    assert store.garbage_ratio() < 0.1
+    assert store.compact()
+    put_tasks(store, 200, first=100)
+    assert store.garbage_ratio() < 0.1
+
+def test_garbage_ratio_predicts_reclaimed_space(tmp_path):
+    store = CsvTaskStore(tmp_path)
+    put_tasks(store, 2000)
+    assert store.compact()
+    store.delete_many([f"task{number:05d}" for number in range(0, 2000, 2)])
+    for number in range(1, 200, 2):
+        store.update(f"task{number:05d}", {'title': "Renamed"})
+
+    before = store.disk_usage()
+    ratio = store.garbage_ratio()
+    assert store.compact()
+    reclaimed = (before - store.disk_usage()) / before
+    assert abs(ratio - reclaimed) < 0.1
+
+def test_compact_min_garbage(cli):
+    task_ids = [cli.create(f"Task {number}") for number in range(3)]
+    assert "Nothing to compact" in cli('compact', '--min-garbage', '0.5')
+    assert "grew by" in cli('compact')
+
+    for task_id in task_ids:
+        cli('rm', task_id)
+    assert "reclaimed" in cli('compact', '--min-garbage', '0.5')
+    assert "Nothing to compact" in cli('compact', '--min-garbage', '0.01')
+
+def test_compact_fails_on_damaged_file(cli):
+    cli.create("Task")
+    cli('compact')
+    cli.create("Another task")
+    with open(cli.data_dir / 'active.csv', 'ab') as file:
+        file.write(b"damage\n")
+    assert "is corrupt" in cli('compact', status=1)
@@ -0,0 +1,95 @@
+"""
+Reading and writing block-compressed CSV files.
+"""
+
+import io
+import csv
+import pytest
+import compression
+import csv_store
+from compression import (CODECS, BlockWriter, CorruptFileError, file_codec, is_compressed, open_csv,
+                         text_size)
+from csv_store import CsvTaskStore, write_csv
+
+TASKS = [{'id': f"task{number:04d}", 'title': f"Title {number}", 'state': 'X', 'note': "note " * (number % 7)}
+         for number in range(500)]
+
+def write_compressed(file_path, tasks, codec):
+    with open(file_path, 'wb') as file:
+        writer = BlockWriter(file, codec)
+        entries = write_csv(writer, tasks)
+        writer.finish()
+    return entries
+
+@pytest.mark.parametrize('codec', CODECS)
+def test_blocks_read_back_as_csv_text(tmp_path, monkeypatch, codec):
+    monkeypatch.setattr(compression, 'BLOCK_SIZE', 1000)
+    plain = io.BytesIO()
+    write_csv(plain, TASKS)
+    file_path = tmp_path / 'tasks.csvz'
+    entries = write_compressed(file_path, TASKS, codec)
+
+    assert is_compressed(file_path) and file_codec(file_path) == codec
+    assert text_size(file_path) == len(plain.getvalue())
+    with open_csv(file_path) as file:
+        assert file.read() == plain.getvalue()
+        # Index offsets point into the CSV text, whatever block they fall in
+        for task_id, offset, _ in entries[::37]:
+            file.seek(offset)
+            assert file.readline().startswith(task_id.encode() + b',')
+    with open_csv(file_path) as file:
+        text = io.TextIOWrapper(file, encoding='utf-8', newline='')
+        assert list(csv.DictReader(text)) == TASKS
+
+def test_damage_is_reported(tmp_path):
+    file_path = tmp_path / 'tasks.csvz'
+    write_compressed(file_path, TASKS, 'gzip')
+    data = bytearray(file_path.read_bytes())
+
+    data[compression.COMPRESSED_HEADER.size + 200] ^= 0xFF
+    file_path.write_bytes(bytes(data))
+    with pytest.raises(CorruptFileError):
+        with open_csv(file_path) as file:
+            file.read()
+
+    file_path.write_bytes(b'TTCSVZ0\0' + bytes(data[8:]))
+    with pytest.raises(CorruptFileError):
+        open_csv(file_path)
+    file_path.write_bytes(bytes(data[:10]))
+    with pytest.raises(CorruptFileError):
+        open_csv(file_path)
+
+def test_archived_segments_stay_readable(tmp_path, monkeypatch):
+    month = ['2026-01']
+    monkeypatch.setattr(csv_store, 'current_month', lambda: month[0])
+    store = CsvTaskStore(tmp_path)
+    for month[0], tasks in zip(['2026-01', '2026-02', '2026-03'], [TASKS[:200], TASKS[200:400], TASKS[400:]]):
+        store.put_many(tasks)
+        assert store.compact()
+    expected = list(store.iterate('X'))
+
+    archived = store.archive('lzma')
+    assert [path.name for path in archived] == ['completed-2026-01.csvz', 'completed-2026-02.csvz']
+    assert not (tmp_path / 'completed-2026-01.csv').exists()
+    assert list(store.iterate('X')) == expected
+    assert store.get('task0123') == TASKS[123]
+    assert store.match_ids('task012', 20) == [f"task012{digit}" for digit in range(10)]
+    assert all(not problems for problems in store.verify().values())
+
+    # Changing an archived task rewrites its segment, still compressed
+    store.update('task0123', {'title': "Renamed"})
+    store.delete_many(['task0250'])
+    assert store.compact()
+    assert store.get('task0123')['title'] == "Renamed"
+    assert store.get('task0250') is None
+    assert file_codec(tmp_path / 'completed-2026-01.csvz') == 'lzma'
+    assert len(list(store.iterate('X'))) == len(TASKS) - 1
+    # Nothing left to archive
+    assert store.archive() == []
+
+def test_archive_command(cli):
+    task_id = cli.create("Write report")
+    cli('done', task_id)
+    assert "Archived 0 segments" in cli('archive')
+    assert task_id in cli('ls', '-c', '-f', 'plain')
+    assert "Only the csv backend" in cli('--backend', 'sqlite', 'archive')
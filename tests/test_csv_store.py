@@ -0,0 +1,145 @@
+"""
+Crash safety and integrity checks of the CSV backend.
+"""
+
+import os
+import stat
+import pytest
+import csv_store
+from csv_store import CsvTaskStore
+from compression import CorruptFileError
+
+def make_store(data_dir, count=20):
+    """Return a store with `count` compacted tasks, half of them completed,
+    and a journal holding a few more changes."""
+    store = CsvTaskStore(data_dir)
+    store.put_many([{'id': f"task{number:03d}", 'title': f"Title {number:03d}", 'state': 'O', 'note': ""}
+                    for number in range(count)])
+    for number in range(0, count, 2):
+        store.move_state(f"task{number:03d}", 'X')
+    assert store.compact()
+    store.put_many([{'id': 'task100', 'title': "Title 100", 'state': 'O', 'note': ""}])
+    store.update('task001', {'title': "Renamed"})
+    store.delete_many(['task003'])
+    return store
+
+def read_all(store):
+    return {state: list(store.iterate(state)) for state in 'OX'}
+
+def assert_intact(store):
+    assert not store.intent_file.exists()
+    assert not store.staged_paths()
+    assert all(not problems for problems in store.verify().values())
+
+def test_recover_finishes_compaction_after_intent(tmp_path, monkeypatch):
+    store = make_store(tmp_path)
+    expected = read_all(store)
+
+    def crash(self):
+        raise RuntimeError("crash")
+    # The intent record is written, then the process dies before any rename
+    with monkeypatch.context() as patch:
+        patch.setattr(CsvTaskStore, 'apply_intent', crash)
+        with pytest.raises(RuntimeError):
+            store.compact()
+    store.close()
+    assert store.intent_file.exists()
+
+    store = CsvTaskStore(tmp_path)
+    assert read_all(store) == expected
+    assert not store.journal_file.exists()
+    assert_intact(store)
+
+def test_recover_discards_compaction_before_intent(tmp_path, monkeypatch):
+    store = make_store(tmp_path)
+    expected = read_all(store)
+
+    def crash(*args):
+        raise RuntimeError("crash")
+    # The staged files are written, then the process dies before the intent record
+    with monkeypatch.context() as patch:
+        patch.setattr(csv_store, 'write_manifest', crash)
+        patch.setattr(CsvTaskStore, 'discard', lambda self, staged: None)
+        assert not store.compact()
+    store.close()
+    assert store.staged_paths()
+
+    store = CsvTaskStore(tmp_path)
+    assert read_all(store) == expected
+    assert store.journal_file.exists()
+    assert_intact(store)
+
+def test_skipped_compaction_leaves_files_checked(tmp_path):
+    store = make_store(tmp_path)
+    expected = read_all(store)
+
+    reader = CsvTaskStore(tmp_path)
+    with reader.read_lock():
+        assert not store.compact(blocking=False)
+    assert store.journal_file.exists()
+    assert read_all(store) == expected
+    assert_intact(store)
+
+    assert store.compact()
+    assert read_all(store) == expected
+    assert_intact(store)
+
+def edit_in_place(file_path, old, new):
+    """Change bytes of a file without changing its inode or size, a second later."""
+    stat = file_path.stat()
+    with open(file_path, 'r+b') as file:
+        data = file.read()
+        file.seek(data.index(old))
+        file.write(new)
+    os.utime(file_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+def edit_new_inode(file_path, old, new):
+    """Replace a file with an edited copy, the way editors and sed -i save."""
+    edited = file_path.with_name(file_path.name + '.tmp')
+    edited.write_bytes(file_path.read_bytes().replace(old, new))
+    os.replace(edited, file_path)
+
+@pytest.mark.parametrize('edit', [edit_in_place, edit_new_inode])
+def test_checksums_catch_edits(tmp_path, edit):
+    store = make_store(tmp_path)
+    edit(store.active_file, b"Title 005", b"Title XYZ")
+
+    assert store.verify()[store.active_file.name]
+    with pytest.raises(CorruptFileError):
+        read_all(store)
+    with pytest.raises(CorruptFileError):
+        store.get('task005')
+    # The edit is not folded into new files until it is accepted
+    assert not store.compact()
+    assert store.journal_file.exists()
+
+    assert store.accept_files() == [store.active_file]
+    assert store.get('task005')['title'] == "Title XYZ"
+    assert store.compact()
+    assert_intact(store)
+
+def test_failed_journal_append_raises(tmp_path, monkeypatch):
+    store = make_store(tmp_path)
+    expected = read_all(store)
+
+    def disk_full(journal_path, records):
+        raise OSError(28, "No space left on device")
+    monkeypatch.setattr(csv_store, 'append_records', disk_full)
+    with pytest.raises(OSError):
+        store.put_many([{'id': 'task200', 'title': "Title 200", 'state': 'O', 'note': ""}])
+    with pytest.raises(OSError):
+        store.update('task005', {'title': "Renamed"})
+    assert read_all(store) == expected
+
+def test_compaction_keeps_file_modes(tmp_path):
+    store = make_store(tmp_path)
+    os.chmod(store.active_file, 0o640)
+    store.put_many([{'id': 'task200', 'title': "Title 200", 'state': 'O', 'note': ""}])
+    assert store.compact()
+
+    assert stat.S_IMODE(store.active_file.stat().st_mode) == 0o640
+    umask = os.umask(0)
+    os.umask(umask)
+    for file_path in store.store_files():
+        if file_path != store.active_file:
+            assert stat.S_IMODE(file_path.stat().st_mode) == 0o666 & ~umask, file_path.name
@@ -0,0 +1,63 @@
+"""
+Forwarding commands to the daemon.
+"""
+
+import sys
+import time
+import subprocess
+import pytest
+from conftest import REPO_DIR
+from csv_store import CsvTaskStore
+from daemon import SOCKET_FILE_NAME, forward_command, is_listening
+
+@pytest.fixture
+def daemon(cli):
+    """Run a daemon for the data directory of `cli` and return its socket path."""
+    socket_path = cli.data_dir / SOCKET_FILE_NAME
+    process = subprocess.Popen([sys.executable, str(REPO_DIR / 'task_tracker.py'), 'serve'], env=cli.env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.monotonic() + 10
+        while not (socket_path.exists() and is_listening(socket_path)):
+            assert process.poll() is None and time.monotonic() < deadline, "the daemon did not start"
+            time.sleep(0.05)
+        yield socket_path
+    finally:
+        process.terminate()
+        process.wait()
+
+def forward(socket_path, *argv):
+    return forward_command(socket_path, list(argv), 'csv')
+
+def test_daemon_answers_task_commands(cli, daemon):
+    created = forward(daemon, 'c', "Buy groceries")
+    assert created['status'] == 0 and "Task created with ID: " in created['stdout']
+    task_id = created['stdout'].split()[-1]
+
+    listed = forward(daemon, 'ls', '--format', 'plain')
+    assert task_id in listed['stdout']
+    # Changes are written through, so the CLI sees them without the daemon too
+    assert cli.data_dir.joinpath('journal.log').exists()
+
+    missing = forward(daemon, 'show', 'nosuchtask')
+    assert missing['status'] == 0 and "task found with ID: nosuchtask" in missing['stdout']
+
+def test_daemon_leaves_other_commands_to_the_client(cli, daemon):
+    assert forward(daemon, 'export', '-') is None
+    assert forward_command(daemon, ['ls'], 'sqlite') is None
+    # The client then runs them itself
+    assert "Exported 0 tasks" in cli('export', '-')
+
+def test_daemon_reloads_changes_of_other_processes(cli, daemon):
+    assert "No tasks found" in forward(daemon, 'ls', '--format', 'plain')['stdout']
+
+    store = CsvTaskStore(cli.data_dir)
+    store.put_many([{'id': 'external1', 'title': "Written elsewhere", 'state': 'O', 'note': ""}])
+    store.close()
+    assert "Written elsewhere" in forward(daemon, 'ls', '--format', 'plain')['stdout']
+
+    store = CsvTaskStore(cli.data_dir)
+    assert store.compact()
+    store.delete_many(['external1'])
+    store.close()
+    assert "No tasks found" in forward(daemon, 'ls', '--format', 'plain')['stdout']
@@ -0,0 +1,43 @@
+"""
+Checking the stored files with fsck.
+"""
+
+def test_csv_files(cli):
+    task_id = cli.create("Write report")
+    cli('done', cli.create("Book flights"))
+    cli('compact')
+    output = cli('fsck')
+    assert "active.csv: ok" in output and "journal.log: ok" in output
+    assert ", 0 damaged." in output
+
+    # Edited by hand without changing the file size
+    active_file = cli.data_dir / 'active.csv'
+    active_file.write_bytes(active_file.read_bytes().replace(b"Write report", b"Write review"))
+    output = cli('fsck', status=1)
+    assert "active.csv: " in output and "active.csv: ok" not in output
+    assert ", 1 damaged." in output
+    assert "is corrupt" in cli('show', task_id, status=1)
+
+    assert "Accepted active.csv as it is." in cli('fsck', '--accept')
+    assert ", 0 damaged." in cli('fsck')
+    assert "Write review" in cli('show', task_id)
+
+def test_torn_journal_records(cli):
+    cli.create("Write report")
+    with open(cli.data_dir / 'journal.log', 'ab') as file:
+        file.write(b'{"op": "put", "ta')
+    assert "journal.log: 1 torn records, skipped on read" in cli('fsck', status=1)
+    # Reads skip the torn record
+    assert "Write report" in cli('ls')
+
+def test_slot_file(cli):
+    cli.create("Write report", backend='slots')
+    assert ", 0 damaged." in cli('--backend', 'slots', 'fsck')
+    with open(cli.data_dir / 'tasks.slots', 'ab') as file:
+        file.write(b'\0')
+    assert "tasks.slots: size is" in cli('--backend', 'slots', 'fsck', status=1)
+
+def test_sqlite_database(cli):
+    cli.create("Write report", backend='sqlite')
+    assert ", 0 damaged." in cli('--backend', 'sqlite', 'fsck')
+    assert "Only the csv backend" in cli('--backend', 'sqlite', 'fsck', '--accept', status=1)
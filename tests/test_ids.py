@@ -0,0 +1,57 @@
+"""
+Time-ordered task IDs and selecting tasks by creation time.
+"""
+
+from datetime import datetime, timedelta
+import pytest
+import ids
+from query import TaskQuery
+
+def test_ids_increase_within_a_millisecond(monkeypatch):
+    monkeypatch.setattr(ids.time, 'time_ns', lambda: 1_700_000_000_000 * 1_000_000)
+    monkeypatch.setattr(ids.random, 'randrange', lambda limit: ids.SEQUENCE_LIMIT - 2)
+    new_id = ids.TimeOrderedIds()
+    made = [new_id() for _ in range(4)]
+    assert made == sorted(made) and len(set(made)) == 4
+    # Running out of sequence numbers borrows the next millisecond
+    assert ids.created_at(made[-1]) == datetime.fromtimestamp(1_700_000_000.001)
+
+def test_ids_increase_when_the_clock_goes_back(monkeypatch):
+    now = [1_700_000_000_000]
+    monkeypatch.setattr(ids.time, 'time_ns', lambda: now[0] * 1_000_000)
+    new_id = ids.TimeOrderedIds()
+    first = new_id()
+    now[0] -= 5000
+    assert new_id() > first
+
+def test_created_at():
+    moment = datetime(2026, 3, 14, 15, 9, 26)
+    task_id = ids.first_id_at(moment)
+    assert ids.is_time_ordered(task_id) and len(task_id) == ids.TIME_ID_LENGTH
+    assert ids.created_at(task_id) == moment
+    assert ids.created_at(ids.RandomIds()()) is None
+    assert ids.first_id_at(moment + timedelta(milliseconds=1)) > task_id
+
+def test_created_range_is_an_id_range():
+    query = TaskQuery(created_since="2026-03-14 15:00", created_until="2026-03-14 15:09")
+    low, high = query.id_range()
+    assert low == ids.first_id_at(datetime(2026, 3, 14, 15, 0))
+    assert high == ids.first_id_at(datetime(2026, 3, 14, 15, 10))
+    assert query.matches_created(ids.first_id_at(datetime(2026, 3, 14, 15, 9, 59)))
+    assert not query.matches_created(ids.first_id_at(datetime(2026, 3, 14, 15, 10)))
+    assert not query.matches_created('1a2b3c4d')
+
+@pytest.mark.parametrize('backend', ['csv', 'slots', 'sqlite'])
+def test_created_since(cli, backend):
+    old = cli.create("Old style ID", backend=backend, TASK_TRACKER_ID_SCHEME='random')
+    task_ids = [cli.create(f"Task {number}", backend=backend) for number in range(3)]
+    assert len(old) == 8 and task_ids == sorted(task_ids)
+
+    today = datetime.now().strftime("%Y-%m-%d")
+    tomorrow = (datetime.now() + timedelta(days=1)).strftime("%Y-%m-%d")
+    ls = lambda *options: cli('--backend', backend, 'ls', '-f', 'plain', *options)
+    listed = ls('--created-since', today)
+    assert all(task_id in listed for task_id in task_ids) and old not in listed
+    assert "No tasks found" in ls('--created-since', tomorrow)
+    assert "No tasks found" in ls('--created-until', "2020-01-01")
+    assert task_ids[0] in ls('--created-until', tomorrow)
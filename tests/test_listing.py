@@ -0,0 +1,83 @@
+"""
+Paging through and filtering ls output.
+"""
+
+import pytest
+
+BACKENDS = ['csv', 'slots', 'sqlite']
+
+def listed_ids(output):
+    """Return the task IDs of plain ls output, in order."""
+    return [line.split('\t')[0] for line in output.splitlines()
+            if '\t' in line and not line.startswith('id\t')]
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_pages_cover_every_task_once(cli, backend):
+    task_ids = [cli.create(f"Task {number}", backend=backend) for number in range(7)]
+    ls = lambda *options: listed_ids(cli('--backend', backend, 'ls', '-f', 'plain', *options))
+    assert ls() == task_ids
+
+    assert ls('--limit', '3') == task_ids[:3]
+    assert ls('--limit', '3', '--offset', '3') == task_ids[3:6]
+    assert ls('--offset', '6') == task_ids[6:]
+    assert ls('--offset', '10') == []
+    assert ls('--limit', '0') == []
+
+    pages, after = [], None
+    while True:
+        page = ls('--limit', '3', *(['--after', after] if after else []))
+        if not page:
+            break
+        pages.append(page)
+        after = page[-1]
+    assert pages == [task_ids[:3], task_ids[3:6], task_ids[6:]]
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_after_a_task_of_another_state_lists_nothing(cli, backend):
+    task_ids = [cli.create(f"Task {number}", backend=backend) for number in range(4)]
+    cli('--backend', backend, 'done', task_ids[1])
+    ls = lambda *options: listed_ids(cli('--backend', backend, 'ls', '-f', 'plain', *options))
+    assert ls('--after', task_ids[0]) == [task_ids[2], task_ids[3]]
+    assert ls('--after', task_ids[1]) == []
+    assert ls('-c', '--after', task_ids[1]) == []
+    assert ls('--after', 'nosuchtask') == []
+
+def test_all_tasks_are_paged_per_state(cli):
+    task_ids = [cli.create(f"Task {number}") for number in range(4)]
+    cli('done', task_ids[0])
+    cli('done', task_ids[1])
+    output = cli('ls', '-a', '-f', 'plain', '--limit', '1', '--offset', '1')
+    assert listed_ids(output) == [task_ids[3], task_ids[1]]
+
+@pytest.mark.parametrize('value', ['-1', 'many'])
+def test_negative_or_invalid_limit_is_rejected(cli, value):
+    assert "--limit" in cli('ls', '--limit', value, status=2)
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_filters(cli, backend):
+    report = cli.create("Write report", '--note', "for the board", backend=backend)
+    review = cli.create("Review report", '--note', "[2020-01-05 10:00] asked by Ann", backend=backend)
+    lunch = cli.create("Lunch", backend=backend)
+    cli('--backend', backend, 'note', lunch, "book a table for the board")
+    ls = lambda *options: listed_ids(cli('--backend', backend, 'ls', '-f', 'plain', *options))
+
+    assert ls('--title', "report") == [report, review]
+    assert ls('--title', "Report") == []
+    # The note given on creation, or one added to the history since
+    assert ls('--note', "the board") == [report, lunch]
+    assert ls('--id-prefix', review) == [review]
+    assert ls('--id-prefix', "zz") == []
+    assert ls('--since', "2020-01-05", '--until', "2020-01-05") == [review]
+    assert ls('--until', "2020-01-04") == []
+    assert ls('--since', "2021-01-01") == [lunch]
+    assert ls('--title', "report", '--note', "board") == [report]
+    assert ls('--title', "report", '--limit', '1', '--offset', '1') == [review]
+
+def test_filters_apply_to_completed_tasks(cli):
+    report = cli.create("Write report")
+    cli.create("Review report")
+    cli('done', report)
+    assert listed_ids(cli('ls', '-c', '-f', 'plain', '--title', "report")) == [report]
+
+def test_invalid_timestamp_is_rejected(cli):
+    assert "Invalid timestamp" in cli('ls', '--since', "last week", status=2)
@@ -0,0 +1,19 @@
+"""
+Copying tasks between backends with migrate.
+"""
+
+def test_migrate_twice_keeps_one_note_history(cli):
+    task_id = cli.create("Buy groceries")
+    cli('note', task_id, "Don't forget bread")
+    cli('done', task_id)
+
+    for _ in range(2):
+        assert "Migrated 1 tasks from csv to sqlite." in cli('migrate', '--from', 'csv', '--to', 'sqlite')
+
+    notes = cli('--backend', 'sqlite', 'note', task_id, '--list')
+    assert notes.count("Don't forget bread") == 1
+    assert task_id in cli('--backend', 'sqlite', 'ls', '-c', '--format', 'plain')
+
+def test_migrate_to_itself_is_refused(cli):
+    cli.create("Buy groceries")
+    assert "Error: Cannot migrate the csv backend to itself" in cli('migrate', '--from', 'csv', '--to', 'csv')
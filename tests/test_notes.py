@@ -0,0 +1,12 @@
+"""
+Note histories and the note command.
+"""
+
+def test_note_since_requires_list(cli):
+    task_id = cli.create("Buy groceries")
+    assert "--since only applies with --list" in cli('note', task_id, "bread", '--since', '2024-01-01', status=2)
+    assert "bread" not in cli('note', task_id, '--list')
+
+    cli('note', task_id, "milk")
+    assert "milk" in cli('note', task_id, '--list', '--since', '2000-01-01')
+    assert "milk" not in cli('note', task_id, '--list', '--since', '2999-01-01')
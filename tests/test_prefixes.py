@@ -0,0 +1,77 @@
+"""
+Resolving unique prefixes of task IDs.
+"""
+
+import pytest
+import task_tracker
+from csv_store import CsvTaskStore
+from slot_store import SlotTaskStore
+from sqlite_store import SqliteTaskStore
+from memory_store import MemoryTaskStore, StagedTaskStore
+
+TASK_IDS = ['abc1', 'abc2', 'abd3', 'b000', 'b0001']
+
+def csv_store_with_journal(data_dir):
+    store = CsvTaskStore(data_dir)
+    store.put_many(new_tasks(TASK_IDS[:3]))
+    store.compact()
+    # The rest only in the journal
+    store.put_many(new_tasks(TASK_IDS[3:]))
+    return store
+
+def new_tasks(task_ids):
+    return [{'id': task_id, 'title': f"Task {task_id}", 'state': 'O', 'note': ""} for task_id in task_ids]
+
+def filled(store_class):
+    def make_store(data_dir):
+        store = store_class(data_dir)
+        store.put_many(new_tasks(TASK_IDS))
+        return store
+    return make_store
+
+STORES = {
+    'csv': csv_store_with_journal,
+    'slots': filled(SlotTaskStore),
+    'sqlite': filled(SqliteTaskStore),
+    'memory': lambda data_dir: MemoryTaskStore(csv_store_with_journal(data_dir)),
+    'staged': lambda data_dir: StagedTaskStore(csv_store_with_journal(data_dir)),
+}
+
+@pytest.mark.parametrize('kind', STORES)
+def test_match_ids(tmp_path, kind):
+    store = STORES[kind](tmp_path)
+    assert store.match_ids('ab', 10) == ['abc1', 'abc2', 'abd3']
+    assert store.match_ids('ab', 2) == ['abc1', 'abc2']
+    assert store.match_ids('abd', 10) == ['abd3']
+    assert store.match_ids('c', 10) == []
+
+    store.delete_many(['abc2'])
+    assert store.match_ids('abc', 10) == ['abc1']
+
+@pytest.mark.parametrize('kind', STORES)
+def test_resolve_task_id(tmp_path, kind, capsys):
+    store = STORES[kind](tmp_path)
+    assert task_tracker.resolve_task_id(store, 'abd') == 'abd3'
+    # A full ID wins over the longer IDs it is a prefix of
+    assert task_tracker.resolve_task_id(store, 'b000') == 'b000'
+    assert task_tracker.resolve_task_id(store, 'zz') == 'zz'
+    assert capsys.readouterr().out == ""
+
+    assert task_tracker.resolve_task_id(store, 'abc') is None
+    assert "Error: ID prefix 'abc' is ambiguous, it matches abc1, abc2\n" == capsys.readouterr().out
+
+def test_ambiguous_candidates_are_cut_short(tmp_path, capsys):
+    store = CsvTaskStore(tmp_path)
+    store.put_many(new_tasks([f"a{number}" for number in range(task_tracker.AMBIGUOUS_ID_CANDIDATES + 2)]))
+    assert task_tracker.resolve_task_id(store, 'a') is None
+    assert capsys.readouterr().out.endswith(", a4, ...\n")
+
+def test_id_commands_take_prefixes(cli):
+    task_id = cli.create("Write report")
+    prefix = task_id[:-2]
+    assert "Write report" in cli('show', prefix)
+    cli('upd', prefix, '--title', "Write summary")
+    cli('done', prefix)
+    assert "Write summary" in cli('ls', '-c')
+    cli('rm', prefix)
+    assert "No tasks found" in cli('ls', '-a')
@@ -0,0 +1,89 @@
+"""
+Keeping the full-text search index up to date.
+"""
+
+import pytest
+from csv_store import CsvTaskStore
+from search import IndexedTaskStore, SearchIndex, match_expression
+
+def make_store(data_dir):
+    return IndexedTaskStore(CsvTaskStore(data_dir), SearchIndex(data_dir / 'search-csv.db'))
+
+def found(store, text):
+    return [task['id'] for task in store.search(text, 20)]
+
+def new_task(task_id, title, note=""):
+    return {'id': task_id, 'title': title, 'state': 'O', 'note': note}
+
+def test_match_expression():
+    assert match_expression('quarterly rep*') == '"quarterly" "rep"*'
+    assert match_expression('say "hi"') == '"say" """hi"""'
+    assert match_expression(' * ') == ''
+
+def test_index_follows_every_write(tmp_path):
+    store = make_store(tmp_path)
+    store.put_many([new_task('task1', "Quarterly report", "numbers for Ann"),
+                    new_task('task2', "Book flights")])
+    assert found(store, 'report') == ['task1']
+    assert found(store, 'ann') == ['task1']
+    assert found(store, 'quart*') == ['task1']
+    # All words must be in one task
+    assert found(store, 'report flights') == []
+
+    store.update('task2', {'title': "Book hotel"})
+    assert found(store, 'flights') == []
+    assert found(store, 'hotel') == ['task2']
+
+    store.append_notes([('task2', '2026-01-05 10:00', "near the station")])
+    assert found(store, 'station') == ['task2']
+    store.replace_notes([('task2', '2026-01-05 10:00', "near the airport")])
+    assert found(store, 'station') == []
+    assert found(store, 'airport') == ['task2']
+
+    store.move_state('task1', 'X')
+    assert found(store, 'report') == ['task1']
+
+    store.write_changes({'task1': None, 'task3': new_task('task3', "Report expenses")})
+    assert found(store, 'report') == ['task3']
+
+    store.delete_many(['task2'])
+    assert found(store, 'airport') == []
+
+def test_titles_rank_above_notes(tmp_path):
+    store = make_store(tmp_path)
+    store.put_many([new_task('task1', "Call the bank", "about the report"),
+                    new_task('task2', "Send report")])
+    assert found(store, 'report') == ['task2', 'task1']
+
+def test_index_is_built_on_first_search(tmp_path):
+    CsvTaskStore(tmp_path).put_many([new_task('task1', "Quarterly report")])
+    assert found(make_store(tmp_path), 'report') == ['task1']
+
+def test_rebuild_catches_up_with_changes_behind_the_index(tmp_path):
+    store = make_store(tmp_path)
+    store.put_many([new_task('task1', "Quarterly report")])
+    assert found(store, 'report') == ['task1']
+
+    # Written without the index, as when the files are edited by hand
+    other = CsvTaskStore(tmp_path)
+    other.put_many([new_task('task2', "Report expenses")])
+    other.update('task1', {'title': "Yearly summary"})
+    # New text is not found until the index is rebuilt
+    assert found(store, 'expenses') == []
+
+    assert store.rebuild_index() == 2
+    assert found(store, 'expenses') == ['task2']
+    assert found(store, 'quarterly') == []
+    assert found(store, 'summary') == ['task1']
+
+@pytest.mark.parametrize('backend', ['csv', 'slots', 'sqlite'])
+def test_search_command(cli, backend):
+    report = cli.create("Quarterly report", backend=backend)
+    cli.create("Book flights", backend=backend)
+    cli('--backend', backend, 'note', report, "ask Ann for the numbers")
+
+    assert report in cli('--backend', backend, 'search', 'numbers')
+    assert "No tasks found" in cli('--backend', backend, 'search', 'hotel')
+    assert "Search index rebuilt with 2 tasks." in cli('--backend', backend, 'search', '--rebuild')
+    assert report in cli('--backend', backend, 'search', 'quart*')
+    assert "Search words are required" in cli('--backend', backend, 'search')
@@ -0,0 +1,81 @@
+"""
+Monthly segments of the completed tasks.
+"""
+
+import pytest
+import csv_store
+from csv_store import CsvTaskStore
+from query import TaskQuery
+from segments import segment_path
+
+MONTHS = ['2026-01', '2026-02', '2026-03']
+
+@pytest.fixture
+def month(monkeypatch):
+    """The current month, as seen by the CSV store; a list to change it."""
+    month = [MONTHS[0]]
+    monkeypatch.setattr(csv_store, 'current_month', lambda: month[0])
+    return month
+
+def completed_by_month(data_dir, month):
+    """Return a store with two tasks completed in each of MONTHS, compacted monthly."""
+    store = CsvTaskStore(data_dir)
+    store.put_many([{'id': 'open', 'title': "Open", 'state': 'O', 'note': ""}])
+    for month[0] in MONTHS:
+        store.put_many([{'id': f"{month[0]}-{number}", 'title': "Task", 'state': 'X', 'note': ""}
+                        for number in range(2)])
+        assert store.compact()
+    return store
+
+def completed_ids(store, **query):
+    return [task['id'] for task in store.select('X', TaskQuery(**query))]
+
+def test_tasks_go_to_the_segment_of_their_month(tmp_path, month):
+    store = completed_by_month(tmp_path, month)
+    assert [segment_month for segment_month, _ in store.manifest.segments()] == [None] + MONTHS
+    for segment_month in MONTHS:
+        assert f"{segment_month}-0".encode() in segment_path(tmp_path, segment_month).read_bytes()
+    assert [task['id'] for task in store.iterate('X')] == [f"{month}-{number}" for month in MONTHS for number in range(2)]
+
+def test_completed_range_reads_only_its_segments(tmp_path, month, monkeypatch):
+    store = completed_by_month(tmp_path, month)
+    opened = []
+    open_csv = csv_store.open_csv
+    monkeypatch.setattr(csv_store, 'open_csv', lambda path: opened.append(path.name) or open_csv(path))
+
+    assert completed_ids(store, completed_since='2026-02') == ['2026-02-0', '2026-02-1', '2026-03-0', '2026-03-1']
+    assert opened == ['completed-2026-02.csv', 'completed-2026-03.csv']
+    assert completed_ids(store, completed_until='2026-01') == ['2026-01-0', '2026-01-1']
+    assert completed_ids(store, completed_since='2026-02', completed_until='2026-02') == ['2026-02-0', '2026-02-1']
+    assert completed_ids(store, completed_since='2026-04') == []
+    # Filters combine with the month range
+    assert completed_ids(store, completed_since='2026-02', id_prefix='2026-03-1') == ['2026-03-1']
+
+def test_journal_moves_tasks_between_months(tmp_path, month):
+    store = completed_by_month(tmp_path, month)
+    # Reopened and completed again in March, the task leaves January
+    store.move_state('2026-01-0', 'O')
+    store.move_state('2026-01-0', 'X')
+    store.delete_many(['2026-02-1'])
+    expected = ['2026-02-0', '2026-03-0', '2026-03-1', '2026-01-0']
+    assert completed_ids(store, completed_since='2026-02') == expected
+    assert completed_ids(store, completed_until='2026-01') == ['2026-01-1']
+
+    assert store.compact()
+    assert completed_ids(store, completed_since='2026-02') == expected
+    assert completed_ids(store, completed_until='2026-01') == ['2026-01-1']
+
+def test_sealed_segments_are_left_alone(tmp_path, month):
+    store = completed_by_month(tmp_path, month)
+    sealed = {month: segment_path(tmp_path, month).stat().st_ino for month in MONTHS[:2]}
+    store.put_many([{'id': '2026-03-2', 'title': "Task", 'state': 'X', 'note': ""}])
+    store.move_state('open', 'X')
+    assert store.compact()
+    assert {month: segment_path(tmp_path, month).stat().st_ino for month in MONTHS[:2]} == sealed
+
+def test_completed_since_option(cli):
+    task_id = cli.create("Write report")
+    cli('done', task_id)
+    assert task_id in cli('ls', '-c', '-f', 'plain', '--completed-since', '2020-01')
+    assert "No tasks found" in cli('ls', '-c', '-f', 'plain', '--completed-until', '2020-01')
+    assert "Invalid month" in cli('ls', '-c', '--completed-since', 'January', status=2)
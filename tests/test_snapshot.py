@@ -0,0 +1,87 @@
+"""
+Reading CSV files through their columnar snapshots.
+"""
+
+import os
+import pytest
+import snapshot
+from snapshot import CsvRows, Snapshot, SnapshotWriter, StaleSnapshotError, open_rows, snapshot_path
+from csv_store import CsvTaskStore, write_tasks
+from data import TASK_FIELDS
+
+TASKS = [
+    {'id': 'task1', 'title': "Plain", 'state': 'O', 'note': ""},
+    {'id': 'task2', 'title': "Accents é and ü", 'state': 'X', 'note': "two\nlines"},
+    {'id': 'task3', 'title': "Has a \0 NUL", 'state': 'O', 'note': "\0"},
+    {'id': 'task4', 'title': "", 'state': 'O', 'note': "Last"},
+]
+
+def write_snapshot(csv_path, tasks):
+    """Write a CSV file and its snapshot."""
+    with open(snapshot_path(csv_path), 'wb') as file:
+        writer = SnapshotWriter(file)
+        write_tasks(csv_path, list(writer.record(tasks)))
+        writer.finish(csv_path)
+
+@pytest.mark.parametrize('block_rows', [1, 3, 4096])
+def test_snapshot_round_trip(tmp_path, monkeypatch, block_rows):
+    monkeypatch.setattr(snapshot, 'SNAPSHOT_BLOCK_ROWS', block_rows)
+    csv_path = tmp_path / 'tasks.csv'
+    write_snapshot(csv_path, TASKS)
+    with Snapshot(csv_path) as tasks:
+        assert len(tasks) == len(TASKS)
+        assert list(tasks) == TASKS
+
+def test_stale_snapshots_are_refused(tmp_path):
+    csv_path = tmp_path / 'tasks.csv'
+    with pytest.raises(StaleSnapshotError):
+        Snapshot(csv_path)
+    write_tasks(csv_path, TASKS[:1])
+    with pytest.raises(StaleSnapshotError):
+        Snapshot(csv_path)
+
+    write_snapshot(csv_path, TASKS[:1])
+    with open(csv_path, 'a') as file:
+        file.write("task9,Appended,O,\r\n")
+    with pytest.raises(StaleSnapshotError):
+        Snapshot(csv_path)
+
+    write_snapshot(csv_path, TASKS[:1])
+    data = snapshot_path(csv_path).read_bytes()
+    snapshot_path(csv_path).write_bytes(data[:-1])
+    with pytest.raises(StaleSnapshotError):
+        Snapshot(csv_path)
+    snapshot_path(csv_path).write_bytes(b'TTSNP0\n\0' + data[8:])
+    with pytest.raises(StaleSnapshotError):
+        Snapshot(csv_path)
+
+def test_store_falls_back_to_the_csv_file(tmp_path):
+    store = CsvTaskStore(tmp_path)
+    store.put_many([dict(task, state='O') for task in TASKS if '\0' not in task['title']])
+    assert store.compact()
+    with open_rows(store.active_file) as tasks:
+        assert isinstance(tasks, Snapshot)
+
+    # Edited by hand, then accepted
+    data = store.active_file.read_bytes()
+    store.active_file.write_bytes(data.replace(b"Plain", b"Edited"))
+    store.accept_files()
+    with open_rows(store.active_file) as tasks:
+        assert isinstance(tasks, CsvRows)
+        assert [task['title'] for task in tasks] == ["Edited", "Accents é and ü", ""]
+    assert [task['title'] for task in store.iterate('O')] == ["Edited", "Accents é and ü", ""]
+
+    # Compaction writes a fresh snapshot
+    store.put_many([{'id': 'task5', 'title': "New", 'state': 'O', 'note': ""}])
+    assert store.compact()
+    with open_rows(store.active_file) as tasks:
+        assert isinstance(tasks, Snapshot)
+        assert [task['title'] for task in tasks] == ["Edited", "Accents é and ü", "", "New"]
+
+def test_deleted_snapshot_is_not_needed(tmp_path):
+    store = CsvTaskStore(tmp_path)
+    store.put_many(TASKS[:2])
+    assert store.compact()
+    os.remove(snapshot_path(store.active_file))
+    assert [task['id'] for task in store.iterate('O')] == ['task1']
+    assert set(store.get('task2')) == set(TASK_FIELDS)
@@ -0,0 +1,76 @@
+"""
+The CSV, slotted and SQLite backends give the same results for the same writes.
+"""
+
+import random
+import pytest
+from csv_store import CsvTaskStore
+from slot_store import SlotTaskStore
+from sqlite_store import SqliteTaskStore
+from query import TaskQuery
+
+BACKENDS = [CsvTaskStore, SlotTaskStore, SqliteTaskStore]
+
+QUERIES = [
+    TaskQuery(title='7'),
+    TaskQuery(note='hello'),
+    TaskQuery(id_prefix='task01'),
+    TaskQuery(title='1', note='added'),
+    TaskQuery(since='2024-01-02 00:00', until='2024-01-02 23:59'),
+]
+
+def new_task(number: int) -> dict:
+    return {'id': f"task{number:03d}", 'title': f"Title {number}", 'state': 'O',
+            'note': "hello" if number % 5 == 0 else ""}
+
+def apply_writes(store, seed: int) -> None:
+    """Apply the same random writes, with compactions in between, to a store."""
+    rng = random.Random(seed)
+    created = []
+    for step in range(300):
+        operation = rng.random()
+        if operation < 0.3 or not created:
+            tasks = [new_task(len(created) + number) for number in range(rng.randint(1, 5))]
+            created += [task['id'] for task in tasks]
+            store.put_many(tasks)
+        elif operation < 0.45:
+            store.update(rng.choice(created), {'title': f"Renamed {step}"})
+        elif operation < 0.6:
+            task_id = rng.choice(created)
+            store.append_notes([(task_id, f"2024-01-0{rng.randint(1, 3)} 10:00", f"added {step}")])
+        elif operation < 0.8:
+            store.move_state(rng.choice(created), rng.choice('OX'))
+        elif operation < 0.95:
+            store.delete_many(rng.sample(created, min(3, len(created))))
+        else:
+            assert store.compact()
+
+def observe(store) -> dict:
+    """Return everything the read methods of a store report."""
+    task_ids = sorted({task['id'] for state in 'OX' for task in store.iterate(state)})
+    return {
+        'iterate': {state: list(store.iterate(state)) for state in 'OX'},
+        'get': {task_id: store.get(task_id) for task_id in task_ids + ['missing']},
+        'notes': {task_id: list(store.notes(task_id)) for task_id in task_ids},
+        'match_ids': store.match_ids('task0', 1000),
+        'select': [list(store.select(state, query)) for state in 'OX' for query in QUERIES],
+        'page': [list(store.page(state, 3, 10)) for state in 'OX']
+                + [list(store.page(state, 0, 5, after=task_ids[len(task_ids) // 2])) for state in 'OX'],
+    }
+
+@pytest.mark.parametrize('seed', [1, 2, 3])
+def test_backends_agree(tmp_path, seed):
+    results = []
+    for backend in BACKENDS:
+        data_dir = tmp_path / backend.__name__
+        data_dir.mkdir()
+        store = backend(data_dir)
+        try:
+            apply_writes(store, seed)
+            results.append(observe(store))
+        finally:
+            store.close()
+
+    for backend, result in zip(BACKENDS[1:], results[1:]):
+        for key in result:
+            assert result[key] == results[0][key], f"{backend.__name__} differs from CsvTaskStore in {key}"
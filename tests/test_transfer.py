@@ -0,0 +1,106 @@
+"""
+Importing and exporting tasks.
+"""
+
+import io
+import json
+import pytest
+import transfer
+from csv_store import CsvTaskStore
+
+def read_jsonl(cli, tmp_path, backend='csv'):
+    """Export the tasks of a backend as JSON lines and return the records."""
+    export_file = tmp_path / f"{backend}.jsonl"
+    cli('--backend', backend, 'export', str(export_file))
+    return [json.loads(line) for line in export_file.read_text(encoding='utf-8').splitlines()]
+
+def test_csv_export_keeps_note_history(cli, tmp_path):
+    task_id = cli.create("Buy groceries", '--note', "Need milk")
+    cli('note', task_id, "Don't forget bread")
+    export_file = str(tmp_path / 'tasks.csv')
+    cli('export', export_file)
+
+    cli('--backend', 'sqlite', 'import', export_file)
+    imported = read_jsonl(cli, tmp_path, 'sqlite')
+    assert imported[0]['note'].startswith("Need milk\n[")
+    assert imported[0]['note'].endswith("] Don't forget bread")
+    assert task_id in cli('--backend', 'sqlite', 'ls', '--note', 'bread', '--format', 'plain')
+    assert task_id in cli('--backend', 'sqlite', 'ls', '--since', '2000-01-01', '--format', 'plain')
+
+def test_import_checks_new_ids_against_store(tmp_path, monkeypatch):
+    store = CsvTaskStore(tmp_path)
+    store.put_many([{'id': 'taken1', 'title': "Existing", 'state': 'O', 'note': ""}])
+    # The first two IDs generated are in use, by the store and by the chunk
+    generated = iter(['taken1', 'fresh1', 'fresh1', 'fresh2'])
+    monkeypatch.setattr(transfer, 'new_id', lambda: next(generated))
+
+    records = io.StringIO('{"title": "First"}\n{"title": "Second"}\n')
+    assert transfer.import_tasks(store, records, 'jsonl') == (2, 0, 0)
+    assert store.get('taken1')['title'] == "Existing"
+    assert store.get('fresh1')['title'] == "First"
+    assert store.get('fresh2')['title'] == "Second"
+
+def test_import_counts_duplicates_across_chunks(tmp_path):
+    store = CsvTaskStore(tmp_path)
+    lines = ['{"id": "dup1", "title": "First"}', '{"id": "other", "title": "Other"}',
+             '{"id": "dup1", "title": "Second"}', '{"id": "bad", "state": "Q", "title": "Bad"}']
+    records = io.StringIO("\n".join(lines) + "\n")
+    assert transfer.import_tasks(store, records, 'jsonl', chunk_size=2) == (2, 1, 1)
+    assert store.get('dup1')['title'] == "Second"
+    assert store.get('bad') is None
+
+@pytest.mark.parametrize('line, error', [
+    ('{"title": "Task", "state": "Q"}', "state must be O or X, not 'Q'"),
+    ('{"title": " "}', "title is required"),
+    ('{"title": "Task", "due": "today"}', "unknown fields due"),
+    ('{"title": 7}', "'title' must be a string"),
+    ('["Task"]', "expected an object"),
+    ('{"title": "Task"', "invalid JSON"),
+    ('{"title": "Task", "notes": [["yesterday", "text"]]}', "Invalid timestamp 'yesterday'"),
+    ('{"title": "Task", "notes": ["text"]}', "'notes' must be a list of [time, text] pairs"),
+    ('{"id": "' + 'x' * 100 + '", "title": "Task"}', "invalid ID"),
+])
+def test_import_rejects_invalid_records(tmp_path, capsys, line, error):
+    store = CsvTaskStore(tmp_path)
+    records = io.StringIO('{"id": "good", "title": "Good"}\n\n' + line + '\n')
+    assert transfer.import_tasks(store, records, 'jsonl') == (1, 0, 1)
+    assert capsys.readouterr().out.startswith(f"Error: line 3: {error}")
+    assert [task['id'] for task in store.iterate('O')] == ['good']
+
+def test_import_reports_the_first_rejected_records(tmp_path, capsys):
+    records = io.StringIO('{"state": "Q"}\n' * (transfer.MAX_REPORTED_ERRORS + 3))
+    assert transfer.import_tasks(CsvTaskStore(tmp_path), records, 'jsonl') == (0, 0, 23)
+    output = capsys.readouterr().out.splitlines()
+    assert len(output) == transfer.MAX_REPORTED_ERRORS + 1
+    assert output[-1] == "Error: 3 more records rejected"
+
+def test_csv_import_rejects_extra_values(tmp_path, capsys):
+    records = io.StringIO('id,title,state,note\nt1,Task,O,,surplus\nt2,Task,X,\n')
+    assert transfer.import_tasks(CsvTaskStore(tmp_path), records, 'csv') == (1, 0, 1)
+    assert "Error: line 2: more values than header columns" in capsys.readouterr().out
+
+@pytest.mark.parametrize('backend', ['slots', 'sqlite'])
+def test_jsonl_round_trip(cli, tmp_path, backend):
+    report = cli.create("Quarterly report", '--note', "for the board")
+    lunch = cli.create("Lunch, with \"quotes\"")
+    cli('note', report, "ask Ann")
+    cli('note', report, "ask Bob")
+    cli('done', lunch)
+    exported = read_jsonl(cli, tmp_path)
+    assert [record['id'] for record in exported] == [report, lunch]
+    assert [text for _, text in exported[0]['notes']] == ["ask Ann", "ask Bob"]
+
+    cli('--backend', backend, 'import', str(tmp_path / 'csv.jsonl'))
+    assert read_jsonl(cli, tmp_path, backend) == exported
+    # Importing again replaces the tasks and their note histories
+    assert "Imported 2 tasks" in cli('--backend', backend, 'import', str(tmp_path / 'csv.jsonl'))
+    assert read_jsonl(cli, tmp_path, backend) == exported
+
+def test_import_from_stdin(cli):
+    output = cli('import', '--format', 'csv', input="id,title,state,note\nt1,From stdin,O,\n")
+    assert "Imported 1 tasks" in output
+    assert "From stdin" in cli('show', 't1')
+
+def test_transfer_errors_exit_non_zero(cli, tmp_path):
+    assert "Error:" in cli('import', str(tmp_path / 'missing.jsonl'), status=1)
+    assert "Error:" in cli('export', str(tmp_path / 'missing' / 'tasks.jsonl'), status=1)
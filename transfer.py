@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+bulk import and export of tasks
+
+Tasks are exported as CSV with the TASK_FIELDS columns, or as JSON lines
+with one task per line and its note history:
+
+    {"id": "...", "title": "...", "state": "O", "note": "...", "notes": [["YYYY-MM-DD HH:MM", "..."]]}
+
+CSV has no column for the note history, so its entries are appended to the
+note as '[YYYY-MM-DD HH:MM] text' lines, the way notes were kept before note
+histories existed. An imported CSV file keeps them as part of the note,
+where --note, --since and --until still find them.
+
+Both directions stream: an export writes tasks as the store yields them, and
+an import reads, validates and writes CHUNK_SIZE records at a time, so
+memory use only grows by the set of IDs imported, which tells a record
+repeating an ID from an earlier chunk. Each chunk is written
+with a single put_many, inside one bulk load of the store.
+
+Imported tasks replace stored tasks with the same ID, along with their note
+history if the record has one, and when an ID occurs more than once in the
+input the last record wins. Records without an ID get a new one, checked
+against the store and the chunk like the IDs of create_task.
+"""
+
+import csv
+import json
+from itertools import islice
+from typing import Any, Container, Dict, Iterable, Iterator, List, Optional, Set, TextIO, Tuple
+from data import TASK_FIELDS
+from store import TaskStore
+from ids import new_id
+from index import ID_WIDTH
+from query import parse_timestamp
+
+TRANSFER_FORMATS = ('csv', 'jsonl')
+
+# Records read, validated and written at a time by an import
+CHUNK_SIZE = 10000
+
+TASK_STATES = ('O', 'X')
+
+# Rejected records reported one by one; the rest are only counted
+MAX_REPORTED_ERRORS = 20
+
+# Field of JSON lines records holding the note history
+NOTES_FIELD = 'notes'
+
+class InvalidRecord(ValueError):
+    """An input record that cannot be imported."""
+
+# An imported record: (line number, task, note history entries)
+ImportRecord = Tuple[int, Dict[str, str], List[Tuple[str, str]]]
+
+def detect_format(file_name: str, requested: Optional[str] = None) -> str:
+    """Return the format of a file: the requested one, else csv for .csv files, else jsonl."""
+    if requested is not None:
+        return requested
+    return 'csv' if file_name.lower().endswith('.csv') else 'jsonl'
+
+def validate_notes(value: Any) -> List[Tuple[str, str]]:
+    """Check the note history of a JSON lines record and return its entries."""
+    if not isinstance(value, list):
+        raise InvalidRecord(f"'{NOTES_FIELD}' must be a list of [time, text] pairs")
+    entries = []
+    for entry in value:
+        if (not isinstance(entry, list) or len(entry) != 2
+                or not all(isinstance(part, str) for part in entry)):
+            raise InvalidRecord(f"'{NOTES_FIELD}' must be a list of [time, text] pairs")
+        try:
+            time = parse_timestamp(entry[0])
+        except ValueError as e:
+            raise InvalidRecord(str(e))
+        entries.append((time, entry[1]))
+    # Note logs are kept in time order
+    entries.sort(key=lambda entry: entry[0])
+    return entries
+
+def validate_task(record: Any) -> Tuple[Dict[str, str], List[Tuple[str, str]]]:
+    """Check an input record against TASK_FIELDS and return the task and its note history."""
+    if not isinstance(record, dict):
+        raise InvalidRecord("expected an object with the fields " + ", ".join(TASK_FIELDS))
+    unknown = [field for field in record if field not in TASK_FIELDS and field != NOTES_FIELD]
+    if unknown:
+        raise InvalidRecord("unknown fields " + ", ".join(map(str, unknown)))
+
+    task = {}
+    for field in TASK_FIELDS:
+        value = record.get(field)
+        if value is None:
+            value = ''
+        if not isinstance(value, str):
+            raise InvalidRecord(f"'{field}' must be a string")
+        task[field] = value
+
+    if not task['title'].strip():
+        raise InvalidRecord("title is required")
+    task['state'] = task['state'] or 'O'
+    if task['state'] not in TASK_STATES:
+        raise InvalidRecord(f"state must be O or X, not '{task['state']}'")
+    # Records without an ID are given one when their chunk is written
+    if task['id'] and (len(task['id'].encode('utf-8')) > ID_WIDTH or '\0' in task['id']):
+        raise InvalidRecord(f"invalid ID '{task['id']}'")
+
+    notes = validate_notes(record[NOTES_FIELD]) if record.get(NOTES_FIELD) is not None else []
+    return task, notes
+
+def read_jsonl(file: TextIO) -> Iterator[Tuple[int, Any]]:
+    """Yield the (line number, parsed record) of each non-blank JSON line."""
+    for line_number, line in enumerate(file, 1):
+        if not line.strip():
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except ValueError as e:
+            yield line_number, InvalidRecord(f"invalid JSON: {e}")
+
+def read_csv(file: TextIO) -> Iterator[Tuple[int, Any]]:
+    """Yield the (line number, record) of each CSV row, the first row being the header."""
+    reader = csv.DictReader(file)
+    for record in reader:
+        # Rows with more values than the header have them under the None key
+        if None in record:
+            yield reader.line_num, InvalidRecord("more values than header columns")
+        else:
+            yield reader.line_num, record
+
+def read_tasks(file: TextIO, file_format: str) -> Iterator[Tuple[int, Any]]:
+    """Yield (line number, (task, notes) or InvalidRecord) for each input record."""
+    records = read_csv(file) if file_format == 'csv' else read_jsonl(file)
+    for line_number, record in records:
+        if isinstance(record, InvalidRecord):
+            yield line_number, record
+            continue
+        try:
+            yield line_number, validate_task(record)
+        except InvalidRecord as e:
+            yield line_number, e
+
+def unused_id(store: TaskStore, taken: Container[str]) -> str:
+    """Return a new task ID that is neither in the store nor in `taken`."""
+    task_id = new_id()
+    while task_id in taken or store.get(task_id) is not None:
+        task_id = new_id()
+    return task_id
+
+def import_chunk(store: TaskStore, records: Iterable[ImportRecord], seen: Set[str]) -> Tuple[int, int]:
+    """Write a chunk of records with one put_many and return (tasks written,
+    duplicates dropped), given the IDs `seen` in earlier chunks, which it adds to.
+
+    Call it in a transaction, so that the new IDs stay unused until they are written.
+    """
+    # The last record with an ID wins; dicts keep the order of first insertion
+    chunk = {}
+    duplicates = 0
+    for record in records:
+        if not record[1]['id']:
+            record[1]['id'] = unused_id(store, chunk)
+        elif record[1]['id'] in chunk or record[1]['id'] in seen:
+            duplicates += 1
+        chunk[record[1]['id']] = record
+
+    store.put_many([task for _, task, _ in chunk.values()])
+    entries = [(task['id'], time, text) for _, task, notes in chunk.values() for time, text in notes]
+    if entries:
+        store.replace_notes(entries)
+    written = sum(1 for task_id in chunk if task_id not in seen)
+    seen.update(chunk)
+    return written, duplicates
+
+def chunks(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    """Split an iterable into lists of at most `size` items without reading ahead."""
+    iterator = iter(items)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def import_tasks(store: TaskStore, file: TextIO, file_format: str,
+                 chunk_size: int = CHUNK_SIZE) -> Tuple[int, int, int]:
+    """Import tasks from a file chunk by chunk, printing why records are rejected.
+
+    Returns (tasks written, duplicates dropped, records rejected).
+    """
+    written = duplicates = rejected = 0
+    seen = set()
+    with store.bulk_load():
+        for chunk in chunks(read_tasks(file, file_format), chunk_size):
+            valid = []
+            for line_number, result in chunk:
+                if isinstance(result, InvalidRecord):
+                    rejected += 1
+                    if rejected <= MAX_REPORTED_ERRORS:
+                        print(f"Error: line {line_number}: {result}")
+                else:
+                    valid.append((line_number,) + result)
+            if valid:
+                chunk_written, chunk_duplicates = import_chunk(store, valid, seen)
+                written += chunk_written
+                duplicates += chunk_duplicates
+
+    if rejected > MAX_REPORTED_ERRORS:
+        print(f"Error: {rejected - MAX_REPORTED_ERRORS} more records rejected")
+    return written, duplicates, rejected
+
+def fold_notes(note: str, entries: Iterable[Tuple[str, str]]) -> str:
+    """Return a task's note followed by a '[time] text' line for each note history entry."""
+    lines = [note.strip()] if note.strip() else []
+    lines += [f"[{time}] {text}" for time, text in entries]
+    return "\n".join(lines)
+
+def export_tasks(store: TaskStore, file: TextIO, file_format: str) -> int:
+    """Write every task, open tasks first, to a file and return how many were written."""
+    count = 0
+    if file_format == 'csv':
+        writer = csv.DictWriter(file, fieldnames=TASK_FIELDS)
+        writer.writeheader()
+    for state in TASK_STATES:
+        for task in store.iterate(state):
+            if file_format == 'csv':
+                writer.writerow(dict(task, note=fold_notes(task['note'], store.notes(task['id']))))
+            else:
+                record = {field: task[field] for field in TASK_FIELDS}
+                notes = [list(entry) for entry in store.notes(task['id'])]
+                if notes:
+                    record[NOTES_FIELD] = notes
+                file.write(json.dumps(record, ensure_ascii=False) + '\n')
+            count += 1
+    return count
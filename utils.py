@@ -3,33 +3,109 @@
 utils for the main script
 """
 
-from typing import Dict, List, Any
-from tabulate import tabulate
+from typing import Dict, Iterable, List, Any
 from data import TASK_FIELDS
 
+def task_row(task: Dict[str, str]) -> List[str]:
+    """Return the display values of a task."""
+    # Truncate note if it's too long for display; short hand-edited CSV rows read as None
+    note = task['note'] or ''
+    if len(note) > 40:  # Limit note length in table view
+        note = note[:37] + "..."
+
+    return [
+        task['id'],
+        task['title'] or '',
+        'Open' if task['state'] == 'O' else 'Completed',
+        note
+    ]
+
 def display_tasks(tasks: List[Dict[str, str]]) -> None:
     """Display tasks in a tabular format."""
     if not tasks:
         print("No tasks found.")
         return
 
-    table_data = []
+    # Imported here so commands forwarded to the daemon never load it
+    from tabulate import tabulate
+
+    table_data = [task_row(task) for task in tasks]
+
+    # Print table with headers
+    print("\n" + tabulate(
+        table_data,
+        headers=TASK_FIELDS,
+        tablefmt='grid'
+    ))
+
+def display_tasks_plain(tasks: Iterable[Dict[str, str]]) -> None:
+    """Display tasks as tab-separated lines, printing each as soon as it is read."""
+    count = 0
     for task in tasks:
-        # Truncate note if it's too long for display
-        note = task['note']
-        if len(note) > 40:  # Limit note length in table view
-            note = note[:37] + "..."
-        
+        if count == 0:
+            print("\t".join(TASK_FIELDS))
+        # Keep one task per line
+        print("\t".join(value.replace("\n", " ") for value in task_row(task)))
+        count += 1
+
+    if count == 0:
+        print("No tasks found.")
+
+def display_lock_stats(stats: List[Dict[str, Any]]) -> None:
+    """Display lock contention stats in a tabular format."""
+    if not stats:
+        print("No lock contention recorded.")
+        return
+
+    from tabulate import tabulate
+
+    table_data = []
+    for entry in stats:
+        waits = entry['contended'] + entry['timeouts']
         table_data.append([
-            task['id'],
-            task['title'],
-            'Open' if task['state'] == 'O' else 'Completed',
-            note
+            entry['lock'],
+            entry['mode'],
+            entry['contended'],
+            entry['timeouts'],
+            f"{entry['total_wait_ms'] / waits:.1f}",
+            f"{entry['max_wait_ms']:.1f}"
         ])
-    
-    # Print table with headers
+
     print("\n" + tabulate(
         table_data,
-        headers=TASK_FIELDS,
+        headers=['lock', 'mode', 'contended', 'timeouts', 'avg wait ms', 'max wait ms'],
+        tablefmt='grid'
+    ))
+
+def format_size(size: int) -> str:
+    """Format a byte count for display."""
+    for unit in ('B', 'KB', 'MB'):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+def display_segment_stats(stats: List[Dict[str, Any]]) -> None:
+    """Display the size of each completed segment as CSV text and on disk, with the total savings."""
+    from tabulate import tabulate
+
+    table_data = []
+    for entry in stats:
+        saved = 1 - entry['stored_bytes'] / entry['text_bytes'] if entry['text_bytes'] else 0
+        table_data.append([
+            entry['file'],
+            entry['codec'] or '-',
+            format_size(entry['text_bytes']),
+            format_size(entry['stored_bytes']),
+            f"{saved:.0%}"
+        ])
+
+    print("\n" + tabulate(
+        table_data,
+        headers=['segment', 'codec', 'csv size', 'on disk', 'saved'],
         tablefmt='grid'
-    ))
\ No newline at end of file
+    ))
+    text_bytes = sum(entry['text_bytes'] for entry in stats)
+    stored_bytes = sum(entry['stored_bytes'] for entry in stats)
+    print(f"Completed tasks take {format_size(stored_bytes)} on disk and to read in full, "
+          f"against {format_size(text_bytes)} as plain CSV.")